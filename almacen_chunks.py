@@ -0,0 +1,295 @@
+"""
+ALMACÉN DE TERRENO POR CHUNKS - ECUADOR
+Re-empaqueta el mosaico de archivos .hgt en bloques fijos comprimidos con zlib.
+
+💡 CARACTERÍSTICAS:
+- Bloques (chunks) cuadrados de tamaño fijo, comprimidos por separado
+- Índice con mínimo, máximo, mínimo positivo y celdas sin datos de cada chunk
+- Lector con la misma interfaz de indexado que la matriz de terreno
+  (rebanadas y pares de arreglos de índices)
+- Los chunks vacíos o constantes se resuelven con el índice, sin descomprimir
+- Estadísticas de región que solo descomprimen los chunks del borde necesarios
+
+📁 FORMATO (una carpeta):
+- datos.bin: chunks comprimidos uno tras otro (int16 nativo antes de comprimir)
+- indice.npz: forma, tamaño de chunk, desplazamientos, longitudes, estadísticas
+  y metadatos (latitudes/longitudes del mosaico) en JSON
+"""
+
+import os
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from mosaico_terreno import NODATA, CacheTeselas, ruta_temporal
+
+MAX_INT16 = np.iinfo(np.int16).max
+
+
+def estadisticas_bloque(bloque):
+    """(mínimo, máximo, mínimo positivo, celdas sin datos) de un bloque int16."""
+    validos = bloque[bloque != NODATA]
+    sin_datos = bloque.size - validos.size
+    if validos.size == 0:
+        return NODATA, NODATA, MAX_INT16, sin_datos
+    positivos = validos[validos > 0]
+    minimo_positivo = positivos.min() if positivos.size else MAX_INT16
+    return validos.min(), validos.max(), minimo_positivo, sin_datos
+
+
+def convertir_a_chunks(matriz, carpeta_salida, tam_chunk=256, nivel=1, metadatos=None, hilos=None):
+    """
+    Convierte una matriz de terreno en un almacén comprimido por chunks.
+
+    Args:
+        matriz: Matriz int16 (o MosaicoTerreno) con el terreno unido.
+        carpeta_salida: Carpeta donde se escriben datos.bin e indice.npz.
+        tam_chunk: Lado de cada chunk en celdas.
+        nivel: Nivel de compresión zlib (1-9).
+        metadatos: Diccionario serializable que se guarda con el índice.
+        hilos: Hilos de compresión (zlib libera el GIL).
+    """
+    os.makedirs(carpeta_salida, exist_ok=True)
+    filas, columnas = (int(n) for n in matriz.shape)
+    n_i = -(-filas // tam_chunk)
+    n_j = -(-columnas // tam_chunk)
+
+    offsets = np.zeros((n_i, n_j), dtype=np.int64)
+    longitudes = np.zeros((n_i, n_j), dtype=np.int64)
+    minimo = np.zeros((n_i, n_j), dtype=np.int16)
+    maximo = np.zeros((n_i, n_j), dtype=np.int16)
+    minimo_positivo = np.zeros((n_i, n_j), dtype=np.int16)
+    sin_datos = np.zeros((n_i, n_j), dtype=np.int32)
+
+    def comprimir(bloque):
+        bloque = np.ascontiguousarray(bloque, dtype=np.int16)
+        return zlib.compress(bloque.tobytes(), nivel), estadisticas_bloque(bloque)
+
+    posicion = 0
+    ruta_datos = os.path.join(carpeta_salida, 'datos.bin')
+    ruta_indice = os.path.join(carpeta_salida, 'indice.npz')
+    # Temporales propios de este proceso: dos conversiones simultáneas no se mezclan
+    temporal_datos, temporal_indice = ruta_temporal(ruta_datos), ruta_temporal(ruta_indice)
+    try:
+        with open(temporal_datos, 'wb') as f, \
+                ThreadPoolExecutor(max_workers=hilos or min(8, os.cpu_count() or 1)) as pool:
+            for ci in range(n_i):
+                franja = np.asarray(matriz[ci * tam_chunk:(ci + 1) * tam_chunk, :])
+                bloques = [franja[:, cj * tam_chunk:(cj + 1) * tam_chunk] for cj in range(n_j)]
+                for cj, (comprimido, estadisticas) in enumerate(pool.map(comprimir, bloques)):
+                    f.write(comprimido)
+                    offsets[ci, cj] = posicion
+                    longitudes[ci, cj] = len(comprimido)
+                    minimo[ci, cj], maximo[ci, cj], minimo_positivo[ci, cj], sin_datos[ci, cj] = estadisticas
+                    posicion += len(comprimido)
+
+        with open(temporal_indice, 'wb') as f:
+            np.savez(f, forma=np.array([filas, columnas]), tam_chunk=np.array(tam_chunk),
+                     offsets=offsets, longitudes=longitudes, minimo=minimo, maximo=maximo,
+                     minimo_positivo=minimo_positivo, sin_datos=sin_datos,
+                     metadatos=np.array(json.dumps(metadatos or {})))
+        os.replace(temporal_datos, ruta_datos)
+        os.replace(temporal_indice, ruta_indice)
+    finally:
+        for temporal in (temporal_datos, temporal_indice):
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+
+class AlmacenChunks:
+    """
+    Lector de un almacén por chunks con la interfaz de la matriz de terreno.
+
+    Admite indexado básico (enteros y rebanadas), como las ventanas que piden
+    calcular_horizonte y la vista 3D, y pares de arreglos de índices
+    (matriz[i, j]), como las muestras sueltas de la pirámide o las líneas de
+    vista. Los chunks descomprimidos se guardan en un caché LRU limitado por
+    memoria.
+    """
+
+    def __init__(self, carpeta, memoria_bytes=128 * 1024 ** 2, hilos=None):
+        self.carpeta = carpeta
+        with np.load(os.path.join(carpeta, 'indice.npz')) as indice:
+            self.shape = tuple(int(n) for n in indice['forma'])
+            self.tam_chunk = int(indice['tam_chunk'])
+            self.offsets = indice['offsets']
+            self.longitudes = indice['longitudes']
+            self.minimo = indice['minimo']
+            self.maximo = indice['maximo']
+            self.minimo_positivo = indice['minimo_positivo']
+            self.sin_datos = indice['sin_datos']
+            self.metadatos = json.loads(str(indice['metadatos']))
+        self.dtype = np.dtype(np.int16)
+        self.ndim = 2
+        self._datos = np.memmap(os.path.join(carpeta, 'datos.bin'), dtype=np.uint8, mode='r')
+        self.cache = CacheTeselas(memoria_bytes, hilos=hilos, cargar=self._descomprimir)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        datos = self[:, :]
+        return datos if dtype is None else datos.astype(dtype)
+
+    def forma_chunk(self, ci, cj):
+        """Forma real del chunk (ci, cj); los del borde pueden ser menores."""
+        t = self.tam_chunk
+        return (min(t, self.shape[0] - ci * t), min(t, self.shape[1] - cj * t))
+
+    def _descomprimir(self, clave):
+        ci, cj = clave
+        inicio = self.offsets[ci, cj]
+        comprimido = self._datos[inicio:inicio + self.longitudes[ci, cj]]
+        datos = np.frombuffer(zlib.decompress(comprimido), dtype=np.int16)
+        return datos.reshape(self.forma_chunk(ci, cj))
+
+    def _es_constante(self, ci, cj):
+        """True si el chunk es todo sin datos o tiene un único valor."""
+        total = self.forma_chunk(ci, cj)
+        total = total[0] * total[1]
+        return (self.sin_datos[ci, cj] == total or
+                (self.sin_datos[ci, cj] == 0 and self.minimo[ci, cj] == self.maximo[ci, cj]))
+
+    def chunks(self, claves):
+        """
+        Devuelve {(ci, cj): chunk} descomprimiendo en paralelo solo los que no
+        pueden resolverse con el índice (vacíos o de valor constante).
+        """
+        resultado = {}
+        pendientes = []
+        for ci, cj in claves:
+            if self._es_constante(ci, cj):
+                valor = NODATA if self.sin_datos[ci, cj] else self.minimo[ci, cj]
+                resultado[(ci, cj)] = np.broadcast_to(np.int16(valor), self.forma_chunk(ci, cj))
+            else:
+                pendientes.append((ci, cj))
+        resultado.update(self.cache.obtener_varias(pendientes))
+        return resultado
+
+    def _indices_eje(self, clave, eje):
+        n = self.shape[eje]
+        if isinstance(clave, slice):
+            return np.arange(*clave.indices(n)), False
+        indice = int(clave)
+        if indice < 0:
+            indice += n
+        if indice < 0 or indice >= n:
+            raise IndexError(f"Índice {indice} fuera de rango para el eje {eje} de tamaño {n}")
+        return np.array([indice]), True
+
+    def _recolectar(self, filas, columnas):
+        """Valores de las celdas (filas, columnas), descomprimiendo cada chunk una sola vez."""
+        filas, columnas = np.broadcast_arrays(np.asarray(filas, dtype=np.intp),
+                                              np.asarray(columnas, dtype=np.intp))
+        forma = filas.shape
+        filas = np.where(filas < 0, filas + self.shape[0], filas).ravel()
+        columnas = np.where(columnas < 0, columnas + self.shape[1], columnas).ravel()
+        if ((filas < 0) | (filas >= self.shape[0]) | (columnas < 0) | (columnas >= self.shape[1])).any():
+            raise IndexError(f"Índices fuera de rango para el almacén de forma {self.shape}")
+
+        salida = np.empty(filas.size, dtype=np.int16)
+        if filas.size:
+            t = self.tam_chunk
+            n_j = self.offsets.shape[1]
+            # Celdas agrupadas por chunk: cada grupo es un tramo contiguo tras ordenar
+            clave = (filas // t) * n_j + columnas // t
+            orden = np.argsort(clave, kind='stable')
+            unicos, inicios = np.unique(clave[orden], return_index=True)
+            grupos = np.split(orden, inicios[1:])
+            bloques = self.chunks([(int(k) // n_j, int(k) % n_j) for k in unicos])
+            for k, grupo in zip(unicos.tolist(), grupos):
+                chunk = bloques[(k // n_j, k % n_j)]
+                salida[grupo] = chunk[filas[grupo] % t, columnas[grupo] % t]
+        return salida.reshape(forma)
+
+    def __getitem__(self, clave):
+        if not isinstance(clave, tuple):
+            clave = (clave, slice(None))
+        if len(clave) == 2 and any(isinstance(c, (np.ndarray, list)) for c in clave):
+            if any(isinstance(c, slice) for c in clave):
+                raise IndexError("El almacén por chunks no combina arreglos de índices con rebanadas")
+            return self._recolectar(*clave)
+        if len(clave) != 2 or not all(isinstance(c, (slice, int, np.integer)) for c in clave):
+            raise IndexError("El almacén por chunks solo admite enteros, rebanadas y arreglos de índices")
+
+        filas, quitar_f = self._indices_eje(clave[0], 0)
+        columnas, quitar_c = self._indices_eje(clave[1], 1)
+        salida = np.full((len(filas), len(columnas)), NODATA, dtype=np.int16)
+
+        if len(filas) and len(columnas):
+            t = self.tam_chunk
+            cf, lf = filas // t, filas % t
+            cc, lc = columnas // t, columnas % t
+            grupos_f = [np.flatnonzero(cf == ci) for ci in np.unique(cf)]
+            grupos_c = [np.flatnonzero(cc == cj) for cj in np.unique(cc)]
+            bloques = self.chunks([(int(cf[gf[0]]), int(cc[gc[0]])) for gf in grupos_f for gc in grupos_c])
+            for gf in grupos_f:
+                for gc in grupos_c:
+                    chunk = bloques[(int(cf[gf[0]]), int(cc[gc[0]]))]
+                    salida[np.ix_(gf, gc)] = chunk[np.ix_(lf[gf], lc[gc])]
+
+        if quitar_f and quitar_c:
+            return salida[0, 0]
+        if quitar_f:
+            return salida[0]
+        if quitar_c:
+            return salida[:, 0]
+        return salida
+
+    def estadisticas(self, i_min, i_max, j_min, j_max):
+        """
+        Máximo, mínimo, mínimo positivo y celdas sin datos de una ventana.
+
+        Los chunks completamente dentro de la ventana se resuelven con el índice.
+        Los del borde solo se descomprimen si su máximo/mínimo puede cambiar el
+        resultado o si hace falta contar sus celdas sin datos.
+
+        Returns:
+            dict con 'maximo', 'minimo', 'minimo_positivo' (None si no hay
+            valores válidos/positivos) y 'sin_datos'.
+        """
+        i_min, j_min = max(0, i_min), max(0, j_min)
+        i_max, j_max = min(self.shape[0], i_max), min(self.shape[1], j_max)
+        t = self.tam_chunk
+        maximo, minimo, minimo_positivo, sin_datos = NODATA, MAX_INT16, MAX_INT16, 0
+        bordes = []
+
+        for ci in range(i_min // t, -(-i_max // t)):
+            for cj in range(j_min // t, -(-j_max // t)):
+                f0, c0 = ci * t, cj * t
+                f1, c1 = f0 + self.forma_chunk(ci, cj)[0], c0 + self.forma_chunk(ci, cj)[1]
+                if f0 >= i_min and f1 <= i_max and c0 >= j_min and c1 <= j_max:
+                    total = (f1 - f0) * (c1 - c0)
+                    sin_datos += int(self.sin_datos[ci, cj])
+                    if self.sin_datos[ci, cj] < total:
+                        maximo = max(maximo, int(self.maximo[ci, cj]))
+                        minimo = min(minimo, int(self.minimo[ci, cj]))
+                    minimo_positivo = min(minimo_positivo, int(self.minimo_positivo[ci, cj]))
+                else:
+                    bordes.append((ci, cj, max(f0, i_min), min(f1, i_max), max(c0, j_min), min(c1, j_max)))
+
+        for ci, cj, f0, f1, c0, c1 in bordes:
+            total = (f1 - f0) * (c1 - c0)
+            if self.sin_datos[ci, cj] == 0:
+                # Sin celdas vacías: solo se descomprime si puede mejorar algún extremo
+                if (self.maximo[ci, cj] <= maximo and self.minimo[ci, cj] >= minimo and
+                        self.minimo_positivo[ci, cj] >= minimo_positivo):
+                    continue
+            elif self._es_constante(ci, cj):
+                sin_datos += total
+                continue
+            bloque = self.chunks([(ci, cj)])[(ci, cj)][f0 - ci * t:f1 - ci * t, c0 - cj * t:c1 - cj * t]
+            minimo_b, maximo_b, positivo_b, sin_datos_b = estadisticas_bloque(bloque)
+            sin_datos += int(sin_datos_b)
+            if sin_datos_b < total:
+                maximo = max(maximo, int(maximo_b))
+                minimo = min(minimo, int(minimo_b))
+            minimo_positivo = min(minimo_positivo, int(positivo_b))
+
+        hay_validos = maximo != NODATA or minimo != MAX_INT16
+        return {
+            'maximo': maximo if hay_validos else None,
+            'minimo': minimo if hay_validos else None,
+            'minimo_positivo': minimo_positivo if minimo_positivo != MAX_INT16 else None,
+            'sin_datos': sin_datos,
+        }
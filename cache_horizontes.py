@@ -0,0 +1,157 @@
+"""
+CACHÉ DE HORIZONTES - ECUADOR
+Memoriza los resultados de calcular_horizonte para consultas repetidas.
+
+💡 CARACTERÍSTICAS:
+- Clave cuantizada: celda del observador, azimut y campo de visión (0.01°),
+  altura (1 cm), distancia en pasos de celda, número de rayos, método y la
+  huella de los datos .hgt (un cambio en los archivos invalida las entradas)
+- LRU en memoria limitado por bytes (OrderedDict, como CacheTeselas)
+- Almacén opcional en disco (.npz por consulta) que sobrevive a reinicios
+- Contadores de aciertos en memoria, aciertos en disco y fallos
+"""
+
+import os
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from mosaico_terreno import ruta_temporal
+
+
+def clave_horizonte(huella, i_obs, j_obs, azimut, campo_vision, altura_observador,
+                    max_pasos, num_rayos, metodo, tolerancia_angular=None):
+    """Clave cuantizada de una consulta de horizonte."""
+    return (huella, int(i_obs), int(j_obs),
+            int(round(azimut * 100)), int(round(campo_vision * 100)),
+            int(round(altura_observador * 100)), int(max_pasos), int(num_rayos), metodo,
+            None if tolerancia_angular is None else int(round(tolerancia_angular * 1000)))
+
+
+class CacheHorizontes:
+    """
+    Caché LRU de resultados de horizonte (elevaciones, distancias).
+
+    Cuando la suma de bytes supera el presupuesto se descartan las consultas
+    usadas hace más tiempo. Si se indica una carpeta, cada resultado nuevo se
+    guarda también en disco y un fallo en memoria se busca allí antes de
+    recalcular.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 ** 2, carpeta=None):
+        """
+        Args:
+            max_bytes: Presupuesto de memoria del caché.
+            carpeta: Carpeta del almacén en disco o None para usar solo memoria.
+        """
+        self.max_bytes = max_bytes
+        self.carpeta = carpeta
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        self._resultados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._resultados)
+
+    def __contains__(self, clave):
+        return clave in self._resultados
+
+    def _ruta(self, clave):
+        nombre = hashlib.sha1(repr(clave).encode('utf-8')).hexdigest()
+        return os.path.join(self.carpeta, f"{nombre}.npz")
+
+    def obtener(self, clave):
+        """Devuelve (elevaciones, distancias) o None si la consulta no está guardada."""
+        with self._lock:
+            resultado = self._resultados.get(clave)
+            if resultado is not None:
+                self._resultados.move_to_end(clave)
+                self.aciertos += 1
+                return resultado
+
+        resultado = self._leer_disco(clave)
+        with self._lock:
+            if resultado is None:
+                self.fallos += 1
+                return None
+            self.aciertos_disco += 1
+        self._guardar_memoria(clave, resultado)
+        return resultado
+
+    def guardar(self, clave, elevaciones, distancias):
+        """Guarda el resultado de una consulta en memoria y, si hay carpeta, en disco."""
+        resultado = (np.array(elevaciones, dtype=np.float64), np.array(distancias, dtype=np.float64))
+        for arreglo in resultado:
+            arreglo.flags.writeable = False
+        self._guardar_memoria(clave, resultado)
+        self._escribir_disco(clave, resultado)
+
+    def _guardar_memoria(self, clave, resultado):
+        with self._lock:
+            if clave in self._resultados:
+                return
+            self._resultados[clave] = resultado
+            self.bytes_usados += sum(a.nbytes for a in resultado)
+            while self.bytes_usados > self.max_bytes and self._resultados:
+                _, descartado = self._resultados.popitem(last=False)
+                self.bytes_usados -= sum(a.nbytes for a in descartado)
+
+    def _leer_disco(self, clave):
+        if self.carpeta is None:
+            return None
+        ruta = self._ruta(clave)
+        if not os.path.exists(ruta):
+            return None
+        try:
+            with np.load(ruta, allow_pickle=False) as datos:
+                # Un choque de hash no puede devolver otra consulta
+                if str(datos['clave']) != repr(clave):
+                    return None
+                resultado = (datos['elevaciones'], datos['distancias'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[AVISO] Resultado de horizonte ilegible en {ruta}: {e}")
+            return None
+        for arreglo in resultado:
+            arreglo.flags.writeable = False
+        return resultado
+
+    def _escribir_disco(self, clave, resultado):
+        if self.carpeta is None:
+            return
+        ruta = self._ruta(clave)
+        temporal = ruta_temporal(ruta)
+        try:
+            os.makedirs(self.carpeta, exist_ok=True)
+            with open(temporal, 'wb') as archivo:
+                np.savez(archivo, clave=np.array(repr(clave)),
+                         elevaciones=resultado[0], distancias=resultado[1])
+            # Reemplazo atómico: un lector nunca ve un archivo a medias
+            os.replace(temporal, ruta)
+        except OSError as e:
+            print(f"[AVISO] No se pudo guardar el horizonte en disco ({e})")
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def estadisticas(self):
+        """Contadores del caché: aciertos, aciertos_disco, fallos, entradas y bytes."""
+        with self._lock:
+            return {
+                'aciertos': self.aciertos,
+                'aciertos_disco': self.aciertos_disco,
+                'fallos': self.fallos,
+                'entradas': len(self._resultados),
+                'bytes': self.bytes_usados,
+            }
+
+    def limpiar(self, disco=False):
+        """Vacía el caché en memoria y, con disco=True, borra el almacén en disco."""
+        with self._lock:
+            self._resultados.clear()
+            self.bytes_usados = 0
+        if disco and self.carpeta is not None and os.path.isdir(self.carpeta):
+            for nombre in os.listdir(self.carpeta):
+                if nombre.endswith('.npz'):
+                    os.remove(os.path.join(self.carpeta, nombre))
@@ -0,0 +1,328 @@
+"""
+CATÁLOGO DE PICOS - ECUADOR
+Cumbres del mosaico con su prominencia, nombre (si lo tienen) e índice
+espacial, para etiquetar las que se ven desde un observador.
+
+💡 CARACTERÍSTICAS:
+- Prominencia topográfica calculada una sola vez sobre un nivel de la
+  pirámide de máximos: las celdas se agrupan con NumPy en cuencas (cada una
+  sube a su vecino más alto) y solo las aristas entre cuencas pasan por un
+  union-find, de mayor a menor collado; al unirse dos componentes, la cima
+  más baja recibe como prominencia su altura menos la del collado
+- La posición y altura de cada cima se afinan en el mosaico completo
+- Nombres de los principales volcanes y nevados por cercanía
+- Índice espacial en rejilla (celdas ordenadas por cubeta, estilo CSR): una
+  consulta solo mira las cubetas que toca el radio
+- Picos visibles a partir de un resultado de calcular_horizonte, sin volver
+  a leer el terreno
+"""
+
+import os
+import numpy as np
+from mosaico_terreno import NODATA, ruta_temporal
+
+# Principales cumbres con nombre: (nombre, lat, lon)
+CUMBRES_CONOCIDAS = [
+    ('Chimborazo', -1.4693, -78.8175),
+    ('Cotopaxi', -0.6838, -78.4372),
+    ('Cayambe', 0.0292, -77.9861),
+    ('Antisana', -0.4814, -78.1414),
+    ('El Altar', -1.6745, -78.4158),
+    ('Illinizas', -0.6600, -78.7139),
+    ('Sangay', -2.0050, -78.3410),
+    ('Carihuairazo', -1.4050, -78.7500),
+    ('Tungurahua', -1.4672, -78.4428),
+    ('Cotacachi', 0.3625, -78.3494),
+    ('Sincholagua', -0.5333, -78.3667),
+    ('Quilindaña', -0.7833, -78.3333),
+    ('Corazón', -0.5339, -78.6597),
+    ('Guagua Pichincha', -0.1711, -78.5981),
+    ('Rumiñahui', -0.5900, -78.4950),
+    ('Chiles', 0.8167, -77.9333),
+    ('Imbabura', 0.2583, -78.1833),
+    ('Sumaco', -0.5383, -77.6264),
+    ('Reventador', -0.0775, -77.6561),
+]
+
+# Distancia máxima (grados) entre una cumbre conocida y el pico al que da nombre
+RADIO_NOMBRE_GRADOS = 0.03
+
+# Lado de cada cubeta del índice espacial (celdas del mosaico)
+TAM_CUBETA = 256
+
+
+def prominencias(alturas):
+    """
+    Cimas y prominencia topográfica de una matriz de alturas.
+
+    Equivale a procesar las celdas de mayor a menor altura (8 vecinos): una
+    celda sin vecinos más altos abre un componente con ella como cima; si
+    toca varios componentes los une y la cima más baja de cada unión queda
+    dominada, con prominencia = su altura - la de la celda (el collado). Las
+    cimas que nunca se unen a una más alta conservan su altura como
+    prominencia. Las celdas sin datos no conectan.
+
+    La mayor parte del trabajo se hace con NumPy: cada celda se une a su
+    vecino más alto (esas uniones nunca crean cimas) y, por saltos de
+    punteros, queda asignada a la cima de su cuenca. Solo las aristas entre
+    cuencas distintas, la más alta de cada par, pasan por el union-find en
+    Python, en orden de altura del collado.
+
+    Args:
+        alturas: Matriz 2D int16.
+
+    Returns:
+        (cimas, prominencia): índices planos de las cimas y su prominencia (m).
+    """
+    filas, columnas = alturas.shape
+    plana = alturas.ravel()
+    validas = np.count_nonzero(plana != NODATA)
+    orden = np.argsort(-plana.astype(np.int32), kind='stable')[:validas]
+
+    # Rango de cada celda en el orden de proceso (0 = la más alta); las
+    # celdas sin datos y el borde añadido tienen un rango mayor que todos
+    sin_rango = np.iinfo(np.int64).max
+    rango = np.full((filas + 2, columnas + 2), sin_rango, dtype=np.int64)
+    interior = rango[1:-1, 1:-1]
+    interior.flat[orden] = np.arange(validas)
+
+    # Vecino de menor rango (el más alto) de cada celda
+    desplazamientos = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    mejor_rango = np.full((filas, columnas), sin_rango, dtype=np.int64)
+    mejor_vecino = np.zeros((filas, columnas), dtype=np.int64)
+    indices = np.arange(filas * columnas, dtype=np.int64).reshape(filas, columnas)
+    for di, dj in desplazamientos:
+        vecino = rango[1 + di:1 + di + filas, 1 + dj:1 + dj + columnas]
+        mejora = vecino < mejor_rango
+        mejor_rango[mejora] = vecino[mejora]
+        mejor_vecino[mejora] = (indices + (di * columnas + dj))[mejora]
+
+    # Cuencas: cada celda apunta a su vecino más alto si lo es más que ella;
+    # las cimas se apuntan a sí mismas
+    padre = np.where(mejor_rango < interior, mejor_vecino, indices).ravel()
+    while True:
+        abuelo = padre[padre]
+        if np.array_equal(abuelo, padre):
+            break
+        padre = abuelo
+    cuencas = orden[padre[orden] == orden]
+    numero = np.full(filas * columnas, -1, dtype=np.int64)
+    numero[cuencas] = np.arange(len(cuencas))
+    cuenca = numero[padre]
+    rango_plano = interior.ravel()
+
+    # Aristas entre cuencas distintas: su collado es la celda más baja de las
+    # dos. De cada par de cuencas basta la arista con el collado más alto
+    collados, pares_a, pares_b = [], [], []
+    for di, dj in [(0, 1), (1, -1), (1, 0), (1, 1)]:
+        a = indices[max(0, -di):filas - max(0, di), max(0, -dj):columnas - max(0, dj)].ravel()
+        b = a + (di * columnas + dj)
+        unidas = (rango_plano[a] != sin_rango) & (rango_plano[b] != sin_rango) & (cuenca[a] != cuenca[b])
+        a, b = a[unidas], b[unidas]
+        collados.append(np.where(rango_plano[a] > rango_plano[b], a, b))
+        pares_a.append(np.minimum(cuenca[a], cuenca[b]))
+        pares_b.append(np.maximum(cuenca[a], cuenca[b]))
+    collado = np.concatenate(collados)
+    clave = np.concatenate(pares_a) * len(cuencas) + np.concatenate(pares_b)
+    por_altura = np.argsort(rango_plano[collado], kind='stable')
+    _, primeras = np.unique(clave[por_altura], return_index=True)
+    aristas = por_altura[np.sort(primeras)]
+
+    # Union-find sobre las cuencas (numeradas de la más alta a la más baja:
+    # la cima de un componente es su cuenca de menor número)
+    raiz_de = list(range(len(cuencas)))
+    altura_cima = plana[cuencas].tolist()
+    prominencia = list(altura_cima)
+
+    def raiz(x):
+        while raiz_de[x] != x:
+            raiz_de[x] = raiz_de[raiz_de[x]]
+            x = raiz_de[x]
+        return x
+
+    alturas_collado = plana[collado[aristas]].tolist()
+    for a, b, altura in zip((clave[aristas] // len(cuencas)).tolist(),
+                            (clave[aristas] % len(cuencas)).tolist(), alturas_collado):
+        ra, rb = raiz(a), raiz(b)
+        if ra == rb:
+            continue
+        # Sobrevive el componente de la cima más alta; la otra queda dominada
+        alta, baja = (ra, rb) if ra < rb else (rb, ra)
+        prominencia[baja] = altura_cima[baja] - altura
+        raiz_de[baja] = alta
+
+    return cuencas.astype(np.int64), np.array(prominencia, dtype=np.int64)
+
+
+class CatalogoPicos:
+    """
+    Picos (índices globales, altura, prominencia y nombre) con índice espacial.
+
+    Los picos se guardan ordenados por cubeta de TAM_CUBETA x TAM_CUBETA
+    celdas; inicio[c]:inicio[c + 1] son los picos de la cubeta c.
+    """
+
+    def __init__(self, i, j, altura, prominencia, nombres, forma_mosaico, tam_cubeta=TAM_CUBETA):
+        self.tam_cubeta = tam_cubeta
+        self.forma_mosaico = tuple(forma_mosaico)
+        self.cubetas = (-(-self.forma_mosaico[0] // tam_cubeta), -(-self.forma_mosaico[1] // tam_cubeta))
+
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        cubeta = (i // tam_cubeta) * self.cubetas[1] + j // tam_cubeta
+        orden = np.argsort(cubeta, kind='stable')
+        self.i = i[orden]
+        self.j = j[orden]
+        self.altura = np.asarray(altura, dtype=np.int64)[orden]
+        self.prominencia = np.asarray(prominencia, dtype=np.int64)[orden]
+        self.nombres = np.asarray(nombres, dtype=str)[orden]
+        self.inicio = np.searchsorted(cubeta[orden], np.arange(self.cubetas[0] * self.cubetas[1] + 1))
+
+    def __len__(self):
+        return len(self.i)
+
+    def cercanos(self, i_obs, j_obs, radio):
+        """Índices (en el catálogo) de los picos a menos de `radio` celdas del observador."""
+        ci0, ci1 = max(0, (i_obs - radio) // self.tam_cubeta), min(self.cubetas[0] - 1, (i_obs + radio) // self.tam_cubeta)
+        cj0, cj1 = max(0, (j_obs - radio) // self.tam_cubeta), min(self.cubetas[1] - 1, (j_obs + radio) // self.tam_cubeta)
+        if ci0 > ci1 or cj0 > cj1:
+            return np.zeros(0, dtype=np.int64)
+
+        # Cada fila de cubetas es un tramo contiguo del catálogo
+        tramos = [np.arange(self.inicio[ci * self.cubetas[1] + cj0], self.inicio[ci * self.cubetas[1] + cj1 + 1])
+                  for ci in range(ci0, ci1 + 1)]
+        candidatos = np.concatenate(tramos)
+        cerca = np.hypot(self.i[candidatos] - i_obs, self.j[candidatos] - j_obs) <= radio
+        return candidatos[cerca]
+
+    def guardar(self, ruta, huella, parametros):
+        """Guarda el catálogo en un .npz con la huella del terreno y los parámetros."""
+        temporal = ruta_temporal(ruta)
+        try:
+            with open(temporal, 'wb') as archivo:
+                np.savez(archivo, i=self.i, j=self.j, altura=self.altura, prominencia=self.prominencia,
+                         nombres=self.nombres, forma_mosaico=np.array(self.forma_mosaico),
+                         huella=np.array(str(huella)), parametros=np.array(repr(parametros)))
+            # Se construye en segundo plano: un corte no deja un archivo a medias
+            os.replace(temporal, ruta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    @classmethod
+    def abrir(cls, ruta, huella, parametros):
+        """Abre un catálogo guardado; None si no existe o es de otros datos o parámetros."""
+        try:
+            with np.load(ruta, allow_pickle=False) as datos:
+                if str(datos['huella']) != str(huella) or str(datos['parametros']) != repr(parametros):
+                    return None
+                return cls(datos['i'], datos['j'], datos['altura'], datos['prominencia'],
+                           datos['nombres'], datos['forma_mosaico'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def construir_catalogo(niveles, nivel, prominencia_minima, indices_cumbres, celdas_por_grado):
+    """
+    Extrae el catálogo de picos de la pirámide de máximos.
+
+    La prominencia se calcula sobre niveles[nivel] (bloques de 2**nivel
+    celdas, cuyos máximos conservan las cimas; los collados pueden quedar
+    algo más altos, así que es una cota inferior). Cada cima se sitúa
+    después en la celda más alta de su bloque en el mosaico completo.
+
+    Args:
+        niveles: Pirámide de máximos (ver motor_horizonte.construir_piramide).
+        nivel: Nivel sobre el que se calcula la prominencia.
+        prominencia_minima: Prominencia mínima (m) para entrar en el catálogo.
+        indices_cumbres: [(nombre, i, j)] de las cumbres conocidas en índices globales.
+        celdas_por_grado: Celdas del mosaico por grado (resolucion - 1).
+
+    Returns:
+        CatalogoPicos.
+    """
+    reducida = np.asarray(niveles[nivel])
+    cimas, prominencia = prominencias(reducida)
+    elegidas = prominencia >= prominencia_minima
+    cimas, prominencia = cimas[elegidas], prominencia[elegidas]
+
+    terreno = niveles[0]
+    lado = 2 ** nivel
+    i = np.empty(len(cimas), dtype=np.int64)
+    j = np.empty(len(cimas), dtype=np.int64)
+    altura = np.empty(len(cimas), dtype=np.int64)
+    for k, (bi, bj) in enumerate(zip(*np.divmod(cimas, reducida.shape[1]))):
+        bloque = np.asarray(terreno[bi * lado:(bi + 1) * lado, bj * lado:(bj + 1) * lado])
+        fi, fj = np.unravel_index(np.argmax(bloque), bloque.shape)
+        i[k], j[k], altura[k] = bi * lado + fi, bj * lado + fj, bloque[fi, fj]
+
+    # Cada cumbre conocida nombra al pico más alto a menos de RADIO_NOMBRE_GRADOS
+    nombres = np.full(len(cimas), '', dtype=object)
+    radio = RADIO_NOMBRE_GRADOS * celdas_por_grado
+    for nombre, ci, cj in indices_cumbres:
+        cerca = np.flatnonzero(np.hypot(i - ci, j - cj) <= radio)
+        if len(cerca):
+            nombres[cerca[np.argmax(altura[cerca])]] = nombre
+
+    return CatalogoPicos(i, j, altura, prominencia, nombres.astype(str), terreno.shape)
+
+
+def picos_visibles(catalogo, i_obs, j_obs, altura_total, angulos, elevaciones, max_pasos,
+                   paso_metros, tolerancia=0.1):
+    """
+    Picos del catálogo que asoman en un perfil de horizonte.
+
+    Un pico es visible si su ángulo de elevación no queda más de
+    `tolerancia` grados por debajo del horizonte en su azimut (forma parte
+    de la silueta) y su azimut cae dentro del abanico de rayos del perfil.
+
+    Args:
+        catalogo: CatalogoPicos.
+        i_obs, j_obs: Índices globales del observador.
+        altura_total: Altura del ojo del observador (m).
+        angulos, elevaciones: Resultado de calcular_horizonte (ángulos crecientes).
+        max_pasos: Radio de búsqueda en celdas.
+        paso_metros: Metros por celda.
+        tolerancia: Margen en grados bajo la silueta.
+
+    Returns:
+        Lista de diccionarios (nombre, i, j, altura, prominencia, azimut,
+        elevacion, distancia_km), de mayor a menor prominencia.
+    """
+    angulos = np.asarray(angulos, dtype=np.float64)
+    elevaciones = np.asarray(elevaciones, dtype=np.float64)
+    indices = catalogo.cercanos(i_obs, j_obs, max_pasos)
+    di = catalogo.i[indices] - i_obs
+    dj = catalogo.j[indices] - j_obs
+    lejos = (di != 0) | (dj != 0)
+    indices, di, dj = indices[lejos], di[lejos], dj[lejos]
+    if len(indices) == 0 or len(angulos) == 0:
+        return []
+
+    distancia = np.hypot(di, dj) * paso_metros
+    elevacion = np.degrees(np.arctan2(catalogo.altura[indices] - altura_total, distancia))
+    azimut = np.degrees(np.arctan2(dj, -di)) % 360
+
+    # Azimut relativo al primer rayo: el abanico puede cruzar el norte
+    relativo = (azimut - angulos[0]) % 360
+    amplitud = angulos[-1] - angulos[0]
+    if amplitud >= 360:
+        horizonte = np.interp(relativo, angulos - angulos[0], elevaciones, period=360)
+        dentro = np.ones(len(indices), dtype=bool)
+    else:
+        horizonte = np.interp(relativo, angulos - angulos[0], elevaciones)
+        dentro = relativo <= amplitud
+    visible = dentro & (elevacion >= horizonte - tolerancia)
+
+    picos = [{
+        'nombre': str(catalogo.nombres[k]),
+        'i': int(catalogo.i[k]),
+        'j': int(catalogo.j[k]),
+        'altura': int(catalogo.altura[k]),
+        'prominencia': int(catalogo.prominencia[k]),
+        'azimut': float(azimut[n]),
+        'elevacion': float(elevacion[n]),
+        'distancia_km': float(distancia[n] / 1000),
+    } for n, k in enumerate(indices) if visible[n]]
+    picos.sort(key=lambda p: -p['prominencia'])
+    return picos
@@ -265,6 +265,7 @@ class HorizonteGUI:
         self.map_marker.set_position(lat, lon)
         self.status_var.set(f"Nuevas coordenadas seleccionadas: Lat {lat:.4f}, Lon {lon:.4f}")
         self.ubicacion_var.set("Ubicación personalizada")
+        self.precargar_terreno(lat, lon)
 
     def cargar_ubicacion(self, event=None):
         ubicacion_nombre = self.ubicacion_var.get()
@@ -275,6 +276,26 @@ class HorizonteGUI:
             self.map_widget.set_position(lat, lon)
             self.map_marker.set_position(lat, lon)
             self.status_var.set(f"📍 Ubicación cargada: {ubicacion_nombre}")
+            self.precargar_terreno(lat, lon)
+
+    def precargar_terreno(self, lat, lon):
+        """
+        Empieza a leer en segundo plano el terreno alrededor del nuevo
+        observador. El catálogo de picos no se lanza aquí: lo pide la vista 3D
+        la primera vez que se genera, así un clic en el mapa no dispara la
+        lectura del mosaico completo.
+        """
+        try:
+            if self.viewer is None:
+                self.viewer = HorizonteViewer3D_GUI()
+            self.viewer.precargar_region(lat, lon, 150)
+        except ValueError:
+            # Punto fuera de los datos: se informará al generar la vista
+            pass
+        except (OSError, MemoryError) as e:
+            # La precarga es solo una optimización: el error real, si sigue,
+            # se informará al generar la vista
+            print(f"[AVISO] No se pudo precargar el terreno: {e}")
 
     def actualizar_direccion_label(self, event=None):
         azimut = self.azimut_var.get()
@@ -344,6 +365,7 @@ class HorizonteGUI:
                 f"📊 Puntos renderizados: {info_gui['puntos_terreno']:,}\n"
                 f"⛰️ Elevación máxima: {info_gui['elevacion_max']:.0f} m\n"
                 f"🌄 Elevación mínima: {info_gui['elevacion_min']:.0f} m\n"
+                f"🗻 Cumbres visibles: {', '.join(p['nombre'] for p in info_gui['picos_visibles'] if p['nombre']) or 'ninguna con nombre'}\n"
                 f"⌨️ Controles: ← → (rotar), + - (zoom)\n"
             )
 
@@ -4,7 +4,8 @@ Genera vistas 3D realistas del horizonte para integración con interfaz gráfica
 
 🔧 CONFIGURACIÓN:
 - Radio fijo: 150km para todas las vistas
-- Resolución: 2000 puntos máximo para rendimiento óptimo
+- Resolución: completa cerca del observador y más gruesa por anillos hacia
+  afuera, con un presupuesto de triángulos (por defecto 2 millones)
 - Sin contornos para evitar artefactos visuales
 - Altura altura variable, por defecto 1.7m
 
@@ -17,6 +18,8 @@ Genera vistas 3D realistas del horizonte para integración con interfaz gráfica
 - Preparado para integración con GUI externa
 - Manejo de errores para altura y coordenadas inválidas
 - Brujula interactiva para indicar dirección actual
+- Recorte por campo de visión: solo se construye el terreno del sector que
+  ve la cámara (más un margen de giro) y se extiende al rotar
 """
 
 import numpy as np
@@ -27,6 +30,20 @@ import vtk
 from vtk.util import numpy_support  # type: ignore
 from PIL import Image
 from simulador_horizonte_corregido import SimuladorHorizonte
+from mosaico_terreno import mascara_nodata
+from malla_terreno import normalizar_elevacion, malla_niveles_detalle, MAX_TRIANGULOS_TERRENO
+
+# Tamaño de la ventana 3D (ancho, alto) en píxeles
+TAMANO_VENTANA = (1400, 900)
+
+# Grados de terreno que se construyen a cada lado del campo de visión
+MARGEN_GIRO = 15
+
+
+def campo_vision_horizontal(angulo_vertical, ancho, alto):
+    """Campo de visión horizontal (grados) de una cámara cuyo view_angle es vertical."""
+    return math.degrees(2 * math.atan(math.tan(math.radians(angulo_vertical) / 2) * ancho / alto))
+
 
 class HorizonteViewer3D_GUI(SimuladorHorizonte):
     """
@@ -40,7 +57,9 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
         print("📍 Coordenadas corregidas para Ecuador continental")
     
     def vista_3d_realista(self, lat_observador, lon_observador, azimut=90, 
-                         campo_vision=90, radio_km=150, altura_sobre_terreno=1.7):
+                         campo_vision=90, radio_km=150, altura_sobre_terreno=1.7,
+                         max_triangulos=MAX_TRIANGULOS_TERRENO, recorte_campo_vision=True,
+                         margen_giro=MARGEN_GIRO):
         """
         Genera una vista 3D realista del horizonte usando PyVista para GUI.
         
@@ -50,6 +69,11 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
             campo_vision: Ángulo de campo de visión en grados.
             radio_km: Radio de terreno a mostrar (kilómetros).
             altura_sobre_terreno: Altura del observador sobre el terreno en metros.
+            max_triangulos: Presupuesto de triángulos de la malla del terreno.
+            recorte_campo_vision: Si es True, solo se construye el terreno dentro
+                del campo de visión horizontal más `margen_giro` grados a cada
+                lado; el resto se agrega al girar la vista.
+            margen_giro: Margen (grados) a cada lado del campo de visión.
         
         Returns:
             dict: Información del renderizado para la GUI, o un error.
@@ -61,7 +85,8 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
         print(f"⛰️  Vista natural sin exageración")
         
         return self._vista_pyvista_gui(lat_observador, lon_observador, azimut, 
-                                     campo_vision, radio_km, altura_sobre_terreno)
+                                     campo_vision, radio_km, altura_sobre_terreno,
+                                     max_triangulos, recorte_campo_vision, margen_giro)
         
     def _crear_brujula_imagen(self, plotter, compass_image_path, azimut_inicial=0):
         """
@@ -157,7 +182,9 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
 
         return vtk_img
     
-    def _vista_pyvista_gui(self, lat, lon, azimut, campo_vision, radio_km, altura_sobre_terreno):
+    def _vista_pyvista_gui(self, lat, lon, azimut, campo_vision, radio_km, altura_sobre_terreno,
+                           max_triangulos=MAX_TRIANGULOS_TERRENO, recorte_campo_vision=True,
+                           margen_giro=MARGEN_GIRO):
         """
         Método interno para generar la vista de PyVista.
         Corrige la lógica de cámara, controles y el error original.
@@ -167,99 +194,108 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
         except ImportError:
             raise ImportError("PyVista no está instalado. Ejecute: pip install pyvista")
         
-        if self.matriz_terreno is None:
-            self.cargar_terreno_ecuador()
-        
         # Obtener datos del observador
         try:
             i_obs, j_obs = self.coordenadas_a_indices(lat, lon)
-            altura_terreno = self.matriz_terreno[i_obs, j_obs]
         except ValueError as e:
             raise ValueError(f"Error en coordenadas del observador: {e}")
         
-        if altura_terreno < -1000:
-            raise ValueError(f"Posición inválida o en el mar. Altura del terreno: {altura_terreno}m. Elija otro punto.")
-
-        # Altura corregida del observador
-        altura_observador_real = altura_terreno + altura_sobre_terreno
-        
         # --- Extraer y Submuestrear Terreno ---
+        # Solo se leen los archivos .hgt que cubren la ventana del observador
         paso_metros = (1 / (self.resolucion - 1)) * 111000
         radio_indices = int((radio_km * 1000) / paso_metros)
         
-        i_min = max(0, i_obs - radio_indices)
-        i_max = min(self.matriz_terreno.shape[0], i_obs + radio_indices)
-        j_min = max(0, j_obs - radio_indices)
-        j_max = min(self.matriz_terreno.shape[1], j_obs + radio_indices)
+        ventana, i_min, j_min = self._leer_ventana(i_obs - radio_indices, i_obs + radio_indices,
+                                                   j_obs - radio_indices, j_obs + radio_indices)
+        altura_terreno = ventana[i_obs - i_min, j_obs - j_min]
         
-        step = max(1, radio_indices // 2000)
-        terreno_region = self.matriz_terreno[i_min:i_max:step, j_min:j_max:step]
+        if altura_terreno < -1000:
+            raise ValueError(f"Posición inválida o en el mar. Altura del terreno: {altura_terreno}m. Elija otro punto.")
+
+        # Altura corregida del observador
+        altura_observador_real = altura_terreno + altura_sobre_terreno
         
         # --- Crear la malla del terreno ---
-        filas, columnas = terreno_region.shape
-        Z = terreno_region.astype(float)
-        Z[Z == -32768] = 0
-        Z_km = Z / 1000
-        
-        x_coords = np.arange(columnas) * paso_metros * step / 1000
-        y_coords = np.arange(filas) * paso_metros * step / 1000
-        
-        obs_x = (j_obs - j_min) * paso_metros / 1000
-        obs_y = (i_obs - i_min) * paso_metros / 1000
-        x_coords = x_coords - obs_x
-        y_coords = y_coords - obs_y
-        y_coords = -y_coords # Corrección de orientación para PyVista
-        
-        X, Y = np.meshgrid(x_coords, y_coords)
-        superficie = pv.StructuredGrid(X, Y, Z_km)
-        
-        # --- Mapeo de colores (lógica original) ---
-        puntos_terreno = superficie.points
-        elevaciones_terreno = puntos_terreno[:, 2] * 1000
+        # El terreno se mantiene en int16 (sin datos = 0) con una máscara aparte.
+        # La malla usa anillos de detalle alrededor del observador: resolución
+        # completa cerca y una celda de cada 2, 4, 8... lejos, dentro del
+        # presupuesto de triángulos (ver malla_terreno.py).
+        sin_datos = mascara_nodata(ventana)
+        Z = np.where(sin_datos, np.int16(0), ventana)
+        self.reportar_intermedio("Z", Z, np.int16)
+        
+        # Con recorte por campo de visión solo se construye el sector de azimut
+        # que ve la cámara más el margen de giro; al rotar, extender_terreno
+        # agrega los sectores que falten.
+        cobertura = None
+        if recorte_campo_vision:
+            mitad = campo_vision_horizontal(campo_vision, *TAMANO_VENTANA) / 2 + margen_giro
+            cobertura = [azimut - mitad, azimut + mitad]
+        
+        espaciado_km = paso_metros / 1000
+        centro_ventana = (i_obs - i_min, j_obs - j_min)
+        superficie, alturas_puntos = malla_niveles_detalle(
+            Z, centro_ventana, radio_indices, espaciado_km, max_triangulos,
+            sector=None if cobertura is None else tuple(cobertura))
+        self.reportar_intermedio("superficie.points", superficie.points, np.float32)
+        
+        # --- Mapeo de colores ---
+        # Tabla por elevación int16 (malla_terreno.py) sobre la ventana, en el
+        # orden de puntos de la malla
+        min_total = int(Z.min())
+        max_total = int(Z.max())
         
         print(f"   🎨 PROCESANDO COLORES DEL TERRENO:")
         print(f"      Puntos del terreno: {superficie.n_points}")
-        print(f"      Rango elevaciones: {np.min(elevaciones_terreno):.0f}m - {np.max(elevaciones_terreno):.0f}m")
-        
-        min_total = np.min(elevaciones_terreno)
-        max_total = np.max(elevaciones_terreno)
-        elevaciones_norm_terreno = np.zeros_like(elevaciones_terreno, dtype=float)
-        
-        for i, elev in enumerate(elevaciones_terreno):
-            if elev <= 10:
-                if elev <= 0:
-                    elevaciones_norm_terreno[i] = 0.0
-                else:
-                    elevaciones_norm_terreno[i] = 0.0 + (elev / 10) * 0.15
-            elif elev <= 20:
-                elevaciones_norm_terreno[i] = 0.15 + ((elev - 10) / 10) * 0.15
-            else:
-                if max_total > 20:
-                    elevaciones_norm_terreno[i] = 0.3 + ((elev - 20) / (max_total - 20)) * 0.7
-                else:
-                    elevaciones_norm_terreno[i] = 0.3
+        # Con un solo nivel la malla es una StructuredGrid de cuadriláteros
+        triangulos_terreno = superficie.n_cells * (2 if isinstance(superficie, pv.StructuredGrid) else 1)
+        print(f"      Triángulos del terreno: {triangulos_terreno} (presupuesto {max_triangulos})")
+        if cobertura is not None:
+            print(f"      Sector construido: {cobertura[0] % 360:.0f}°-{cobertura[1] % 360:.0f}°")
+        print(f"      Rango elevaciones: {min_total:.0f}m - {max_total:.0f}m")
+        
+        elevaciones_norm_terreno = normalizar_elevacion(alturas_puntos, max_total)
+        self.reportar_intermedio("elevaciones_norm_terreno", elevaciones_norm_terreno, np.float32)
         
         superficie["elevacion"] = elevaciones_norm_terreno
         
         # --- Encontrar puntos min/max para info de GUI ---
-        max_idx = np.unravel_index(np.argmax(Z), Z.shape)
-        min_valid_z = Z[Z > 0]
-        if len(min_valid_z) > 0:
-            min_val = np.min(min_valid_z)
-            min_idx = np.unravel_index(np.argmin(np.where(Z > 0, Z, np.inf)), Z.shape)
-        else:
-            min_idx = max_idx
-            min_val = Z[max_idx]
+        # Los extremos salen de las estadísticas de la ventana (con un almacén
+        # por chunks, sin recorrer las celdas); las celdas sin datos cuentan como 0.
+        estadisticas = self.estadisticas_region(i_min, i_min + ventana.shape[0],
+                                                j_min, j_min + ventana.shape[1], datos=ventana)
+        elevacion_max = estadisticas['maximo'] if estadisticas['maximo'] is not None else 0
+        if estadisticas['sin_datos']:
+            elevacion_max = max(elevacion_max, 0)
+        elevacion_min = estadisticas['minimo_positivo']
+        if elevacion_min is None:
+            elevacion_min = elevacion_max
         
-        max_x = x_coords[max_idx[1]]
-        max_y = y_coords[max_idx[0]]
-        max_z = Z_km[max_idx]
+        max_idx = np.unravel_index(np.argmax(Z), Z.shape)
+        max_x = (max_idx[1] + j_min - j_obs) * espaciado_km
+        max_y = -(max_idx[0] + i_min - i_obs) * espaciado_km
+        max_z = Z[max_idx] / 1000
 
         print(f"   Punto máximo: ({max_x:.2f}, {max_y:.2f}, {max_z:.3f}) = {Z[max_idx]:.0f}m")
         print(f"   ✅ Terreno procesado para GUI")
 
+        # --- Cumbres visibles (catálogo de picos, sin recorrer el terreno) ---
+        # El catálogo se prepara en otro hilo: mientras no esté listo la vista
+        # se abre sin etiquetas
+        picos = []
+        if self.catalogo_picos is None:
+            self.preparar_catalogo_picos()
+            print("   ⛰️ Catálogo de picos en preparación: las cumbres se etiquetarán en las próximas vistas")
+        else:
+            try:
+                horizonte = self.calcular_horizonte(lat, lon, 0, 360, altura_sobre_terreno, radio_km, 720)
+                picos = self.picos_visibles(lat, lon, horizonte, altura_sobre_terreno, radio_km)
+                print(f"   ⛰️ Cumbres visibles: {len(picos)}")
+            except (ValueError, OSError) as e:
+                print(f"[AVISO] No se pudieron ubicar las cumbres visibles: {e}")
+
         # --- Configuración del Plotter y Cámara ---
-        plotter = pv.Plotter(window_size=[1400, 900])
+        plotter = pv.Plotter(window_size=list(TAMANO_VENTANA))
         plotter.set_background('lightblue')
         
         # Configurar renderizado de profundidad
@@ -268,8 +304,7 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
         plotter.renderer.SetOcclusionRatio(0.1)
         
         # Agregar el terreno con el esquema de color personalizado
-        plotter.add_mesh(
-            superficie, 
+        estilo_terreno = dict(
             scalars="elevacion", 
             cmap="gist_earth",
             smooth_shading=False,
@@ -282,6 +317,52 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
             clim=[0.0, 1.0],
             show_scalar_bar=False
         )
+        plotter.add_mesh(superficie, **estilo_terreno)
+        
+        def extender_terreno(angulo_degrees):
+            """
+            Agrega el terreno que falta cuando la vista (más el margen de giro)
+            se sale del sector ya construido.
+            """
+            if cobertura is None or cobertura[1] - cobertura[0] >= 360:
+                return
+            ancho, alto = plotter.window_size
+            mitad = campo_vision_horizontal(plotter.camera.view_angle, ancho, alto) / 2
+            # Ángulo de la vista expresado cerca del centro del sector construido
+            centro = (cobertura[0] + cobertura[1]) / 2
+            angulo = centro + (angulo_degrees - centro + 180) % 360 - 180
+            
+            nuevos = []
+            if angulo - mitad < cobertura[0]:
+                inicio = max(angulo - mitad - margen_giro, cobertura[1] - 360)
+                nuevos.append((inicio, cobertura[0]))
+                cobertura[0] = inicio
+            if angulo + mitad > cobertura[1]:
+                fin = min(angulo + mitad + margen_giro, cobertura[0] + 360)
+                nuevos.append((cobertura[1], fin))
+                cobertura[1] = fin
+            
+            for sector in nuevos:
+                pieza, alturas_pieza = malla_niveles_detalle(Z, centro_ventana, radio_indices,
+                                                             espaciado_km, max_triangulos, sector)
+                if pieza.n_cells == 0:
+                    continue
+                pieza["elevacion"] = normalizar_elevacion(alturas_pieza, max_total)
+                plotter.add_mesh(pieza, **estilo_terreno)
+                print(f"   🧩 Terreno extendido: {sector[0] % 360:.0f}°-{sector[1] % 360:.0f}° "
+                      f"({pieza.n_cells} triángulos)")
+        
+        # Etiquetas de las cumbres con nombre que asoman en el horizonte
+        picos_nombrados = [p for p in picos if p['nombre']]
+        if picos_nombrados:
+            puntos_picos = np.array([[(p['j'] - j_obs) * paso_metros / 1000,
+                                      -(p['i'] - i_obs) * paso_metros / 1000,
+                                      p['altura'] / 1000] for p in picos_nombrados], dtype=np.float32)
+            plotter.add_point_labels(puntos_picos,
+                                     [f"{p['nombre']} ({p['altura']} m)" for p in picos_nombrados],
+                                     font_size=12, point_size=8, point_color='white',
+                                     text_color='black', shape_opacity=0.6,
+                                     always_visible=True)
         
         # Efectos visuales
         plotter.enable_terrain_style()
@@ -386,6 +467,7 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
             if compass_info and 'actualizar_rotacion' in compass_info:
                 compass_info['actualizar_rotacion'](angulo_degrees)
             
+            extender_terreno(angulo_degrees)
             
             plotter.render()
         
@@ -448,9 +530,12 @@ class HorizonteViewer3D_GUI(SimuladorHorizonte):
             'direccion_cardinal': obtener_direccion_cardinal(azimut),
             'coordenadas': (lat, lon),
             'radio_km': radio_km,
-            'elevacion_max': Z[max_idx] * 1000,
-            'elevacion_min': min_val,
-            'puntos_terreno': superficie.n_points
+            'elevacion_max': elevacion_max,
+            'elevacion_min': elevacion_min,
+            'puntos_terreno': superficie.n_points,
+            'triangulos_terreno': triangulos_terreno,
+            'sector_terreno': cobertura,
+            'picos_visibles': picos
         }
         
         plotter.show(title=f"Vista 3D: {lat:.4f}, {lon:.4f}")
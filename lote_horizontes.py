@@ -0,0 +1,122 @@
+"""
+HORIZONTES EN LOTE - ECUADOR
+Cálculo del horizonte de muchos observadores repartidos en varios procesos.
+
+💡 CARACTERÍSTICAS:
+- Los procesos no cargan el terreno: se conectan al mismo mosaico, ya sea
+  el archivo de caché (np.memmap), el almacén por chunks o un bloque de
+  memoria compartida
+- La pirámide de máximos (metodo='piramide'/'adaptativo') se comparte igual
+- Cada proceso calcula sus rayos en serie (num_hilos=1): los núcleos ya se
+  reparten entre procesos
+- Resultados en el mismo orden que los observadores; None si un observador
+  está fuera del área o sin datos
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from simulador_horizonte_corregido import SimuladorHorizonte
+from mosaico_terreno import compartir_matriz, abrir_matriz_compartida
+
+# Estado de cada proceso trabajador (se fija en _iniciar_trabajador)
+_simulador_trabajador = None
+_parametros_trabajador = None
+# Bloques de memoria compartida abiertos: si se liberan, sus búferes dejan de ser válidos
+_memorias_trabajador = []
+
+
+def _iniciar_trabajador(geometria, descriptores, parametros):
+    """Prepara el simulador de un proceso trabajador a partir del terreno compartido."""
+    global _simulador_trabajador, _parametros_trabajador
+
+    simulador = SimuladorHorizonte(geometria['carpeta_matrices'], usar_cache=False)
+    simulador.resolucion = geometria['resolucion']
+    simulador.latitudes_disponibles = geometria['latitudes']
+    simulador.longitudes_disponibles = geometria['longitudes']
+    simulador._fijar_geometria()
+    # La geometría ya está fijada: no hace falta escanear los archivos .hgt
+    simulador.archivos_disponibles = {}
+    simulador.huella_terreno = geometria['huella']
+
+    niveles = [abrir_matriz_compartida(d, _memorias_trabajador) for d in descriptores]
+    simulador.matriz_terreno = niveles[0]
+    if len(niveles) > 1:
+        simulador.piramide_maxima = niveles
+
+    _simulador_trabajador = simulador
+    _parametros_trabajador = parametros
+
+
+def _horizonte_observador(simulador, parametros, observador):
+    """Horizonte de un observador (lat, lon); None si no se puede calcular."""
+    lat, lon = observador[0], observador[1]
+    try:
+        return simulador.calcular_horizonte(lat, lon, **parametros)
+    except ValueError:
+        return None
+
+
+def _horizonte_trabajador(observador):
+    return _horizonte_observador(_simulador_trabajador, _parametros_trabajador, observador)
+
+
+def calcular_horizontes_lote(simulador, observadores, azimut=0, campo_vision=360,
+                             altura_observador=1.7, max_distancia_km=50, num_rayos=360,
+                             metodo='vectorizado', procesos=None, chunksize=16):
+    """
+    Calcula el horizonte de muchos observadores en paralelo.
+
+    Los procesos se conectan al terreno ya cargado en `simulador` (archivo de
+    caché o memoria compartida) en lugar de volver a cargarlo.
+
+    Args:
+        simulador: SimuladorHorizonte con el terreno cargado (se carga si no).
+        observadores: Secuencia de (lat, lon).
+        azimut, campo_vision, altura_observador, max_distancia_km, num_rayos,
+        metodo: Igual que en calcular_horizonte, comunes a todos.
+        procesos: Procesos trabajadores (por defecto, os.cpu_count()); con 1
+            se calcula en este proceso.
+        chunksize: Observadores que recibe cada proceso por envío.
+
+    Returns:
+        Lista, en el orden de `observadores`, con la tripleta
+        (angulos, elevaciones, distancias) de cada uno o None si el
+        observador está fuera del área de datos o sin elevación.
+    """
+    observadores = list(observadores)
+    parametros = {
+        'azimut': azimut,
+        'campo_vision': campo_vision,
+        'altura_observador': altura_observador,
+        'max_distancia_km': max_distancia_km,
+        'num_rayos': num_rayos,
+        'metodo': metodo,
+    }
+
+    niveles = [simulador._terreno_completo()]
+    if metodo in ('piramide', 'adaptativo'):
+        niveles = simulador._niveles_piramide()
+
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1 or len(observadores) <= 1:
+        return [_horizonte_observador(simulador, parametros, o) for o in observadores]
+
+    geometria = {
+        'carpeta_matrices': simulador.carpeta_matrices,
+        'resolucion': simulador.resolucion,
+        'latitudes': list(simulador.latitudes_disponibles),
+        'longitudes': list(simulador.longitudes_disponibles),
+        'huella': simulador.huella_terreno,
+    }
+    memorias = []
+    try:
+        descriptores = [compartir_matriz(nivel, memorias) for nivel in niveles]
+        # Procesos x hilos por proceso no debe superar los núcleos
+        parametros_trabajador = dict(parametros, num_hilos=1)
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_trabajador,
+                                 initargs=(geometria, descriptores, parametros_trabajador)) as pool:
+            return list(pool.map(_horizonte_trabajador, observadores, chunksize=chunksize))
+    finally:
+        for memoria in memorias:
+            memoria.close()
+            memoria.unlink()
@@ -0,0 +1,333 @@
+"""
+MALLA DE TERRENO - ECUADOR
+Escalares y colores de la malla 3D calculados directamente de la ventana
+int16 del terreno.
+
+💡 CARACTERÍSTICAS:
+- Normalización de color por tramos (0-10 m, 10-20 m y 20 m-máximo) sin
+  bucles de Python: una tabla de 65536 valores float32 indexada por la
+  propia elevación int16
+- Malla de rejilla uniforme (origen + espaciado): los puntos se escriben en
+  un solo búfer float32, sin matrices X/Y de np.meshgrid
+- Niveles de detalle: anillos alrededor del observador con resolución
+  completa cerca y una celda de cada 2, 4, 8... hacia afuera, cosidos sin
+  grietas y limitados por un presupuesto de triángulos
+- Recorte por campo de visión: solo las celdas dentro de un sector de
+  azimut; los sectores contiguos se agregan después sin rehacer la malla
+"""
+
+import math
+import numpy as np
+
+# Tramos de la escala de color: elevación (m) -> valor normalizado
+ELEVACIONES_COLOR = (0.0, 10.0, 20.0)
+VALORES_COLOR = (0.0, 0.15, 0.3)
+
+
+def tabla_color_elevacion(max_total):
+    """
+    Tabla de color para todas las elevaciones int16.
+
+    Interpola por tramos [0, 10, 20, max_total] -> [0, 0.15, 0.3, 1]; lo que
+    queda por debajo de 0 vale 0. Si max_total <= 20 el último tramo se
+    queda en 0.3.
+
+    Args:
+        max_total: Elevación máxima de la región (m).
+
+    Returns:
+        Arreglo float32 de 65536 valores; la posición de la elevación e es
+        e + 32768.
+    """
+    xp, fp = list(ELEVACIONES_COLOR), list(VALORES_COLOR)
+    if max_total > xp[-1]:
+        xp.append(float(max_total))
+        fp.append(1.0)
+    elevaciones = np.arange(-32768, 32768, dtype=np.float64)
+    return np.interp(elevaciones, xp, fp).astype(np.float32)
+
+
+def normalizar_elevacion(terreno, max_total=None, orden='C'):
+    """
+    Valor de color normalizado [0, 1] de cada celda de una ventana int16.
+
+    Args:
+        terreno: Matriz int16 de elevaciones (las celdas sin datos ya
+            sustituidas por el valor que se quiera pintar).
+        max_total: Elevación máxima para la escala (por defecto, la de `terreno`).
+        orden: 'C' o 'F'; con 'F' el resultado sigue el orden de puntos de
+            pv.StructuredGrid(X, Y, Z) construida con np.meshgrid (con
+            superficie_terreno, 'C' sobre terreno[::-1]).
+
+    Returns:
+        Vector float32 con un valor por celda.
+    """
+    terreno = np.asarray(terreno, dtype=np.int16)
+    if max_total is None:
+        max_total = int(terreno.max()) if terreno.size else 0
+    tabla = tabla_color_elevacion(max_total)
+    # Ver el int16 como uint16 y cambiar el bit de signo da e + 32768 sin copias intermedias
+    indices = terreno.ravel(order=orden).view(np.uint16) ^ np.uint16(0x8000)
+    return tabla[indices]
+
+
+def superficie_terreno(terreno, espaciado_km, origen_km):
+    """
+    Superficie 3D del terreno a partir de una rejilla uniforme.
+
+    X e Y se definen solo por el origen y el espaciado. Los puntos se
+    escriben directamente en un único búfer float32 (N x 3): X e Y por
+    difusión de un vector por columna y otro por fila, Z dividiendo la
+    ventana int16 entre 1000. La memoria es la de los puntos de la malla,
+    sin matrices X/Y intermedias.
+
+    Args:
+        terreno: Matriz int16 (filas de norte a sur) con las celdas sin datos
+            ya sustituidas.
+        espaciado_km: Distancia entre celdas en km.
+        origen_km: (x, y) en km de la esquina suroeste (columna 0, última
+            fila) respecto al observador; Y crece hacia el norte.
+
+    Returns:
+        pv.StructuredGrid con puntos float32; el orden de sus puntos es el de
+        terreno[::-1] en orden C (de sur a norte y de oeste a este).
+    """
+    import pyvista as pv
+
+    filas, columnas = terreno.shape
+    puntos = np.empty((filas, columnas, 3), dtype=np.float32)
+    puntos[..., 0] = origen_km[0] + np.arange(columnas, dtype=np.float32) * np.float32(espaciado_km)
+    puntos[..., 1] = (origen_km[1] + np.arange(filas, dtype=np.float32) * np.float32(espaciado_km))[:, None]
+    # La primera fila de puntos es la del sur
+    np.divide(terreno[::-1], np.float32(1000), out=puntos[..., 2])
+
+    superficie = pv.StructuredGrid()
+    superficie.points = puntos.reshape(-1, 3)
+    superficie.dimensions = (columnas, filas, 1)
+    return superficie
+
+
+# --- Niveles de detalle (anillos alrededor del observador) ---
+
+# Presupuesto de triángulos por defecto de la malla 3D
+MAX_TRIANGULOS_TERRENO = 2_000_000
+
+# Fracción exterior de cada nivel en la que su altura se funde con la del siguiente
+FRACCION_TRANSICION = 0.25
+
+
+def planificar_niveles(radio, max_triangulos=MAX_TRIANGULOS_TERRENO):
+    """
+    Elige los niveles de detalle de la malla para un radio y un presupuesto.
+
+    El nivel k toma una celda de cada 2**k y cubre el cuadrado de semilado
+    radio_base * 2**k menos el cuadrado del nivel k-1; cada anillo aporta así
+    unos 6 * radio_base**2 triángulos. Se usa el mayor radio_base (par, para
+    que los bordes caigan sobre la rejilla del nivel siguiente) cuya malla
+    cabe en el presupuesto; si la rejilla completa cabe, hay un solo nivel.
+
+    Args:
+        radio: Radio en celdas.
+        max_triangulos: Número máximo de triángulos de la malla.
+
+    Returns:
+        Lista de (paso, semilado) en celdas, del nivel más fino al más grueso.
+    """
+    radio = max(int(radio), 1)
+    radio_base = min(radio + radio % 2, 2 * max(int(math.sqrt(max_triangulos / 8) // 2), 1))
+    while True:
+        niveles = _niveles(radio, radio_base)
+        if radio_base <= 2 or contar_triangulos(niveles) <= max_triangulos:
+            return niveles
+        radio_base -= 2
+
+
+def _niveles(radio, radio_base):
+    niveles = []
+    paso, semilado = 1, radio_base
+    while semilado < radio:
+        niveles.append((paso, semilado))
+        paso, semilado = 2 * paso, 2 * semilado
+    # El último nivel termina en el radio (redondeado a su paso)
+    niveles.append((paso, -(-radio // paso) * paso))
+    return niveles
+
+
+def contar_triangulos(niveles):
+    """Triángulos de la malla de unos niveles sin recortar por el borde del mosaico."""
+    total, interior = 0, 0
+    for paso, semilado in niveles:
+        lado, hueco = 2 * semilado // paso, 2 * interior // paso
+        total += 2 * (lado * lado - hueco * hueco)
+        interior = semilado
+    return total
+
+
+def _rango_nivel(centro, longitud, paso, semilado, limites=None):
+    """
+    Desplazamientos (múltiplos de paso) del nivel que caen dentro de la ventana
+    y, si se indican, dentro de los límites (mínimo, máximo).
+    """
+    bajo = max(-semilado, -(centro // paso) * paso)
+    alto = min(semilado, ((longitud - 1 - centro) // paso) * paso)
+    if limites is not None:
+        # Redondeo a la rejilla del nivel siguiente para que la fusión de
+        # alturas sea la misma que sin límites
+        doble = 2 * paso
+        bajo = max(bajo, int(math.floor(limites[0] / doble)) * doble)
+        alto = min(alto, int(math.ceil(limites[1] / doble)) * doble)
+    return np.arange(bajo, alto + 1, paso)
+
+
+def _caja_sector(sector, semilado):
+    """Caja (x_min, x_max, y_min, y_max) del sector dentro del cuadrado de semilado dado."""
+    inicio, fin = sector
+    if fin - inicio >= 360:
+        return -semilado, semilado, -semilado, semilado
+    xs, ys = [0.0], [0.0]
+    for angulo in (inicio, fin):
+        x, y = math.sin(math.radians(angulo)), math.cos(math.radians(angulo))
+        escala = semilado / max(abs(x), abs(y))
+        xs.append(x * escala)
+        ys.append(y * escala)
+    esquinas = np.array([(-1, -1), (-1, 1), (1, -1), (1, 1)]) * semilado
+    dentro = esquinas[en_sector(esquinas[:, 0], esquinas[:, 1], sector)]
+    xs.extend(dentro[:, 0])
+    ys.extend(dentro[:, 1])
+    return min(xs), max(xs), min(ys), max(ys)
+
+
+def _altura_gruesa(z, di, dj, paso):
+    """Interpolación bilineal de z sobre la rejilla del nivel siguiente (paso doble)."""
+    gruesa = z.copy()
+    filas = np.flatnonzero((di // paso) % 2 == 1)
+    filas = filas[(filas > 0) & (filas < len(di) - 1)]
+    gruesa[filas] = 0.5 * (z[filas - 1] + z[filas + 1])
+    columnas = np.flatnonzero((dj // paso) % 2 == 1)
+    columnas = columnas[(columnas > 0) & (columnas < len(dj) - 1)]
+    gruesa[:, columnas] = 0.5 * (gruesa[:, columnas - 1] + gruesa[:, columnas + 1])
+    return gruesa
+
+
+def en_sector(x, y, sector):
+    """
+    True donde el azimut de (x, y) (0 = norte, sentido horario) cae en el sector.
+
+    Args:
+        x, y: Coordenadas respecto al observador (Y hacia el norte).
+        sector: (inicio, fin) en grados con inicio <= fin; se admiten ángulos
+            fuera de [0, 360) y, si fin - inicio >= 360, todo está dentro.
+    """
+    inicio, fin = sector
+    if fin - inicio >= 360:
+        return np.ones(np.broadcast(x, y).shape, dtype=bool)
+    azimut = np.degrees(np.arctan2(x, y))
+    return (azimut - inicio) % 360 < fin - inicio
+
+
+def malla_niveles_detalle(terreno, centro, radio, espaciado_km, max_triangulos=MAX_TRIANGULOS_TERRENO,
+                          sector=None):
+    """
+    Malla 3D del terreno con anillos de detalle alrededor del observador.
+
+    Cerca del observador se usa la resolución completa y cada anillo hacia
+    afuera toma una celda de cada 2, 4, 8... de la ventana (vistas con paso,
+    sin copiar la ventana). Para que no haya grietas entre anillos, en la
+    franja exterior de cada nivel (FRACCION_TRANSICION) la altura se funde
+    con la interpolación sobre la rejilla del nivel siguiente. En el borde
+    la fusión es completa, así que los vértices intermedios quedan sobre las
+    aristas del anillo grueso.
+
+    Con `sector` solo se construyen las celdas cuyo centro cae en ese rango
+    de azimut. Los niveles son los del círculo completo, así que sectores
+    contiguos encajan sin huecos ni solapes y juntos no pasan del presupuesto.
+
+    Args:
+        terreno: Matriz int16 (filas de norte a sur) con las celdas sin datos
+            ya sustituidas.
+        centro: (fila, columna) del observador dentro de `terreno`.
+        radio: Radio en celdas.
+        espaciado_km: Distancia entre celdas en km.
+        max_triangulos: Presupuesto de triángulos (ver planificar_niveles).
+        sector: (inicio, fin) en grados (ver en_sector) o None para todo el círculo.
+
+    Returns:
+        (superficie, alturas): la malla en km con el observador en el origen
+        (Y hacia el norte) y la elevación int16 de cada punto, en el orden de
+        los puntos de la malla.
+    """
+    import pyvista as pv
+
+    ci, cj = centro
+    niveles = planificar_niveles(radio, max_triangulos)
+
+    if len(niveles) == 1 and sector is None:
+        di = _rango_nivel(ci, terreno.shape[0], 1, niveles[0][1])
+        dj = _rango_nivel(cj, terreno.shape[1], 1, niveles[0][1])
+        region = terreno[ci + di[0]:ci + di[-1] + 1, cj + dj[0]:cj + dj[-1] + 1]
+        superficie = superficie_terreno(region, espaciado_km,
+                                        (dj[0] * espaciado_km, -di[-1] * espaciado_km))
+        return superficie, region[::-1].ravel()
+
+    puntos, alturas, caras = [], [], []
+    total_puntos, interior = 0, 0
+    for k, (paso, semilado) in enumerate(niveles):
+        limites_i = limites_j = None
+        if sector is not None:
+            # Solo las filas y columnas de la caja del sector (Y hacia el norte = -fila)
+            x_min, x_max, y_min, y_max = _caja_sector(sector, semilado)
+            limites_i, limites_j = (-y_max - paso, -y_min + paso), (x_min - paso, x_max + paso)
+        di = _rango_nivel(ci, terreno.shape[0], paso, semilado, limites_i)
+        dj = _rango_nivel(cj, terreno.shape[1], paso, semilado, limites_j)
+        hueco, interior = interior, semilado
+        if len(di) < 2 or len(dj) < 2:
+            continue
+
+        # Celdas del nivel fuera del hueco del nivel anterior (y dentro del sector)
+        celdas = ~((di[:-1, None] >= -hueco) & (di[1:, None] <= hueco) &
+                   (dj[None, :-1] >= -hueco) & (dj[None, 1:] <= hueco))
+        if sector is not None:
+            celdas &= en_sector((dj[:-1] + paso / 2)[None, :], -(di[:-1] + paso / 2)[:, None], sector)
+        r, c = np.nonzero(celdas)
+        if len(r) == 0:
+            continue
+
+        # Solo se guardan los vértices de las celdas construidas
+        usados = np.zeros((len(di), len(dj)), dtype=bool)
+        usados[:-1, :-1] |= celdas
+        usados[:-1, 1:] |= celdas
+        usados[1:, :-1] |= celdas
+        usados[1:, 1:] |= celdas
+        nuevo_indice = np.cumsum(usados.ravel()) - 1 + total_puntos
+
+        muestras = terreno[ci + di[0]:ci + di[-1] + 1:paso, cj + dj[0]:cj + dj[-1] + 1:paso]
+        z = muestras.astype(np.float32)
+        if k < len(niveles) - 1:
+            distancia = np.maximum(np.abs(di)[:, None], np.abs(dj)[None, :])
+            inicio = semilado * (1 - FRACCION_TRANSICION)
+            fusion = np.clip((distancia - inicio) / (semilado - inicio), 0, 1).astype(np.float32)
+            z += fusion * (_altura_gruesa(z, di, dj, paso) - z)
+
+        nivel = np.empty((int(usados.sum()), 3), dtype=np.float32)
+        nivel[:, 0] = np.broadcast_to(dj[None, :], usados.shape)[usados] * np.float32(espaciado_km)
+        nivel[:, 1] = np.broadcast_to(di[:, None], usados.shape)[usados] * -np.float32(espaciado_km)
+        nivel[:, 2] = z[usados] / np.float32(1000)
+        puntos.append(nivel)
+        alturas.append(muestras[usados])
+
+        # Dos triángulos por celda (normales hacia arriba)
+        a = r * len(dj) + c
+        b, d, e = a + 1, a + len(dj), a + len(dj) + 1
+        triangulos = np.stack([np.concatenate([a, a]), np.concatenate([e, d]),
+                               np.concatenate([b, e])], axis=1)
+        caras.append(nuevo_indice[triangulos])
+        total_puntos += len(nivel)
+
+    if not caras:
+        return pv.PolyData(), np.empty(0, dtype=np.int16)
+    caras = np.concatenate(caras)
+    celdas = np.empty((len(caras), 4), dtype=np.int64)
+    celdas[:, 0] = 3
+    celdas[:, 1:] = caras
+    superficie = pv.PolyData(np.concatenate(puntos), celdas.ravel())
+    return superficie, np.concatenate(alturas)
@@ -0,0 +1,561 @@
+"""
+MOSAICO DE TERRENO - ECUADOR
+Acceso perezoso a los archivos .hgt (SRTM) como una sola matriz virtual.
+
+💡 CARACTERÍSTICAS:
+- Cada archivo .hgt se abre con np.memmap: no se lee nada hasta que se consulta
+- Misma interfaz que la matriz unida: matriz[i, j], matriz[i0:i1, j0:j1:paso]
+- Los bordes compartidos entre archivos se resuelven igual que en el mosaico original
+- Los archivos faltantes o corruptos se leen como -32768 (sin datos)
+- Lectura por ventanas con un caché LRU de archivos decodificados limitado en bytes
+- Caché persistente: el mosaico unido se guarda en un solo archivo int16 nativo
+  que se abre sin copias y se invalida si cambian los archivos .hgt
+- Matrices compartidas entre procesos (memmap del caché, carpeta del almacén
+  por chunks o memoria compartida)
+"""
+
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+# Valor SRTM para celdas sin datos
+NODATA = -32768
+
+
+def abrir_hgt_memmap(path_archivo, resolucion=1201):
+    """
+    Abre un archivo .hgt como memmap de solo lectura (enteros big-endian).
+
+    Returns:
+        np.memmap de forma (resolucion, resolucion), o None si el archivo
+        no existe o no tiene el tamaño esperado.
+    """
+    if not os.path.exists(path_archivo):
+        return None
+
+    tamanio = os.path.getsize(path_archivo)
+    if tamanio != resolucion * resolucion * 2:
+        print(f"[ERROR] Archivo corrupto: {path_archivo}")
+        return None
+
+    return np.memmap(path_archivo, dtype='>i2', mode='r', shape=(resolucion, resolucion))
+
+
+def mascara_nodata(datos, empaquetada=False):
+    """
+    Máscara de celdas sin datos (-32768), separada del terreno int16.
+
+    Args:
+        datos: Matriz int16 de elevaciones.
+        empaquetada: Si True, devuelve la máscara empaquetada en bits por fila
+            (np.packbits, 1 bit por celda); si False, una matriz booleana.
+    """
+    mascara = datos == NODATA
+    return np.packbits(mascara, axis=-1) if empaquetada else mascara
+
+
+def describir_arreglo(nombre, arreglo):
+    """Texto con forma, tipo y tamaño en memoria de un arreglo intermedio."""
+    return f"{nombre}: {tuple(arreglo.shape)} {arreglo.dtype} {arreglo.nbytes / 1024 ** 2:.1f} MB"
+
+
+def leer_hgt(path_archivo, resolucion=1201):
+    """Lee y decodifica un archivo .hgt completo a int16 nativo (o None)."""
+    tesela = abrir_hgt_memmap(path_archivo, resolucion)
+    if tesela is None:
+        return None
+    return tesela.astype(np.int16)
+
+
+# Ventana del mosaico: datos y posición (fila, columna) de su esquina superior izquierda
+RegionTerreno = namedtuple('RegionTerreno', ['datos', 'i0', 'j0'])
+
+
+class CacheTeselas:
+    """
+    Caché LRU de archivos .hgt decodificados, limitado por memoria.
+
+    Cuando la suma de bytes supera el presupuesto se descartan los archivos
+    usados hace más tiempo (siempre se conserva al menos el último). La
+    decodificación se hace en un pool de hilos: varias teselas de una ventana
+    se leen en paralelo y precargar() puede calentar el caché en segundo plano.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, resolucion=1201, hilos=None, cargar=None):
+        """
+        Args:
+            max_bytes: Presupuesto de memoria del caché.
+            resolucion: Puntos por lado de cada archivo .hgt.
+            hilos: Hilos del pool de decodificación (por defecto, hasta 8).
+            cargar: Función clave -> arreglo que sustituye a leer_hgt (por
+                ejemplo, para descomprimir bloques de un almacén por chunks).
+        """
+        self.max_bytes = max_bytes
+        self.resolucion = resolucion
+        self.cargar = cargar
+        self.hilos = hilos or min(8, os.cpu_count() or 1)
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._teselas = OrderedDict()
+        self._pendientes = {}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._teselas)
+
+    def __contains__(self, ruta):
+        return ruta in self._teselas
+
+    def _decodificar(self, ruta):
+        tesela = self.cargar(ruta) if self.cargar else leer_hgt(ruta, self.resolucion)
+        self._guardar(ruta, tesela)
+        return tesela
+
+    def _futuro(self, ruta):
+        """Tarea de decodificación de la ruta (debe llamarse con el lock tomado)."""
+        futuro = self._pendientes.get(ruta)
+        if futuro is None:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.hilos,
+                                                thread_name_prefix='teselas_hgt')
+            futuro = self._pool.submit(self._decodificar, ruta)
+            self._pendientes[ruta] = futuro
+        return futuro
+
+    def obtener(self, ruta):
+        """Devuelve el archivo decodificado (int16), leyéndolo si no está en caché."""
+        return self.obtener_varias([ruta])[ruta]
+
+    def obtener_varias(self, rutas):
+        """
+        Devuelve {ruta: archivo decodificado} para varias rutas. Las que no
+        están en caché se decodifican en paralelo; si una precarga ya las está
+        leyendo, se espera a esa misma tarea.
+        """
+        resultado = {}
+        futuros = {}
+        with self._lock:
+            for ruta in set(rutas):
+                if ruta in self._teselas:
+                    self._teselas.move_to_end(ruta)
+                    self.aciertos += 1
+                    resultado[ruta] = self._teselas[ruta]
+                else:
+                    self.fallos += 1
+                    futuros[ruta] = self._futuro(ruta)
+
+        for ruta, futuro in futuros.items():
+            resultado[ruta] = futuro.result()
+        return resultado
+
+    def precargar(self, rutas):
+        """
+        Lanza en segundo plano la decodificación de las rutas que aún no están
+        en caché y devuelve las tareas (concurrent.futures.Future).
+        """
+        with self._lock:
+            return [self._futuro(ruta) for ruta in set(rutas) if ruta not in self._teselas]
+
+    def _guardar(self, ruta, tesela):
+        with self._lock:
+            self._pendientes.pop(ruta, None)
+            if ruta in self._teselas:
+                return
+            self._teselas[ruta] = tesela
+            self.bytes_usados += tesela.nbytes if tesela is not None else 0
+            while self.bytes_usados > self.max_bytes and len(self._teselas) > 1:
+                _, descartada = self._teselas.popitem(last=False)
+                self.bytes_usados -= descartada.nbytes if descartada is not None else 0
+
+    def limpiar(self):
+        with self._lock:
+            self._teselas.clear()
+            self.bytes_usados = 0
+
+
+def _es_entero(valor):
+    return isinstance(valor, (int, np.integer))
+
+
+class MosaicoTerreno:
+    """
+    Mosaico virtual de archivos .hgt.
+
+    Se comporta como la matriz 2D que antes se construía con np.hstack/np.vstack:
+    cada archivo aporta (resolucion - 1) filas y columnas, salvo los de la última
+    fila/columna, que conservan su borde. Solo se leen del disco las páginas de
+    los archivos que una consulta toca realmente.
+    """
+
+    def __init__(self, rutas, resolucion=1201, cache=None):
+        """
+        Args:
+            rutas: Lista de filas (Norte → Sur) con la ruta de cada archivo
+                (Oeste → Este), o None si falta el archivo.
+            resolucion: Puntos por lado de cada archivo .hgt.
+            cache: CacheTeselas opcional. Si se indica, los archivos se leen
+                completos a memoria a través del caché en lugar de usar memmap.
+        """
+        self.rutas = rutas
+        self.resolucion = resolucion
+        self.cache = cache
+        self.paso = resolucion - 1
+        self.filas_teselas = len(rutas)
+        self.columnas_teselas = len(rutas[0]) if rutas else 0
+        self.shape = (self.filas_teselas * self.paso + 1,
+                      self.columnas_teselas * self.paso + 1)
+        self.dtype = np.dtype(np.int16)
+        self.ndim = 2
+        self._teselas = {}
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        datos = self[:, :]
+        return datos if dtype is None else datos.astype(dtype)
+
+    def _tesela(self, ti, tj):
+        """Devuelve el archivo (ti, tj): desde el caché LRU o como memmap."""
+        if self.cache is not None:
+            ruta = self.rutas[ti][tj]
+            return self.cache.obtener(ruta) if ruta else None
+        clave = (ti, tj)
+        if clave not in self._teselas:
+            ruta = self.rutas[ti][tj]
+            self._teselas[clave] = abrir_hgt_memmap(ruta, self.resolucion) if ruta else None
+        return self._teselas[clave]
+
+    def _teselas_necesarias(self, claves):
+        """
+        Devuelve {(ti, tj): archivo} para las teselas de una consulta. Con caché
+        LRU, las que faltan se decodifican en paralelo en una sola tanda.
+        """
+        if self.cache is not None:
+            rutas = {clave: self.rutas[clave[0]][clave[1]] for clave in claves}
+            leidas = self.cache.obtener_varias([r for r in rutas.values() if r])
+            return {clave: leidas[ruta] if ruta else None for clave, ruta in rutas.items()}
+        return {clave: self._tesela(*clave) for clave in claves}
+
+    def rutas_en_ventana(self, i_min, i_max, j_min, j_max):
+        """Rutas de los archivos .hgt que intersecan la ventana [i_min, i_max) x [j_min, j_max)."""
+        if i_max <= i_min or j_max <= j_min:
+            return []
+        tf = self._ubicar(np.array([i_min, i_max - 1]), 0)[0]
+        tc = self._ubicar(np.array([j_min, j_max - 1]), 1)[0]
+        return [self.rutas[ti][tj]
+                for ti in range(int(tf[0]), int(tf[1]) + 1)
+                for tj in range(int(tc[0]), int(tc[1]) + 1)
+                if self.rutas[ti][tj]]
+
+    def _ubicar(self, indices, eje):
+        """Convierte índices globales en (índice de archivo, índice local)."""
+        num_teselas = self.filas_teselas if eje == 0 else self.columnas_teselas
+        teselas = np.minimum(indices // self.paso, num_teselas - 1)
+        return teselas, indices - teselas * self.paso
+
+    def _normalizar_entero(self, indice, eje):
+        n = self.shape[eje]
+        indice = int(indice)
+        if indice < 0:
+            indice += n
+        if indice < 0 or indice >= n:
+            raise IndexError(f"Índice {indice} fuera de rango para el eje {eje} de tamaño {n}")
+        return indice
+
+    def __getitem__(self, clave):
+        if not isinstance(clave, tuple):
+            clave = (clave, slice(None))
+        if len(clave) != 2:
+            raise IndexError("El mosaico de terreno es bidimensional")
+        fila, columna = clave
+
+        # Acceso a un solo punto
+        if _es_entero(fila) and _es_entero(columna):
+            i = self._normalizar_entero(fila, 0)
+            j = self._normalizar_entero(columna, 1)
+            return self._valor(i, j)
+
+        # Indexado por rebanadas (y enteros)
+        if all(_es_entero(c) or isinstance(c, slice) for c in clave):
+            return self._bloque(fila, columna)
+
+        # Indexado avanzado con arreglos de índices
+        return self._recolectar(fila, columna)
+
+    def _valor(self, i, j):
+        ti, li = self._ubicar(i, 0)
+        tj, lj = self._ubicar(j, 1)
+        tesela = self._tesela(int(ti), int(tj))
+        if tesela is None:
+            return np.int16(NODATA)
+        return np.int16(tesela[li, lj])
+
+    def _indices_eje(self, clave, eje):
+        if isinstance(clave, slice):
+            return np.arange(*clave.indices(self.shape[eje])), clave.step or 1, False
+        return np.array([self._normalizar_entero(clave, eje)]), 1, True
+
+    @staticmethod
+    def _grupos(teselas):
+        """Separa un arreglo monótono de índices de archivo en tramos contiguos."""
+        cortes = np.flatnonzero(np.diff(teselas)) + 1
+        inicios = np.concatenate(([0], cortes))
+        finales = np.concatenate((cortes, [len(teselas)]))
+        return zip(inicios, finales)
+
+    def _bloque(self, clave_fila, clave_columna):
+        filas, paso_f, quitar_f = self._indices_eje(clave_fila, 0)
+        columnas, paso_c, quitar_c = self._indices_eje(clave_columna, 1)
+
+        salida = np.full((len(filas), len(columnas)), NODATA, dtype=np.int16)
+        if len(filas) and len(columnas):
+            tf, lf = self._ubicar(filas, 0)
+            tc, lc = self._ubicar(columnas, 1)
+            grupos_f = list(self._grupos(tf))
+            grupos_c = list(self._grupos(tc))
+            teselas = self._teselas_necesarias([(int(tf[f0]), int(tc[c0]))
+                                                for f0, _ in grupos_f for c0, _ in grupos_c])
+            for f0, f1 in grupos_f:
+                for c0, c1 in grupos_c:
+                    tesela = teselas[(int(tf[f0]), int(tc[c0]))]
+                    if tesela is None:
+                        continue
+                    # Con paso positivo los índices locales forman una progresión:
+                    # se usan rebanadas para que el memmap lea bloques contiguos.
+                    if paso_f > 0 and paso_c > 0:
+                        seleccion = (slice(int(lf[f0]), int(lf[f1 - 1]) + 1, paso_f),
+                                     slice(int(lc[c0]), int(lc[c1 - 1]) + 1, paso_c))
+                    else:
+                        seleccion = np.ix_(lf[f0:f1], lc[c0:c1])
+                    salida[f0:f1, c0:c1] = tesela[seleccion]
+
+        if quitar_f and quitar_c:
+            return salida[0, 0]
+        if quitar_f:
+            return salida[0]
+        if quitar_c:
+            return salida[:, 0]
+        return salida
+
+    def _recolectar(self, filas, columnas):
+        filas, columnas = np.broadcast_arrays(np.asarray(filas), np.asarray(columnas))
+        salida = np.full(filas.shape, NODATA, dtype=np.int16)
+        if filas.size == 0:
+            return salida
+
+        f = filas.ravel().astype(np.int64)
+        c = columnas.ravel().astype(np.int64)
+        if f.min() < 0 or f.max() >= self.shape[0] or c.min() < 0 or c.max() >= self.shape[1]:
+            raise IndexError("Índices fuera del rango del mosaico de terreno")
+
+        tf, lf = self._ubicar(f, 0)
+        tc, lc = self._ubicar(c, 1)
+        claves = tf * self.columnas_teselas + tc
+        orden = np.argsort(claves, kind='stable')
+        grupos = [orden[g0:g1] for g0, g1 in self._grupos(claves[orden])]
+        teselas = self._teselas_necesarias([(int(tf[idx[0]]), int(tc[idx[0]])) for idx in grupos])
+        plano = salida.ravel()
+        for idx in grupos:
+            tesela = teselas[(int(tf[idx[0]]), int(tc[idx[0]]))]
+            if tesela is not None:
+                plano[idx] = tesela[lf[idx], lc[idx]]
+        return salida
+
+
+# --- Caché persistente del mosaico unido ---
+
+FIRMA_CACHE = b'HGTMOSAICO\x00\x01'
+VERSION_CACHE = 1
+ALINEACION_CACHE = 4096
+
+
+def huella_archivos(archivos):
+    """
+    Huella de un conjunto de archivos .hgt: nombre, tamaño y fecha de modificación.
+
+    Args:
+        archivos: Iterable de rutas a archivos .hgt.
+
+    Returns:
+        Lista ordenada de [nombre, tamaño, mtime_ns], serializable en JSON.
+    """
+    huella = []
+    for ruta in archivos:
+        estado = os.stat(ruta)
+        huella.append([os.path.basename(ruta), estado.st_size, estado.st_mtime_ns])
+    return sorted(huella)
+
+
+def resumen_huella(huella):
+    """Resume una huella de archivos en un identificador corto (hex)."""
+    return hashlib.sha1(json.dumps(huella).encode('utf-8')).hexdigest()[:16]
+
+
+def ruta_temporal(ruta):
+    """
+    Temporal único por proceso e hilo para escribir `ruta` y luego moverlo
+    con os.replace: dos escritores simultáneos nunca comparten archivo.
+    """
+    return f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _leer_encabezado(f):
+    if f.read(len(FIRMA_CACHE)) != FIRMA_CACHE:
+        return None
+    longitud = int.from_bytes(f.read(8), 'little')
+    return json.loads(f.read(longitud).decode('utf-8'))
+
+
+def escribir_cache_mosaico(ruta_cache, matriz, metadatos, filas_por_bloque=1200, hilos=None):
+    """
+    Escribe el mosaico unido en un único archivo de caché.
+
+    El archivo tiene un encabezado JSON (forma, tipo, metadatos) seguido de los
+    datos int16 en orden nativo, alineados para abrirse con np.memmap. Se copia
+    por franjas de filas para no cargar el mosaico completo en memoria y se
+    escribe primero a un temporal, de modo que un corte no deja un caché a medias.
+
+    Args:
+        ruta_cache: Ruta del archivo de caché.
+        matriz: Matriz (o MosaicoTerreno) con el terreno unido.
+        metadatos: Diccionario serializable (latitudes, longitudes, huella...).
+        filas_por_bloque: Filas copiadas en cada franja.
+        hilos: Hilos que copian franjas en paralelo (por defecto, hasta 8).
+    """
+    os.makedirs(os.path.dirname(ruta_cache) or '.', exist_ok=True)
+    forma = tuple(int(n) for n in matriz.shape)
+    tipo = np.dtype(np.int16)
+
+    encabezado = dict(metadatos, version=VERSION_CACHE, forma=list(forma), dtype=tipo.str)
+    # Se reservan 64 bytes para el propio campo 'offset' antes de alinear
+    minimo = len(FIRMA_CACHE) + 8 + len(json.dumps(encabezado).encode('utf-8')) + 64
+    encabezado['offset'] = -(-minimo // ALINEACION_CACHE) * ALINEACION_CACHE
+    texto = json.dumps(encabezado).encode('utf-8')
+    offset = encabezado['offset']
+
+    # Temporal propio de este proceso: otro proceso que construya el mismo
+    # caché a la vez escribe en su propio archivo
+    temporal = ruta_temporal(ruta_cache)
+    try:
+        with open(temporal, 'wb') as f:
+            f.write(FIRMA_CACHE)
+            f.write(len(texto).to_bytes(8, 'little'))
+            f.write(texto)
+            f.truncate(offset + forma[0] * forma[1] * tipo.itemsize)
+
+        destino = np.memmap(temporal, dtype=tipo, mode='r+', offset=offset, shape=forma)
+
+        def copiar_franja(i0):
+            destino[i0:i0 + filas_por_bloque] = matriz[i0:i0 + filas_por_bloque, :]
+
+        # Las franjas son independientes: se decodifican y copian en paralelo
+        with ThreadPoolExecutor(max_workers=hilos or min(8, os.cpu_count() or 1)) as pool:
+            list(pool.map(copiar_franja, range(0, forma[0], filas_por_bloque)))
+        destino.flush()
+        del destino
+
+        os.replace(temporal, ruta_cache)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def abrir_cache_mosaico(ruta_cache, huella):
+    """
+    Abre el caché del mosaico sin copiar datos, si sigue siendo válido.
+
+    Args:
+        ruta_cache: Ruta del archivo de caché.
+        huella: Huella actual de los archivos .hgt (ver huella_archivos).
+
+    Returns:
+        (np.memmap de solo lectura, encabezado) o None si el caché no existe,
+        es de otra versión o no corresponde a los archivos actuales.
+    """
+    if not os.path.exists(ruta_cache):
+        return None
+
+    try:
+        with open(ruta_cache, 'rb') as f:
+            encabezado = _leer_encabezado(f)
+    except (OSError, ValueError):
+        return None
+
+    if (encabezado is None or encabezado.get('version') != VERSION_CACHE or
+            encabezado.get('huella') != huella):
+        return None
+
+    forma = tuple(encabezado['forma'])
+    tipo = np.dtype(encabezado['dtype'])
+    if tipo != np.dtype(np.int16):
+        return None
+    if os.path.getsize(ruta_cache) != encabezado['offset'] + forma[0] * forma[1] * tipo.itemsize:
+        return None
+
+    matriz = np.memmap(ruta_cache, dtype=tipo, mode='r', offset=encabezado['offset'], shape=forma)
+    return matriz, encabezado
+
+
+# --- Matrices compartidas entre procesos ---
+
+def compartir_matriz(matriz, memorias, filas_por_bloque=1200):
+    """
+    Descriptor (serializable) para abrir una matriz int16 desde otro proceso
+    sin copiarla por pickle.
+
+    Un np.memmap contiguo se describe por su archivo, un MosaicoTerreno por
+    las rutas de sus archivos .hgt y un almacén por chunks
+    (almacen_chunks.AlmacenChunks) por su carpeta: cada proceso los abre y
+    solo lee lo que usa. Cualquier otra matriz (ndarray) se copia por franjas
+    a un bloque de memoria compartida. Los bloques creados se añaden a
+    `memorias`: quien llama debe cerrarlos y liberarlos (close/unlink) al
+    terminar.
+    """
+    if isinstance(matriz, np.memmap) and matriz.filename and matriz.flags.c_contiguous:
+        return ('memmap', matriz.filename, matriz.offset, matriz.shape, matriz.dtype.str)
+    if isinstance(matriz, MosaicoTerreno):
+        # Los archivos se abren como memmap en cada proceso (sin el caché LRU)
+        return ('mosaico', matriz.rutas, matriz.resolucion, tuple(matriz.shape), matriz.dtype.str)
+    if hasattr(matriz, 'estadisticas') and hasattr(matriz, 'carpeta'):
+        # Cada proceso abre el almacén y descomprime solo los chunks que usa
+        return ('chunks', matriz.carpeta, 0, tuple(matriz.shape), matriz.dtype.str)
+
+    tipo = np.dtype(np.int16)
+    memoria = shared_memory.SharedMemory(create=True, size=int(np.prod(matriz.shape)) * tipo.itemsize)
+    memorias.append(memoria)
+    destino = np.ndarray(matriz.shape, dtype=tipo, buffer=memoria.buf)
+    for i0 in range(0, matriz.shape[0], filas_por_bloque):
+        destino[i0:i0 + filas_por_bloque] = matriz[i0:i0 + filas_por_bloque, :]
+    return ('memoria', memoria.name, 0, tuple(matriz.shape), tipo.str)
+
+
+def abrir_matriz_compartida(descriptor, memorias):
+    """
+    Abre, de solo lectura, una matriz descrita por compartir_matriz.
+
+    Los bloques de memoria compartida abiertos se añaden a `memorias`; hay que
+    conservarlos mientras se use la matriz.
+    """
+    origen, nombre, offset, forma, dtype = descriptor
+    if origen == 'memmap':
+        return np.memmap(nombre, dtype=dtype, mode='r', offset=offset, shape=tuple(forma))
+    if origen == 'mosaico':
+        return MosaicoTerreno(nombre, offset)
+    if origen == 'chunks':
+        # Importación local: almacen_chunks importa este módulo
+        from almacen_chunks import AlmacenChunks
+        return AlmacenChunks(nombre)
+
+    memoria = shared_memory.SharedMemory(name=nombre)
+    memorias.append(memoria)
+    matriz = np.ndarray(tuple(forma), dtype=dtype, buffer=memoria.buf)
+    matriz.flags.writeable = False
+    return matriz
@@ -0,0 +1,965 @@
+"""
+MOTOR DE HORIZONTE - ECUADOR
+Cálculo vectorizado con NumPy de los perfiles de horizonte por rayos.
+
+💡 CARACTERÍSTICAS:
+- Todos los puntos de muestreo de un bloque de rayos se generan como una
+  matriz (rayos x pasos) y las elevaciones se leen con un solo indexado
+- Las ventanas contiguas por filas se leen como vector plano (np.take sobre
+  índices lineales, sin copia) y cada hilo reutiliza sus arreglos de trabajo
+- Los bloques de rayos se reparten en un pool de hilos que se crea una sola
+  vez por proceso
+- Máximo por rayo con argmax sobre la pendiente (dh / d), que ordena igual
+  que arctan2; el ángulo solo se calcula para la muestra elegida y para las
+  casi empatadas, que se resuelven con el ángulo redondeado como el bucle
+- Mismas reglas que el bucle original: se saltan las celdas -32768 y el rayo
+  se detiene al salir del mosaico
+"""
+
+import os
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from mosaico_terreno import NODATA
+
+# Elementos (rayos x pasos) procesados por bloque: acota los arreglos de
+# trabajo de cada hilo y los mantiene dentro de la caché del procesador
+MAX_ELEMENTOS_BLOQUE = 2 ** 18
+
+# Por debajo de estos elementos no compensa repartir los rayos en hilos
+MIN_ELEMENTOS_HILOS = 2 ** 17
+
+# Hilos por defecto para los bloques de rayos
+MAX_HILOS_RAYOS = min(8, os.cpu_count() or 1)
+
+# Pool de hilos compartido por todas las consultas (ver _pool_rayos)
+_pool_hilos = None
+_lock_pool = threading.Lock()
+
+
+def direcciones_rayos(angulos):
+    """
+    Componentes (di, dj) de cada rayo: i crece hacia el sur y j hacia el este.
+
+    Se calculan con math (como el bucle original) para que los índices de
+    muestreo coincidan exactamente.
+    """
+    di = np.array([-math.cos(math.radians(a)) for a in angulos], dtype=np.float64)
+    dj = np.array([math.sin(math.radians(a)) for a in angulos], dtype=np.float64)
+    return di, dj
+
+
+def elevaciones_rayos(terreno, origen, forma_mosaico, i_obs, j_obs, altura_total,
+                      angulos, max_pasos, paso_metros, max_elementos=None, num_hilos=None):
+    """
+    Elevación y distancia del horizonte para cada rayo.
+
+    Da las mismas elevaciones y distancias que el bucle original: cuando dos
+    muestras tienen el mismo ángulo redondeado gana la más cercana.
+
+    Los bloques de rayos son independientes y casi todo su trabajo son
+    operaciones de NumPy que liberan el GIL, así que se reparten en hilos:
+    el hilo que llama y num_hilos - 1 tareas del pool compartido. Cada
+    bloque escribe solo sus rayos: el resultado es el mismo que en serie.
+
+    Args:
+        terreno: Ventana int16 del mosaico que contiene todos los rayos.
+        origen: (i0, j0) índices globales de la esquina de la ventana.
+        forma_mosaico: (filas, columnas) del mosaico completo; los rayos se
+            detienen al salir de él.
+        i_obs, j_obs: Índices globales del observador.
+        altura_total: Altura del ojo del observador (m).
+        angulos: Azimut de cada rayo en grados.
+        max_pasos: Pasos (celdas) por rayo.
+        paso_metros: Metros por paso.
+        max_elementos: Tamaño máximo de cada bloque rayos x pasos (por
+            defecto, MAX_ELEMENTOS_BLOQUE).
+        num_hilos: Hilos para los bloques de rayos (por defecto,
+            MAX_HILOS_RAYOS; 1 = en serie, lo indicado dentro de procesos
+            trabajadores que ya se reparten los núcleos).
+
+    Returns:
+        elevaciones: Ángulo de elevación máximo de cada rayo (-90 si no hay datos).
+        distancias: Distancia (m) a la que se alcanza ese máximo (0 si no hay).
+    """
+    angulos = np.asarray(angulos, dtype=np.float64)
+    di, dj = direcciones_rayos(angulos)
+    elevaciones = np.full(len(angulos), -90.0)
+    distancias = np.zeros(len(angulos))
+    if max_pasos < 1 or len(angulos) == 0:
+        return elevaciones, distancias
+
+    pasos = np.arange(1, max_pasos + 1)
+    distancias_paso = pasos * paso_metros
+    rayos_por_bloque = max(1, (max_elementos or MAX_ELEMENTOS_BLOQUE) // max_pasos)
+    num_hilos = num_hilos or MAX_HILOS_RAYOS
+    if len(angulos) * max_pasos < MIN_ELEMENTOS_HILOS:
+        num_hilos = 1
+    if num_hilos > 1:
+        # Al menos dos bloques por hilo para repartir mejor la carga
+        rayos_por_bloque = min(rayos_por_bloque, -(-len(angulos) // (2 * num_hilos)))
+
+    # La lectura con índice plano es varias veces más rápida que el indexado
+    # 2D. Una ventana con filas contiguas (una rebanada del memmap del caché)
+    # se lee como vector sobre la misma memoria, sin copiarla; otra se copia
+    # si no es mucho mayor que las muestras
+    plana = vista_plana(terreno)
+    if plana is None and terreno.size <= 16 * len(angulos) * max_pasos:
+        plana = vista_plana(np.ascontiguousarray(terreno))
+
+    def calcular_bloque(r0):
+        r1 = min(len(angulos), r0 + rayos_por_bloque)
+        elevaciones[r0:r1], distancias[r0:r1] = _bloque_rayos(
+            terreno, plana, origen, forma_mosaico, i_obs, j_obs, altura_total,
+            di[r0:r1], dj[r0:r1], pasos, distancias_paso)
+
+    def calcular_bloques(inicios):
+        for r0 in inicios:
+            calcular_bloque(r0)
+
+    inicios = range(0, len(angulos), rayos_por_bloque)
+    num_hilos = min(num_hilos, len(inicios))
+    if num_hilos > 1:
+        # Cada hilo toma uno de cada num_hilos bloques; el que llama, los primeros
+        pool = _pool_rayos()
+        tareas = [pool.submit(calcular_bloques, inicios[k::num_hilos]) for k in range(1, num_hilos)]
+        calcular_bloques(inicios[0::num_hilos])
+        for tarea in tareas:
+            tarea.result()
+    else:
+        calcular_bloques(inicios)
+
+    return elevaciones, distancias
+
+
+def _pool_rayos():
+    """
+    Pool de hilos de elevaciones_rayos, creado la primera vez que se usa y
+    reutilizado después. Un proceso hijo creado con fork hereda el objeto
+    pero no sus hilos, así que crea el suyo.
+    """
+    global _pool_hilos
+    with _lock_pool:
+        if _pool_hilos is None or _pool_hilos[0] != os.getpid():
+            _pool_hilos = (os.getpid(), ThreadPoolExecutor(max_workers=MAX_HILOS_RAYOS,
+                                                           thread_name_prefix='rayos'))
+        return _pool_hilos[1]
+
+
+# Arreglos de trabajo de _bloque_rayos, uno por hilo (ver _arreglos_trabajo)
+_trabajo_hilo = threading.local()
+
+
+def _arreglos_trabajo(forma):
+    """
+    Arreglos float64, intp e int16 de la forma dada, reutilizados entre
+    llamadas del mismo hilo (como mucho MAX_ELEMENTOS_BLOQUE elementos).
+    """
+    n = forma[0] * forma[1]
+    arreglos = getattr(_trabajo_hilo, 'arreglos', None)
+    if arreglos is None or arreglos[0].size < n:
+        arreglos = (np.empty(n), np.empty(n, dtype=np.intp), np.empty(n, dtype=np.int16))
+        _trabajo_hilo.arreglos = arreglos
+    return tuple(a[:n].reshape(forma) for a in arreglos)
+
+
+def vista_plana(terreno):
+    """
+    Vista 1D, sin copia, de una ventana 2D cuyas filas son contiguas.
+
+    Returns:
+        (vector, ancho_fila): la celda (i, j) está en vector[i * ancho_fila + j];
+        None si las filas de la ventana no son contiguas.
+    """
+    tamano = terreno.itemsize
+    if (terreno.ndim != 2 or terreno.size == 0 or terreno.strides[1] != tamano or
+            terreno.strides[0] <= 0 or terreno.strides[0] % tamano):
+        return None
+    ancho_fila = terreno.strides[0] // tamano
+    longitud = (terreno.shape[0] - 1) * ancho_fila + terreno.shape[1]
+    vector = np.lib.stride_tricks.as_strided(terreno, shape=(longitud,), strides=(tamano,),
+                                             writeable=False)
+    return vector, ancho_fila
+
+
+def _bloque_rayos(terreno, plana, origen, forma_mosaico, i_obs, j_obs, altura_total,
+                  di, dj, pasos, distancias_paso):
+    """
+    Evalúa un bloque de rayos completo con operaciones vectorizadas.
+
+    `plana` es la vista_plana de `terreno` o None para leer con índices 2D.
+    """
+    i0, j0 = origen
+    filas, columnas = forma_mosaico
+
+    # El rayo se detiene en la primera muestra fuera del mosaico. Si todos
+    # los rayos caben en el mosaico (caso habitual) no hace falta comprobarlo.
+    alcance = len(pasos)
+    dentro_mosaico = (i_obs - alcance >= 0 and i_obs + alcance < filas and
+                      j_obs - alcance >= 0 and j_obs + alcance < columnas)
+    activo = None
+
+    if dentro_mosaico and plana is not None:
+        # Caso habitual: índice plano y pendientes en los arreglos de trabajo
+        # del hilo, sin reservar memoria nueva en cada consulta
+        flotante, indice, alturas = _arreglos_trabajo((len(di), len(pasos)))
+        vector, ancho_fila = plana
+        np.multiply.outer(di, pasos, out=flotante)
+        flotante += i_obs
+        # La conversión trunca igual que int()
+        np.copyto(indice, flotante, casting='unsafe')
+        indice -= i0
+        indice *= ancho_fila
+        np.multiply.outer(dj, pasos, out=flotante)
+        flotante += j_obs
+        np.trunc(flotante, out=flotante)
+        flotante -= j0
+        np.add(indice, flotante, out=indice, casting='unsafe')
+        # mode='clip' evita que take copie la salida (los índices ya son válidos)
+        np.take(vector, indice, out=alturas, mode='clip')
+        pendientes = flotante
+    else:
+        # Índices de todas las muestras (astype trunca igual que int())
+        i_actual = (i_obs + np.multiply.outer(di, pasos)).astype(np.intp)
+        j_actual = (j_obs + np.multiply.outer(dj, pasos)).astype(np.intp)
+        if not dentro_mosaico:
+            dentro = (i_actual >= 0) & (i_actual < filas) & (j_actual >= 0) & (j_actual < columnas)
+            activo = np.logical_and.accumulate(dentro, axis=1)
+
+        # Lectura de todas las muestras con un solo indexado sobre la ventana
+        i_actual -= i0
+        j_actual -= j0
+        if activo is not None:
+            fuera = ~activo
+            i_actual[fuera] = 0
+            j_actual[fuera] = 0
+        if plana is not None:
+            vector, ancho_fila = plana
+            i_actual *= ancho_fila
+            i_actual += j_actual
+            alturas = np.take(vector, i_actual)
+        else:
+            alturas = terreno[i_actual, j_actual]
+        pendientes = np.empty(alturas.shape)
+    validos = alturas != NODATA
+    if activo is not None:
+        validos &= activo
+
+    # atan2(dh, d) es creciente en dh / d para d > 0: se busca el máximo
+    # sobre la pendiente y solo se calcula el ángulo de la muestra elegida
+    np.subtract(alturas, altura_total, out=pendientes, dtype=np.float64)
+    pendientes /= distancias_paso
+    if not validos.all():
+        pendientes[~validos] = -np.inf
+
+    # argmax devuelve la primera muestra con la pendiente máxima; los casi
+    # empates se deciden después con el ángulo, como el bucle original
+    filas_rayos = np.arange(len(di))
+    mejor = np.argmax(pendientes, axis=1)
+    hay_horizonte = validos[filas_rayos, mejor]
+    _desempatar(pendientes, alturas, altura_total, distancias_paso, filas_rayos, mejor)
+
+    elevaciones = np.full(len(di), -90.0)
+    distancias = np.zeros(len(di))
+    rayos = np.flatnonzero(hay_horizonte)
+    distancias[rayos] = distancias_paso[mejor[rayos]]
+    diferencias = np.subtract(alturas[rayos, mejor[rayos]], altura_total, dtype=np.float64)
+    # math.atan2 sobre los máximos para reproducir el bucle bit a bit
+    elevaciones[rayos] = [math.degrees(math.atan2(dh, d)) for dh, d in
+                          zip(diferencias.tolist(), distancias[rayos].tolist())]
+    return elevaciones, distancias
+
+
+def _umbral_empate(maximo):
+    """
+    Menor pendiente cuyo ángulo redondeado (degrees(atan2)) puede igualar o
+    superar al de la pendiente `maximo`: margen holgado frente al redondeo.
+    """
+    return maximo - 1e-12 * np.abs(maximo) * (1 + maximo * maximo)
+
+
+def _desempatar(pendientes, alturas, altura_total, distancias_paso, filas_rayos, mejor):
+    """
+    Corrige `mejor` en los rayos donde otra muestra tiene casi la misma
+    pendiente que la máxima.
+
+    El bucle original compara ángulos redondeados (degrees(atan2)), no
+    pendientes: dos muestras con pendientes que difieren en el último bit
+    pueden dar el mismo ángulo, y entonces gana la primera. Solo en esos
+    rayos (raros) se calculan los ángulos de las candidatas con math, como
+    el bucle. Modifica `pendientes` (la fila de trabajo) y `mejor`.
+    """
+    maximo = pendientes[filas_rayos, mejor]
+    umbral = _umbral_empate(maximo)
+    pendientes[filas_rayos, mejor] = -np.inf
+    segundo = np.max(pendientes, axis=1)
+    pendientes[filas_rayos, mejor] = maximo
+    for r in np.flatnonzero((segundo >= umbral) & (segundo > -np.inf)).tolist():
+        mejor_angulo = -math.inf
+        for k in np.flatnonzero(pendientes[r] >= umbral[r]).tolist():
+            angulo = math.degrees(math.atan2(float(alturas[r, k]) - altura_total,
+                                             float(distancias_paso[k])))
+            if angulo > mejor_angulo:
+                mejor_angulo, mejor[r] = angulo, k
+
+
+# --- Pirámide de máximos para saltar tramos de los rayos ---
+
+# Niveles de la pirámide: el más grueso resume bloques de 2**6 = 64 celdas
+NIVELES_PIRAMIDE = 6
+
+
+def reducir_maximo(matriz, filas_por_bloque=2400):
+    """
+    Siguiente nivel de la pirámide: máximo de cada bloque de 2x2 celdas.
+
+    -32768 es el menor int16, así que un bloque solo queda sin datos si
+    todas sus celdas lo están. Se recorre por franjas de filas para no
+    cargar matrices grandes (memmap, MosaicoTerreno) completas en memoria.
+
+    Args:
+        matriz: Nivel anterior (cualquier objeto con .shape y rebanadas).
+        filas_por_bloque: Filas leídas en cada franja (par).
+
+    Returns:
+        Matriz int16 de forma (ceil(filas/2), ceil(columnas/2)).
+    """
+    filas, columnas = matriz.shape
+    salida = np.empty(((filas + 1) // 2, (columnas + 1) // 2), dtype=np.int16)
+
+    for i0 in range(0, filas, filas_por_bloque):
+        franja = np.asarray(matriz[i0:i0 + filas_por_bloque, :])
+        alto, ancho = franja.shape
+        if alto % 2 or ancho % 2:
+            franja = np.pad(franja, ((0, alto % 2), (0, ancho % 2)), constant_values=NODATA)
+        franja = franja.reshape(franja.shape[0] // 2, 2, franja.shape[1] // 2, 2)
+        salida[i0 // 2:i0 // 2 + franja.shape[0]] = franja.max(axis=(1, 3))
+
+    return salida
+
+
+def construir_piramide(terreno, num_niveles=NIVELES_PIRAMIDE):
+    """
+    Pirámide de máximos en memoria: niveles[0] es el terreno y niveles[k]
+    guarda el máximo de cada bloque de 2**k x 2**k celdas.
+    """
+    niveles = [terreno]
+    for _ in range(num_niveles):
+        niveles.append(reducir_maximo(niveles[-1]))
+    return niveles
+
+
+def _celdas(i_obs, j_obs, di, dj, pasos):
+    """Celdas (i, j) muestreadas en los pasos dados (astype trunca igual que int())."""
+    return (i_obs + di * pasos).astype(np.intp), (j_obs + dj * pasos).astype(np.intp)
+
+
+def _leer_celdas(matriz, i, j):
+    """Valores de las celdas (i, j); con arreglos contiguos usa un índice plano, más rápido."""
+    if isinstance(matriz, np.ndarray) and matriz.flags.c_contiguous:
+        return np.take(matriz.reshape(-1), i * matriz.shape[1] + j)
+    return np.asarray(matriz[i, j])
+
+
+def _pasos_dentro(forma_mosaico, i_obs, j_obs, di, dj, max_pasos):
+    """
+    Último paso de cada rayo antes de salir del mosaico (como mucho max_pasos).
+
+    Filas y columnas muestreadas son monótonas a lo largo del rayo, así que
+    basta una búsqueda binaria vectorizada sobre el número de paso.
+    """
+    filas, columnas = forma_mosaico
+    dentro_hasta = np.zeros(len(di), dtype=np.int64)
+    fuera_desde = np.full(len(di), max_pasos + 1, dtype=np.int64)
+
+    while True:
+        pendientes = fuera_desde - dentro_hasta > 1
+        if not pendientes.any():
+            return dentro_hasta
+        medio = (dentro_hasta + fuera_desde) // 2
+        i, j = _celdas(i_obs, j_obs, di, dj, medio)
+        dentro = (i >= 0) & (i < filas) & (j >= 0) & (j < columnas)
+        dentro_hasta = np.where(pendientes & dentro, medio, dentro_hasta)
+        fuera_desde = np.where(pendientes & ~dentro, medio, fuera_desde)
+
+
+def _pendientes_muestras(terreno, i_obs, j_obs, di, dj, altura_total, paso_metros, rayos, pasos):
+    """Pendiente (dh / d) de muestras sueltas (rayo, paso); -inf en celdas sin datos."""
+    i, j = _celdas(i_obs, j_obs, di[rayos], dj[rayos], pasos)
+    alturas = _leer_celdas(terreno, i, j)
+    pendientes = np.subtract(alturas, altura_total, dtype=np.float64)
+    pendientes /= pasos * paso_metros
+    pendientes[alturas == NODATA] = -np.inf
+    return pendientes
+
+
+def elevaciones_rayos_piramide(niveles, i_obs, j_obs, altura_total, angulos, max_pasos, paso_metros):
+    """
+    Igual que elevaciones_rayos, pero sin recorrer los tramos del rayo cuyo
+    terreno no puede superar el horizonte ya encontrado.
+
+    Los primeros 2**K pasos se evalúan completos. El resto del rayo se divide
+    en tramos de 2**K pasos, cuyas celdas caben en 2x2 bloques del nivel K:
+    su máximo acota la pendiente de todo el tramo. Los tramos cuya cota no
+    alcanza la mayor pendiente conocida del rayo se descartan y los demás se
+    parten en dos y se revisan en el nivel inferior, hasta llegar a celdas.
+    El resultado es idéntico al de elevaciones_rayos, también en los empates.
+
+    Args:
+        niveles: Pirámide de máximos (ver construir_piramide); niveles[0] es
+            el mosaico completo con índices globales.
+        i_obs, j_obs: Índices globales del observador.
+        altura_total: Altura del ojo del observador (m).
+        angulos: Azimut de cada rayo en grados.
+        max_pasos: Pasos (celdas) por rayo.
+        paso_metros: Metros por paso.
+
+    Returns:
+        elevaciones, distancias: Igual que elevaciones_rayos.
+    """
+    angulos = np.asarray(angulos, dtype=np.float64)
+    di, dj = direcciones_rayos(angulos)
+    num_rayos = len(angulos)
+    elevaciones = np.full(num_rayos, -90.0)
+    distancias = np.zeros(num_rayos)
+    if max_pasos < 1 or num_rayos == 0:
+        return elevaciones, distancias
+
+    terreno = niveles[0]
+    ultimo = _pasos_dentro(terreno.shape, i_obs, j_obs, di, dj, max_pasos)
+    nivel_max = len(niveles) - 1
+    muestras = []
+
+    def evaluar(rayos, pasos):
+        pendientes = _pendientes_muestras(terreno, i_obs, j_obs, di, dj, altura_total,
+                                          paso_metros, rayos, pasos)
+        np.maximum.at(mejor, rayos, pendientes)
+        muestras.append((rayos, pasos, pendientes))
+
+    # Campo cercano completo: da la primera cota inferior de cada rayo
+    mejor = np.full(num_rayos, -np.inf)
+    cercanos = min(max_pasos, 2 ** nivel_max)
+    rayos = np.repeat(np.arange(num_rayos), cercanos)
+    pasos = np.tile(np.arange(1, cercanos + 1), num_rayos)
+    dentro = pasos <= ultimo[rayos]
+    evaluar(rayos[dentro], pasos[dentro])
+
+    # Tramos lejanos: se descartan por nivel, de los bloques grandes a las celdas
+    inicios = np.arange(cercanos + 1, max_pasos + 1, 2 ** nivel_max)
+    rayos = np.repeat(np.arange(num_rayos), len(inicios))
+    pasos = np.tile(inicios, num_rayos)
+    for nivel in range(nivel_max, 0, -1):
+        dentro = pasos <= ultimo[rayos]
+        rayos, pasos = rayos[dentro], pasos[dentro]
+        if len(rayos) == 0:
+            break
+
+        fin = np.minimum(pasos + 2 ** nivel - 1, ultimo[rayos])
+        ia, ja = _celdas(i_obs, j_obs, di[rayos], dj[rayos], pasos)
+        ib, jb = _celdas(i_obs, j_obs, di[rayos], dj[rayos], fin)
+        ia >>= nivel
+        ja >>= nivel
+        ib >>= nivel
+        jb >>= nivel
+        bloques = niveles[nivel]
+        maximo = np.maximum(np.maximum(_leer_celdas(bloques, ia, ja), _leer_celdas(bloques, ia, jb)),
+                            np.maximum(_leer_celdas(bloques, ib, ja), _leer_celdas(bloques, ib, jb)))
+
+        # Cota de la pendiente: la distancia más corta del tramo si el bloque
+        # sobresale del observador y la más larga si queda por debajo
+        diferencia = np.subtract(maximo, altura_total, dtype=np.float64)
+        cota = diferencia / np.where(diferencia >= 0, pasos * paso_metros, fin * paso_metros)
+        conservar = cota >= _umbral_empate(mejor[rayos])
+        rayos, pasos = rayos[conservar], pasos[conservar]
+
+        # La primera muestra de cada tramo que sigue afina la cota inferior
+        evaluar(rayos, pasos)
+        mitad = 2 ** (nivel - 1)
+        rayos = np.concatenate([rayos, rayos])
+        pasos = np.concatenate([pasos, pasos + mitad])
+
+    dentro = pasos <= ultimo[rayos]
+    evaluar(rayos[dentro], pasos[dentro])
+
+    # Candidatas: muestras cuya pendiente puede dar el ángulo máximo (ver
+    # _umbral_empate). Se recorren por rayo y paso con la comparación
+    # estricta del bucle original: gana la primera con el mayor ángulo
+    rayos, pasos, pendientes = (np.concatenate(partes) for partes in zip(*muestras))
+    candidata = (pendientes >= _umbral_empate(mejor)[rayos]) & (pendientes > -np.inf)
+    rayos, pasos = rayos[candidata], pasos[candidata]
+    orden = np.lexsort((pasos, rayos))
+    rayos, pasos = rayos[orden], pasos[orden]
+    i, j = _celdas(i_obs, j_obs, di[rayos], dj[rayos], pasos)
+    diferencias = np.subtract(_leer_celdas(terreno, i, j), altura_total, dtype=np.float64)
+    elevacion, distancia = elevaciones.tolist(), distancias.tolist()
+    for r, p, dh in zip(rayos.tolist(), pasos.tolist(), diferencias.tolist()):
+        angulo = math.degrees(math.atan2(dh, p * paso_metros))
+        if angulo > elevacion[r]:
+            elevacion[r] = angulo
+            distancia[r] = p * paso_metros
+    return np.array(elevacion), np.array(distancia)
+
+
+# --- Muestreo adaptativo según la distancia ---
+
+def pasos_adaptativos(max_pasos, tolerancia_angular, nivel_max=NIVELES_PIRAMIDE):
+    """
+    Pasos de muestreo de un rayo cuyo espaciado crece con la distancia.
+
+    A p pasos del observador se usa el nivel k de la pirámide (bloques de
+    2**k celdas) más grueso que cumple 2**k / p <= tolerancia: un bloque, y
+    el espaciado entre muestras, nunca abarca más de tolerancia_angular
+    vistos desde el observador.
+
+    Args:
+        max_pasos: Pasos (celdas) por rayo.
+        tolerancia_angular: Error angular admitido en grados.
+        nivel_max: Nivel más grueso disponible.
+
+    Returns:
+        pasos: Paso (en celdas) de cada muestra, creciente.
+        niveles: Nivel de la pirámide del que se lee cada muestra.
+    """
+    tolerancia = math.radians(tolerancia_angular)
+    pasos = []
+    niveles = []
+    inicio = 1
+    for nivel in range(nivel_max + 1):
+        if nivel == nivel_max or tolerancia <= 0:
+            fin = max_pasos
+        else:
+            # Último paso p con tolerancia * p < 2**(nivel + 1)
+            fin = min(max_pasos, math.ceil(2 ** (nivel + 1) / tolerancia) - 1)
+        if fin >= inicio:
+            tramo = np.arange(inicio, fin + 1, 2 ** nivel)
+            pasos.append(tramo)
+            niveles.append(np.full(len(tramo), nivel))
+            inicio = int(tramo[-1]) + 2 ** nivel
+        if inicio > max_pasos:
+            break
+    if not pasos:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(pasos), np.concatenate(niveles)
+
+
+def _celdas_activas(i_obs, j_obs, di, dj, pasos, activo):
+    """Celdas (rayos x muestras) de los pasos dados; las inactivas se fijan en (0, 0)."""
+    i = (i_obs + di[:, None] * pasos).astype(np.intp)
+    j = (j_obs + dj[:, None] * pasos).astype(np.intp)
+    i[~activo] = 0
+    j[~activo] = 0
+    return i, j
+
+
+def elevaciones_rayos_adaptativo(niveles, i_obs, j_obs, altura_total, angulos, max_pasos,
+                                 paso_metros, tolerancia_angular):
+    """
+    Horizonte aproximado con muestreo que se espacia con la distancia.
+
+    Las muestras lejanas se leen de la pirámide de máximos. Cada muestra
+    toma la celda más alta de los bloques que el rayo cruza hasta la muestra
+    siguiente (su bloque y los vecinos del cuadro 2x2 que forma con el de la
+    siguiente), así que no se pierden picos aislados entre dos muestras.
+    El coste crece con el logaritmo de la distancia en lugar de con la
+    distancia; el error del ángulo por la posición de las muestras queda
+    acotado por tolerancia_angular.
+
+    Args:
+        niveles: Pirámide de máximos (ver construir_piramide).
+        i_obs, j_obs: Índices globales del observador.
+        altura_total: Altura del ojo del observador (m).
+        angulos: Azimut de cada rayo en grados.
+        max_pasos: Pasos (celdas) por rayo.
+        paso_metros: Metros por paso.
+        tolerancia_angular: Error angular admitido en grados.
+
+    Returns:
+        elevaciones, distancias: Igual que elevaciones_rayos.
+    """
+    angulos = np.asarray(angulos, dtype=np.float64)
+    di, dj = direcciones_rayos(angulos)
+    num_rayos = len(angulos)
+    elevaciones = np.full(num_rayos, -90.0)
+    distancias = np.zeros(num_rayos)
+    pasos, nivel_paso = pasos_adaptativos(max_pasos, tolerancia_angular, len(niveles) - 1)
+    if len(pasos) == 0 or num_rayos == 0:
+        return elevaciones, distancias
+
+    ultimo = _pasos_dentro(niveles[0].shape, i_obs, j_obs, di, dj, max_pasos)
+    activo = pasos[None, :] <= ultimo[:, None]
+    i_actual, j_actual = _celdas_activas(i_obs, j_obs, di, dj, pasos, activo)
+
+    # Posición siguiente de cada muestra: la próxima muestra o, al final del
+    # rayo, su último paso dentro del mosaico
+    siguientes = np.append(pasos[1:], pasos[-1] + 2 ** nivel_paso[-1])
+    siguientes = np.minimum(siguientes[None, :], ultimo[:, None])
+    i_sig, j_sig = _celdas_activas(i_obs, j_obs, di, dj, siguientes, activo)
+
+    # Los pasos están ordenados por nivel: cada tramo de columnas se lee
+    # de su nivel de la pirámide. Entre dos muestras el rayo avanza como
+    # mucho un bloque por eje, así que cruza bloques dentro del cuadro 2x2
+    # que forman los de ambas muestras; en el nivel 0 no hay celdas
+    # intermedias y basta con la de la muestra
+    alturas = np.empty(i_actual.shape, dtype=np.int16)
+    for nivel in np.unique(nivel_paso):
+        columnas = np.flatnonzero(nivel_paso == nivel)
+        tramo = slice(columnas[0], columnas[-1] + 1)
+        bi, bj = i_actual[:, tramo] >> nivel, j_actual[:, tramo] >> nivel
+        alturas[:, tramo] = _leer_celdas(niveles[nivel], bi, bj)
+        if nivel > 0:
+            bi_sig, bj_sig = i_sig[:, tramo] >> nivel, j_sig[:, tramo] >> nivel
+            for filas, cols in ((bi, bj_sig), (bi_sig, bj)):
+                np.maximum(alturas[:, tramo], _leer_celdas(niveles[nivel], filas, cols),
+                           out=alturas[:, tramo])
+            # El bloque de la siguiente muestra ya lo lee ella, salvo en la
+            # última del tramo (cambia de nivel o termina el rayo)
+            np.maximum(alturas[:, tramo.stop - 1], _leer_celdas(niveles[nivel], bi_sig[:, -1], bj_sig[:, -1]),
+                       out=alturas[:, tramo.stop - 1])
+    validos = activo & (alturas != NODATA)
+
+    distancias_paso = pasos * paso_metros
+    pendientes = np.subtract(alturas, altura_total, dtype=np.float64)
+    pendientes /= distancias_paso
+    pendientes[~validos] = -np.inf
+
+    mejor = np.argmax(pendientes, axis=1)
+    rayos = np.flatnonzero(validos[np.arange(num_rayos), mejor])
+    distancias[rayos] = distancias_paso[mejor[rayos]]
+    diferencias = np.subtract(alturas[rayos, mejor[rayos]], altura_total, dtype=np.float64)
+    elevaciones[rayos] = [math.degrees(math.atan2(dh, d)) for dh, d in
+                          zip(diferencias.tolist(), distancias[rayos].tolist())]
+    return elevaciones, distancias
+
+
+# --- Resolución angular adaptativa ---
+
+def refinar_horizonte(evaluar, angulos, tolerancia_elevacion, tolerancia_distancia, max_profundidad):
+    """
+    Biseca los intervalos entre rayos vecinos donde el horizonte cambia.
+
+    Se parte de los rayos de `angulos`. En cada nivel se añade un rayo en
+    medio de cada par de vecinos cuyas elevaciones difieren en más de
+    tolerancia_elevacion grados o cuyas distancias difieren en más de
+    tolerancia_distancia veces la mayor de las dos (el horizonte salta a
+    otra cresta). Todos los rayos nuevos de un nivel se evalúan juntos.
+
+    Args:
+        evaluar: Función angulos -> (elevaciones, distancias), por ejemplo
+            elevaciones_rayos con el resto de argumentos fijados.
+        angulos: Azimuts iniciales en grados, crecientes.
+        tolerancia_elevacion: Diferencia de elevación admitida (grados).
+        tolerancia_distancia: Diferencia relativa de distancia admitida.
+        max_profundidad: Niveles de bisección como máximo.
+
+    Returns:
+        angulos, elevaciones, distancias: Arreglos ordenados por azimut, con
+        como mucho (len(angulos) - 1) * 2**max_profundidad + 1 rayos.
+    """
+    angulos = np.asarray(angulos, dtype=np.float64)
+    elevaciones, distancias = evaluar(angulos)
+
+    for _ in range(max_profundidad):
+        if len(angulos) < 2:
+            break
+        salto_elevacion = np.abs(np.diff(elevaciones)) > tolerancia_elevacion
+        salto_distancia = (np.abs(np.diff(distancias)) >
+                           tolerancia_distancia * np.maximum(distancias[:-1], distancias[1:]))
+        intervalos = np.flatnonzero(salto_elevacion | salto_distancia)
+        if len(intervalos) == 0:
+            break
+
+        medios = (angulos[intervalos] + angulos[intervalos + 1]) / 2
+        elevaciones_medio, distancias_medio = evaluar(medios)
+        # np.insert coloca cada rayo nuevo justo después del inicio de su intervalo
+        angulos = np.insert(angulos, intervalos + 1, medios)
+        elevaciones = np.insert(elevaciones, intervalos + 1, elevaciones_medio)
+        distancias = np.insert(distancias, intervalos + 1, distancias_medio)
+
+    return angulos, elevaciones, distancias
+
+
+# --- Actualización incremental al mover el observador ---
+
+# Pasos del campo cercano que se recalculan siempre en modo incremental
+PASOS_CERCANOS_INCREMENTAL = 256
+
+# Pasos de cada tramo del campo lejano que se resume en una sola muestra
+TAM_TRAMO_INCREMENTAL = 16
+
+TramosLejanos = namedtuple('TramosLejanos', ['i', 'j', 'alturas', 'primer_paso'])
+
+
+def tramos_lejanos(terreno, origen, forma_mosaico, i_obs, j_obs, altura_total, angulos,
+                   pasos_cerca, max_pasos, tam_tramo=TAM_TRAMO_INCREMENTAL,
+                   max_elementos=MAX_ELEMENTOS_BLOQUE):
+    """
+    Muestra dominante de cada tramo del campo lejano de cada rayo.
+
+    Los pasos pasos_cerca+1..max_pasos se dividen en tramos de tam_tramo
+    pasos y de cada uno se guarda la muestra de mayor pendiente vista desde
+    el observador: son los candidatos a horizonte lejano que reutiliza
+    elevaciones_incrementales.
+
+    Args:
+        terreno, origen, forma_mosaico, i_obs, j_obs, altura_total, angulos:
+            Igual que en elevaciones_rayos.
+        pasos_cerca: Pasos del campo cercano (no se resumen).
+        max_pasos: Pasos (celdas) por rayo.
+        tam_tramo: Pasos por tramo.
+
+    Returns:
+        TramosLejanos(i, j, alturas, primer_paso): matrices (rayos x tramos)
+        con la posición global exacta de la muestra sobre el rayo y su altura
+        (NaN si el tramo no tiene datos), y el paso en que empieza el primer
+        tramo (pasos_cerca + 1).
+    """
+    angulos = np.asarray(angulos, dtype=np.float64)
+    di, dj = direcciones_rayos(angulos)
+    num_tramos = max(0, -(-(max_pasos - pasos_cerca) // tam_tramo))
+    forma = (len(angulos), num_tramos)
+    tramos = TramosLejanos(np.full(forma, np.nan), np.full(forma, np.nan), np.full(forma, np.nan),
+                           pasos_cerca + 1)
+    if num_tramos == 0 or len(angulos) == 0:
+        return tramos
+
+    i0, j0 = origen
+    pasos = np.arange(pasos_cerca + 1, pasos_cerca + 1 + num_tramos * tam_tramo)
+    ultimo = _pasos_dentro(forma_mosaico, i_obs, j_obs, di, dj, max_pasos)
+    columnas = np.arange(num_tramos) * tam_tramo
+    rayos_por_bloque = max(1, max_elementos // len(pasos))
+
+    for r0 in range(0, len(angulos), rayos_por_bloque):
+        r = slice(r0, min(len(angulos), r0 + rayos_por_bloque))
+        pos_i = i_obs + np.multiply.outer(di[r], pasos)
+        pos_j = j_obs + np.multiply.outer(dj[r], pasos)
+        activo = pasos[None, :] <= ultimo[r, None]
+        alturas = _leer_celdas(terreno, np.where(activo, pos_i.astype(np.intp) - i0, 0),
+                               np.where(activo, pos_j.astype(np.intp) - j0, 0))
+
+        pendientes = np.subtract(alturas, altura_total, dtype=np.float64)
+        pendientes /= pasos
+        pendientes[~activo | (alturas == NODATA)] = -np.inf
+        pendientes = pendientes.reshape(-1, num_tramos, tam_tramo)
+        mejor = np.argmax(pendientes, axis=2)
+        validos = np.take_along_axis(pendientes, mejor[..., None], axis=2)[..., 0] > -np.inf
+
+        muestra = mejor + columnas
+        tramos.i[r] = np.where(validos, np.take_along_axis(pos_i, muestra, axis=1), np.nan)
+        tramos.j[r] = np.where(validos, np.take_along_axis(pos_j, muestra, axis=1), np.nan)
+        tramos.alturas[r] = np.where(validos, np.take_along_axis(alturas, muestra, axis=1), np.nan)
+
+    return tramos
+
+
+def elevaciones_incrementales(tramos, terreno, origen, forma_mosaico, i_obs, j_obs, altura_total,
+                              angulos, pasos_cerca, max_pasos, paso_metros,
+                              tam_tramo=TAM_TRAMO_INCREMENTAL):
+    """
+    Horizonte aproximado tras un desplazamiento pequeño del observador.
+
+    El campo cercano (pasos_cerca pasos) se recalcula completo desde la
+    nueva posición. Del campo lejano solo se reevalúan, con su distancia
+    real a la nueva posición, los candidatos de tramos_lejanos que quedan
+    más allá de pasos_cerca.
+
+    Los candidatos están sobre el rayo de la posición de referencia, a δ
+    celdas (el desplazamiento) del rayo nuevo: el error lo dominan los más
+    cercanos, porque el terreno cambia de una celda a otra y la diferencia
+    pesa más cuanto más cerca está. Por eso quien llama agranda pasos_cerca
+    en proporción a δ (ver PASOS_CERCANOS_INCREMENTAL).
+
+    Args:
+        tramos: TramosLejanos calculados en la posición de referencia.
+        terreno, origen: Ventana que cubre pasos_cerca alrededor del observador.
+        forma_mosaico, i_obs, j_obs, altura_total, angulos: Igual que en
+            elevaciones_rayos (posición nueva).
+        pasos_cerca: Pasos del campo cercano (>= tramos.primer_paso - 1).
+        max_pasos: Pasos (celdas) por rayo; si el campo cercano llega a
+            max_pasos el resultado es exacto.
+        paso_metros: Metros por paso.
+        tam_tramo: Pasos por tramo con que se calcularon los tramos.
+
+    Returns:
+        elevaciones, distancias: Igual que elevaciones_rayos.
+    """
+    elevaciones, distancias = elevaciones_rayos(terreno, origen, forma_mosaico, i_obs, j_obs,
+                                                altura_total, angulos, pasos_cerca, paso_metros)
+    if pasos_cerca >= max_pasos:
+        return elevaciones, distancias
+
+    # Los tramos que el campo cercano ya recorre entero no aportan nada
+    cubiertos = max(0, (pasos_cerca - tramos.primer_paso + 1) // tam_tramo)
+    tramos_i = tramos.i[:, cubiertos:]
+    tramos_j = tramos.j[:, cubiertos:]
+    tramos_alturas = tramos.alturas[:, cubiertos:]
+    if tramos_alturas.shape[1] == 0:
+        return elevaciones, distancias
+
+    distancia_tramos = np.hypot(tramos_i - i_obs, tramos_j - j_obs) * paso_metros
+    pendientes = (tramos_alturas - altura_total) / distancia_tramos
+    pendientes[np.isnan(pendientes)] = -np.inf
+    mejor = np.argmax(pendientes, axis=1)
+
+    # El campo lejano solo gana si supera estrictamente al cercano (como argmax)
+    rayos = np.flatnonzero(pendientes[np.arange(len(mejor)), mejor] > -np.inf)
+    diferencias = tramos_alturas[rayos, mejor[rayos]] - altura_total
+    lejanas = distancia_tramos[rayos, mejor[rayos]]
+    angulo_lejano = np.degrees(np.arctan2(diferencias, lejanas))
+    gana = angulo_lejano > elevaciones[rayos]
+    elevaciones[rayos[gana]] = angulo_lejano[gana]
+    distancias[rayos[gana]] = lejanas[gana]
+    return elevaciones, distancias
+
+
+# --- Panorama de 360° por celdas ---
+
+# Celdas del mayor cuadrado cuya geometría se guarda entre consultas (radio ~1000)
+MAX_CELDAS_GEOMETRIA = 2 ** 22
+
+
+def _sectores_celdas(di, dj, num_bins):
+    """
+    Sectores de azimut que cubre cada celda (di, dj) relativa al observador.
+
+    Cada celda cubre su azimut ± el semiancho angular del círculo que la
+    circunscribe. Casi todas caen en uno o dos sectores; solo las cercanas
+    se reparten entre más.
+
+    Returns:
+        celda: Índice de la celda de cada entrada.
+        bins: Sector de cada entrada.
+    """
+    radio = np.sqrt(di * di + dj * dj).astype(np.float32)
+    azimut = np.arctan2(dj.astype(np.float32), -di.astype(np.float32))
+    # asin(x) ~ x + x**3/6 salvo en las celdas más cercanas
+    x = np.float32(np.sqrt(0.5)) / radio
+    semiancho = x + x ** 3 / 6
+    cerca = radio < 16
+    semiancho[cerca] = np.arcsin(x[cerca])
+
+    # Se suma num_bins para que la truncación de astype sea un floor
+    bins_por_radian = num_bins / (2 * np.pi)
+    primero = ((azimut - semiancho) * bins_por_radian + (num_bins + 0.5)).astype(np.int64)
+    ultimo = ((azimut + semiancho) * bins_por_radian + (num_bins + 0.5)).astype(np.int64)
+    cuantos = np.minimum(ultimo - primero + 1, num_bins)
+
+    celda = [np.arange(len(primero)), np.flatnonzero(cuantos >= 2)]
+    bins = [primero, primero[celda[1]] + 1]
+    extra = np.flatnonzero(cuantos >= 3)
+    if len(extra):
+        repeticiones = cuantos[extra] - 2
+        celda.append(np.repeat(extra, repeticiones))
+        inicio = np.repeat(np.cumsum(repeticiones) - repeticiones, repeticiones)
+        bins.append(primero[celda[2]] + 2 + np.arange(len(celda[2])) - inicio)
+    return np.concatenate(celda), np.concatenate(bins) % num_bins
+
+
+@lru_cache(maxsize=2)
+def _geometria_panorama(max_pasos, num_bins):
+    """
+    Geometría del círculo de radio max_pasos, que no depende del terreno:
+    posición plana de cada celda en el cuadrado (2R+1)x(2R+1), su radio en
+    celdas y los sectores que cubre. Se reutiliza entre observadores.
+    """
+    lado = 2 * max_pasos + 1
+    desplazamiento = np.arange(lado) - max_pasos
+    radio2 = desplazamiento[:, None] ** 2 + desplazamiento[None, :] ** 2
+    posiciones = np.flatnonzero((radio2 <= max_pasos ** 2) & (radio2 > 0))
+    di = posiciones // lado - max_pasos
+    dj = posiciones % lado - max_pasos
+    celda, bins = _sectores_celdas(di, dj, num_bins)
+    # Índices en int32 para que la geometría guardada ocupe la mitad
+    return (posiciones.astype(np.int32), np.sqrt(radio2.ravel()[posiciones]),
+            celda.astype(np.int32), bins.astype(np.int32))
+
+
+def _envolvente(pendientes, distancias, celda, bins, num_bins, mejor, distancia_mejor):
+    """
+    Acumula en (mejor, distancia_mejor) la mayor pendiente de cada sector y,
+    a igual pendiente, la distancia de la celda más cercana.
+    """
+    pendiente_entrada = pendientes[celda]
+    maximo = np.full(num_bins, -np.inf)
+    np.maximum.at(maximo, bins, pendiente_entrada)
+    empate = (pendiente_entrada == maximo[bins]) & (pendiente_entrada > -np.inf)
+    cercana = np.full(num_bins, np.inf)
+    np.minimum.at(cercana, bins[empate], distancias[celda[empate]])
+
+    supera = maximo > mejor
+    iguala = (maximo == mejor) & (maximo > -np.inf)
+    distancia_mejor[supera] = cercana[supera]
+    distancia_mejor[iguala] = np.minimum(distancia_mejor[iguala], cercana[iguala])
+    mejor[supera] = maximo[supera]
+
+
+def _pendientes_celdas(alturas, altura_total, distancias):
+    """Pendiente (dh / d) de cada celda; -inf en celdas sin datos."""
+    pendientes = np.subtract(alturas, altura_total, dtype=np.float64)
+    pendientes /= distancias
+    pendientes[alturas == NODATA] = -np.inf
+    return pendientes
+
+
+def panorama_horizonte(terreno, origen, i_obs, j_obs, altura_total, max_pasos, paso_metros,
+                       num_bins=360, filas_por_bloque=256):
+    """
+    Horizonte completo (360°) visitando cada celda del radio una sola vez.
+
+    En lugar de lanzar rayos, cada celda aporta su pendiente a todos los
+    sectores de azimut que cubre (las celdas cercanas ocupan varios sectores,
+    las lejanas uno o dos) y el horizonte de cada sector es la envolvente
+    superior de esas pendientes. La geometría del círculo se guarda entre
+    consultas; si el círculo es muy grande se recorre por franjas de filas.
+
+    Args:
+        terreno: Ventana int16 que contiene el círculo de radio max_pasos
+            (recortada al mosaico).
+        origen: (i0, j0) índices globales de la esquina de la ventana.
+        i_obs, j_obs: Índices globales del observador.
+        altura_total: Altura del ojo del observador (m).
+        max_pasos: Radio en celdas.
+        paso_metros: Metros por celda.
+        num_bins: Sectores de azimut; el sector k está centrado en k * 360 / num_bins.
+        filas_por_bloque: Filas por franja cuando no se guarda la geometría.
+
+    Returns:
+        angulos: Azimut central de cada sector (0 = Norte, 90 = Este).
+        elevaciones: Ángulo de elevación del horizonte por sector (-90 si no hay datos).
+        distancias: Distancia (m) de la celda que lo define (0 si no hay).
+    """
+    i0, j0 = origen
+    mejor = np.full(num_bins, -np.inf)
+    distancia_mejor = np.zeros(num_bins)
+    lado = 2 * max_pasos + 1
+
+    if lado * lado <= MAX_CELDAS_GEOMETRIA:
+        # Ventana completa centrada en el observador (relleno -32768 fuera del mosaico)
+        completa = np.full((lado, lado), NODATA, dtype=np.int16)
+        fi, fj = i0 - (i_obs - max_pasos), j0 - (j_obs - max_pasos)
+        completa[fi:fi + terreno.shape[0], fj:fj + terreno.shape[1]] = terreno
+        posiciones, radios, celda, bins = _geometria_panorama(max_pasos, num_bins)
+        distancias = radios * paso_metros
+        pendientes = _pendientes_celdas(np.take(completa.reshape(-1), posiciones), altura_total, distancias)
+        _envolvente(pendientes, distancias, celda, bins, num_bins, mejor, distancia_mejor)
+    else:
+        dj_ventana = np.arange(terreno.shape[1]) + (j0 - j_obs)
+        for f0 in range(0, terreno.shape[0], filas_por_bloque):
+            franja = np.asarray(terreno[f0:f0 + filas_por_bloque])
+            di_franja = np.arange(f0, f0 + franja.shape[0]) + (i0 - i_obs)
+            radio2 = di_franja[:, None] ** 2 + dj_ventana[None, :] ** 2
+            filas, columnas = np.nonzero((radio2 <= max_pasos ** 2) & (radio2 > 0) & (franja != NODATA))
+            if len(filas) == 0:
+                continue
+            distancias = np.sqrt(radio2[filas, columnas]) * paso_metros
+            pendientes = _pendientes_celdas(franja[filas, columnas], altura_total, distancias)
+            celda, bins = _sectores_celdas(di_franja[filas], dj_ventana[columnas], num_bins)
+            _envolvente(pendientes, distancias, celda, bins, num_bins, mejor, distancia_mejor)
+
+    angulos = np.arange(num_bins) * (360.0 / num_bins)
+    hay_horizonte = mejor > -np.inf
+    elevaciones = np.where(hay_horizonte, np.degrees(np.arctan(np.where(hay_horizonte, mejor, 0.0))), -90.0)
+    distancias = np.where(hay_horizonte, distancia_mejor, 0.0)
+    return angulos, elevaciones, distancias
@@ -0,0 +1,264 @@
+"""
+OBSTRUCCIÓN SOLAR - ECUADOR
+Amanecer y ocaso efectivos detrás de las montañas para muchos sitios y
+todos los días de un período.
+
+💡 CARACTERÍSTICAS:
+- Un horizonte de 360° por sitio (calcular_horizontes_lote, en paralelo)
+- Posición del sol de cada minuto con las ecuaciones generales de la NOAA,
+  vectorizada sobre la matriz (días x minutos)
+- El sol es visible si su elevación supera la del horizonte en su azimut
+  (interpolado) y la del orto astronómico (-0.833°)
+- Sitios repartidos en varios procesos; las filas se escriben en el CSV a
+  medida que llegan, en el orden de los sitios
+- Horas en hora local de Ecuador continental (UTC-5, sin horario de verano)
+
+Columnas del CSV:
+sitio, lat, lon, fecha, amanecer_astronomico, amanecer_efectivo,
+ocaso_efectivo, ocaso_astronomico, horas_sol_astronomicas,
+horas_sol_efectivas, horas_obstruidas, horas_pico_obstruidas
+(horas_pico_obstruidas suma sin(elevación) de los minutos tapados: la
+irradiancia directa perdida en horas equivalentes de sol en el cenit)
+"""
+
+import os
+import csv
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from lote_horizontes import calcular_horizontes_lote
+
+# Hora local de Ecuador continental respecto a UTC
+ZONA_HORARIA = -5
+
+# Elevación del centro del sol en el orto/ocaso astronómico (refracción y semidiámetro)
+ELEVACION_ORTO = -0.833
+
+MINUTOS_DIA = 24 * 60
+
+COLUMNAS_CSV = ['sitio', 'lat', 'lon', 'fecha', 'amanecer_astronomico', 'amanecer_efectivo',
+                'ocaso_efectivo', 'ocaso_astronomico', 'horas_sol_astronomicas',
+                'horas_sol_efectivas', 'horas_obstruidas', 'horas_pico_obstruidas']
+
+# Estado de cada proceso trabajador (se fija en _iniciar_trabajador)
+_trabajador = {}
+
+
+def dias_periodo(fecha_inicio, fecha_fin):
+    """Días (datetime64[D]) entre fecha_inicio y fecha_fin, ambas incluidas."""
+    return np.arange(np.datetime64(fecha_inicio, 'D'), np.datetime64(fecha_fin, 'D') + 1)
+
+
+def efemerides(dias, zona_horaria=ZONA_HORARIA):
+    """
+    Declinación y ecuación del tiempo de cada minuto (hora local) de cada día.
+
+    Solo dependen de la fecha y la hora, no del sitio, así que se calculan
+    una vez para todos los sitios.
+
+    Returns:
+        (sen_declinacion, cos_declinacion, ecuacion_tiempo): matrices
+        (días x 1440); la ecuación del tiempo en minutos.
+    """
+    anios = dias.astype('datetime64[Y]')
+    dia_anio = (dias - anios).astype(np.int64) + 1
+    anio = anios.astype(np.int64) + 1970
+    bisiesto = (anio % 4 == 0) & ((anio % 100 != 0) | (anio % 400 == 0))
+    dias_anio = np.where(bisiesto, 366, 365)
+
+    # Año fraccional (radianes) de cada minuto, con la hora en UTC
+    horas_utc = np.arange(MINUTOS_DIA) / 60 - zona_horaria
+    gamma = 2 * math.pi / dias_anio[:, None] * (dia_anio[:, None] - 1 + (horas_utc[None, :] - 12) / 24)
+
+    ecuacion_tiempo = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                                - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    declinacion = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+                   - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+                   - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    return np.sin(declinacion), np.cos(declinacion), ecuacion_tiempo
+
+
+def posicion_solar(lat, lon, efemerides_dias, zona_horaria=ZONA_HORARIA):
+    """
+    Elevación y azimut del sol en cada minuto (ecuaciones generales de la NOAA).
+
+    Args:
+        lat, lon: Posición del sitio en grados.
+        efemerides_dias: Resultado de efemerides().
+        zona_horaria: Horas respecto a UTC de la hora local.
+
+    Returns:
+        (elevacion, azimut) en grados, matrices (días x 1440); el azimut se
+        mide desde el norte en sentido horario, en [0, 360).
+    """
+    sen_decl, cos_decl, ecuacion_tiempo = efemerides_dias
+    minutos = np.arange(MINUTOS_DIA)
+
+    # Tiempo solar verdadero y ángulo horario (grados)
+    tiempo_solar = minutos + ecuacion_tiempo + 4 * lon - 60 * zona_horaria
+    angulo_horario = np.radians(tiempo_solar / 4 - 180)
+
+    fi = math.radians(lat)
+    cos_ah = np.cos(angulo_horario)
+    sen_elevacion = math.sin(fi) * sen_decl + math.cos(fi) * cos_decl * cos_ah
+    elevacion = np.degrees(np.arcsin(np.clip(sen_elevacion, -1, 1)))
+    azimut = np.degrees(np.arctan2(np.sin(angulo_horario),
+                                   cos_ah * math.sin(fi) - sen_decl / cos_decl * math.cos(fi))) + 180
+    return elevacion, azimut % 360
+
+
+def _hora(minutos, hay):
+    """Minutos del día como 'HH:MM' ('' si no hay)."""
+    return [f"{m // 60:02d}:{m % 60:02d}" if h else '' for m, h in zip(minutos.tolist(), hay.tolist())]
+
+
+def _primero_ultimo(mascara):
+    """Primer y último minuto True de cada día, y si hay alguno."""
+    hay = mascara.any(axis=1)
+    primero = np.argmax(mascara, axis=1)
+    ultimo = mascara.shape[1] - 1 - np.argmax(mascara[:, ::-1], axis=1)
+    return primero, ultimo, hay
+
+
+def obstruccion_sitio(lat, lon, angulos, elevaciones, efemerides_dias, zona_horaria=ZONA_HORARIA):
+    """
+    Sol astronómico y efectivo de cada día para un sitio.
+
+    Args:
+        lat, lon: Posición del sitio.
+        angulos, elevaciones: Horizonte de 360° del sitio (calcular_horizonte).
+        efemerides_dias: Resultado de efemerides() para los días del período.
+        zona_horaria: Horas respecto a UTC de la hora local.
+
+    Returns:
+        Diccionario de columnas (una entrada por día): amanecer/ocaso
+        astronómico y efectivo ('HH:MM' o '' si el sol no sale), horas de
+        sol astronómicas y efectivas, horas obstruidas y horas pico obstruidas.
+    """
+    elevacion_sol, azimut_sol = posicion_solar(lat, lon, efemerides_dias, zona_horaria)
+
+    # Rayos sin datos (-90) no tapan nada; el horizonte nunca baja del orto astronómico
+    horizonte = np.maximum(np.asarray(elevaciones, dtype=np.float64), ELEVACION_ORTO)
+    elevacion_horizonte = np.interp(azimut_sol, np.asarray(angulos, dtype=np.float64) % 360,
+                                    horizonte, period=360)
+
+    sobre_orto = elevacion_sol > ELEVACION_ORTO
+    visible = elevacion_sol > elevacion_horizonte
+    obstruido = sobre_orto & ~visible
+
+    amanecer_astro, ocaso_astro, hay_astro = _primero_ultimo(sobre_orto)
+    amanecer, ocaso, hay_sol = _primero_ultimo(visible)
+    seno = np.sin(np.radians(np.maximum(elevacion_sol, 0)))
+
+    return {
+        'amanecer_astronomico': _hora(amanecer_astro, hay_astro),
+        'amanecer_efectivo': _hora(amanecer, hay_sol),
+        'ocaso_efectivo': _hora(ocaso, hay_sol),
+        'ocaso_astronomico': _hora(ocaso_astro, hay_astro),
+        'horas_sol_astronomicas': sobre_orto.sum(axis=1) / 60,
+        'horas_sol_efectivas': visible.sum(axis=1) / 60,
+        'horas_obstruidas': obstruido.sum(axis=1) / 60,
+        'horas_pico_obstruidas': np.where(obstruido, seno, 0).sum(axis=1) / 60,
+    }
+
+
+def _filas_sitio(sitio, lat, lon, horizonte, dias, efemerides_dias, zona_horaria):
+    """Filas del CSV de un sitio (ninguna si no tiene horizonte)."""
+    if horizonte is None:
+        return []
+    angulos, elevaciones, _ = horizonte
+    columnas = obstruccion_sitio(lat, lon, angulos, elevaciones, efemerides_dias, zona_horaria)
+    fechas = [str(d) for d in dias]
+    return [[sitio, lat, lon, fechas[k],
+             columnas['amanecer_astronomico'][k], columnas['amanecer_efectivo'][k],
+             columnas['ocaso_efectivo'][k], columnas['ocaso_astronomico'][k],
+             f"{columnas['horas_sol_astronomicas'][k]:.3f}", f"{columnas['horas_sol_efectivas'][k]:.3f}",
+             f"{columnas['horas_obstruidas'][k]:.3f}", f"{columnas['horas_pico_obstruidas'][k]:.4f}"]
+            for k in range(len(dias))]
+
+
+def _iniciar_trabajador(dias, zona_horaria):
+    """Calcula las efemérides del período una vez por proceso trabajador."""
+    _trabajador['dias'] = dias
+    _trabajador['zona_horaria'] = zona_horaria
+    _trabajador['efemerides'] = efemerides(dias, zona_horaria)
+
+
+def _sitio_trabajador(tarea):
+    sitio, lat, lon, horizonte = tarea
+    return _filas_sitio(sitio, lat, lon, horizonte, _trabajador['dias'],
+                        _trabajador['efemerides'], _trabajador['zona_horaria'])
+
+
+def calcular_obstruccion_solar(simulador, sitios, fecha_inicio, fecha_fin, archivo_csv,
+                               altura_observador=1.7, max_distancia_km=50, num_rayos=720,
+                               nombres=None, zona_horaria=ZONA_HORARIA, procesos=None, chunksize=4):
+    """
+    Amanecer/ocaso efectivos y horas de sol tapadas por el relieve, por sitio y día.
+
+    Primero se calcula el horizonte de 360° de todos los sitios
+    (calcular_horizontes_lote) y después se evalúa el sol minuto a minuto
+    de cada sitio en varios procesos. Las filas se escriben en el CSV en
+    cuanto llegan.
+
+    Args:
+        simulador: SimuladorHorizonte con el terreno cargado (se carga si no).
+        sitios: Secuencia de (lat, lon).
+        fecha_inicio, fecha_fin: Período (incluido), 'AAAA-MM-DD' o datetime.date.
+        archivo_csv: Ruta del CSV de salida (ver columnas en el encabezado del módulo).
+        altura_observador: Altura sobre el terreno en metros.
+        max_distancia_km: Distancia máxima del horizonte en km.
+        num_rayos: Rayos del horizonte de 360° de cada sitio.
+        nombres: Nombre de cada sitio para la columna 'sitio' (por defecto, su índice).
+        zona_horaria: Horas respecto a UTC de la hora local.
+        procesos: Procesos trabajadores (por defecto, os.cpu_count()); con 1
+            se calcula en este proceso.
+        chunksize: Sitios que recibe cada proceso por envío.
+
+    Returns:
+        Número de sitios escritos (los que están fuera del área o sin datos
+        se omiten con un aviso).
+    """
+    sitios = [(float(s[0]), float(s[1])) for s in sitios]
+    nombres = list(nombres) if nombres is not None else list(range(len(sitios)))
+    dias = dias_periodo(fecha_inicio, fecha_fin)
+    procesos = procesos or os.cpu_count() or 1
+
+    print(f"Horizontes de {len(sitios)} sitios...")
+    horizontes = calcular_horizontes_lote(simulador, sitios, azimut=0, campo_vision=360,
+                                          altura_observador=altura_observador,
+                                          max_distancia_km=max_distancia_km,
+                                          num_rayos=num_rayos, procesos=procesos)
+    tareas = [(nombre, lat, lon, horizonte)
+              for nombre, (lat, lon), horizonte in zip(nombres, sitios, horizontes)]
+    omitidos = [nombre for nombre, _, _, horizonte in tareas if horizonte is None]
+    if omitidos:
+        print(f"[AVISO] {len(omitidos)} sitios fuera del área o sin datos: {omitidos[:10]}")
+
+    print(f"Posiciones solares de {len(dias)} días...")
+    escritos = 0
+    pool = None
+    try:
+        if procesos == 1 or len(tareas) <= 1:
+            efemerides_dias = efemerides(dias, zona_horaria)
+            resultados = (_filas_sitio(*tarea, dias, efemerides_dias, zona_horaria) for tarea in tareas)
+        else:
+            pool = ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_trabajador,
+                                       initargs=(dias, zona_horaria))
+            resultados = pool.map(_sitio_trabajador, tareas, chunksize=chunksize)
+
+        with open(archivo_csv, 'w', newline='', encoding='utf-8') as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(COLUMNAS_CSV)
+            for filas in resultados:
+                if filas:
+                    escritor.writerows(filas)
+                    escritos += 1
+                    if escritos % 100 == 0:
+                        print(f"   Sitios: {escritos}/{len(tareas) - len(omitidos)}")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    print(f"✅ Obstrucción solar guardada en {archivo_csv}")
+    return escritos
@@ -0,0 +1,302 @@
+"""
+RASTER DE HORIZONTE - ECUADOR
+Ángulo del horizonte en N sectores de azimut y factor de vista del cielo
+(SVF) para todas las celdas del mosaico, calculado por bloques.
+
+💡 CARACTERÍSTICAS:
+- Bloques con un margen (halo) igual a la distancia máxima de búsqueda: cada
+  bloque se calcula sin mirar a sus vecinos
+- Varios procesos en paralelo conectados al mismo mosaico (sin recargarlo)
+- Resultados escritos directamente en archivos .npy abiertos como memmap
+- Reanudable: un mapa de progreso marca los bloques terminados
+- La memoria depende del tamaño del bloque, no del tamaño del país
+
+Formato de salida (carpeta):
+- horizonte.npy: int16 (sectores, filas, columnas), centésimas de grado
+- svf.npy: int16 (filas, columnas), SVF x 10000
+- progreso.npy: uint8 por bloque (1 = terminado)
+- metadatos.json: parámetros del cálculo y huella del terreno
+En ambos rásteres -32768 marca celdas sin datos.
+"""
+
+import os
+import json
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from mosaico_terreno import NODATA, compartir_matriz, abrir_matriz_compartida
+
+# Escalas de almacenamiento en int16
+ESCALA_ANGULO = 100     # centésimas de grado
+ESCALA_SVF = 10000
+
+# Estado de cada proceso trabajador (se fija en _iniciar_trabajador)
+_trabajador = {}
+_memorias_trabajador = []
+
+
+def desplazamientos_sector(azimut, max_pasos):
+    """
+    Celdas (di, dj) distintas que recorre una dirección hasta max_pasos.
+
+    Args:
+        azimut: Dirección en grados (0 = Norte, 90 = Este).
+        max_pasos: Distancia máxima en celdas.
+
+    Returns:
+        di, dj: Desplazamientos enteros, del más cercano al más lejano.
+        distancias: Distancia de cada celda en celdas.
+    """
+    rad = math.radians(azimut)
+    pasos = np.arange(1, max_pasos + 1)
+    di = np.rint(-math.cos(rad) * pasos).astype(np.int64)
+    dj = np.rint(math.sin(rad) * pasos).astype(np.int64)
+
+    # Pasos consecutivos pueden caer en la misma celda
+    _, primeros = np.unique(di * (2 * max_pasos + 1) + dj, return_index=True)
+    primeros.sort()
+    di, dj = di[primeros], dj[primeros]
+    distancias = np.hypot(di, dj)
+    dentro = distancias <= max_pasos
+    return di[dentro], dj[dentro], distancias[dentro]
+
+
+def horizonte_bloque(ventana, halo, num_sectores, max_pasos, paso_metros, altura_observador=0.0):
+    """
+    Horizonte por sectores y SVF de las celdas centrales de una ventana.
+
+    Para cada sector se desplaza la ventana completa a lo largo de su
+    dirección y se guarda, por celda, la mayor pendiente hacia el terreno
+    desplazado: el coste es sectores x celdas de la dirección, todo con
+    operaciones sobre el bloque entero.
+
+    Args:
+        ventana: Matriz int16 del bloque con un margen de `halo` celdas por lado
+            (-32768 fuera del mosaico).
+        halo: Margen en celdas (>= max_pasos).
+        num_sectores: Sectores de azimut; el sector k apunta a k * 360 / num_sectores.
+        max_pasos: Distancia máxima de búsqueda en celdas.
+        paso_metros: Metros por celda.
+        altura_observador: Altura sobre el terreno desde la que se mira (m).
+
+    Returns:
+        horizonte: float32 (sectores, filas, columnas) en grados (-90 sin horizonte).
+        svf: float32 (filas, columnas), 1 - media de sin(max(horizonte, 0)).
+        sin_datos: Máscara de las celdas centrales sin datos.
+    """
+    filas = ventana.shape[0] - 2 * halo
+    columnas = ventana.shape[1] - 2 * halo
+
+    # Sin datos como -inf: su pendiente queda en -inf y nunca es máxima
+    terreno = ventana.astype(np.float32)
+    terreno[ventana == NODATA] = -np.inf
+    sin_datos = ventana[halo:halo + filas, halo:halo + columnas] == NODATA
+    centro = terreno[halo:halo + filas, halo:halo + columnas] + np.float32(altura_observador)
+    centro[sin_datos] = 0
+
+    horizonte = np.empty((num_sectores, filas, columnas), dtype=np.float32)
+    pendiente = np.empty((filas, columnas), dtype=np.float32)
+    for sector in range(num_sectores):
+        mejor = np.full((filas, columnas), -np.inf, dtype=np.float32)
+        di, dj, distancias = desplazamientos_sector(sector * 360.0 / num_sectores, max_pasos)
+        for oi, oj, distancia in zip(di.tolist(), dj.tolist(), distancias.tolist()):
+            vecino = terreno[halo + oi:halo + oi + filas, halo + oj:halo + oj + columnas]
+            np.subtract(vecino, centro, out=pendiente)
+            pendiente *= np.float32(1.0 / (distancia * paso_metros))
+            np.maximum(mejor, pendiente, out=mejor)
+        horizonte[sector] = np.degrees(np.arctan(mejor))
+
+    svf = 1 - np.mean(np.sin(np.radians(np.maximum(horizonte, 0))), axis=0)
+    return horizonte, svf.astype(np.float32), sin_datos
+
+
+def _ventana_con_halo(terreno, i0, i1, j0, j1, halo):
+    """Ventana [i0-halo, i1+halo) x [j0-halo, j1+halo), con -32768 fuera del mosaico."""
+    filas, columnas = terreno.shape
+    ventana = np.full((i1 - i0 + 2 * halo, j1 - j0 + 2 * halo), NODATA, dtype=np.int16)
+    fi0, fi1 = max(0, i0 - halo), min(filas, i1 + halo)
+    fj0, fj1 = max(0, j0 - halo), min(columnas, j1 + halo)
+    ventana[fi0 - (i0 - halo):fi1 - (i0 - halo), fj0 - (j0 - halo):fj1 - (j0 - halo)] = \
+        terreno[fi0:fi1, fj0:fj1]
+    return ventana
+
+
+def _procesar_bloque(terreno, salida_horizonte, salida_svf, parametros, bi, bj):
+    """Calcula un bloque y lo escribe en los archivos de salida."""
+    tam = parametros['tam_bloque']
+    halo = parametros['max_pasos']
+    filas, columnas = terreno.shape
+    i0, j0 = bi * tam, bj * tam
+    i1, j1 = min(filas, i0 + tam), min(columnas, j0 + tam)
+
+    ventana = _ventana_con_halo(terreno, i0, i1, j0, j1, halo)
+    horizonte, svf, sin_datos = horizonte_bloque(
+        ventana, halo, parametros['num_sectores'], parametros['max_pasos'],
+        parametros['paso_metros'], parametros['altura_observador'])
+
+    horizonte = np.rint(horizonte * ESCALA_ANGULO).astype(np.int16)
+    horizonte[:, sin_datos] = NODATA
+    svf = np.rint(svf * ESCALA_SVF).astype(np.int16)
+    svf[sin_datos] = NODATA
+
+    salida_horizonte[:, i0:i1, j0:j1] = horizonte
+    salida_svf[i0:i1, j0:j1] = svf
+    salida_horizonte.flush()
+    salida_svf.flush()
+    return bi, bj
+
+
+def _iniciar_trabajador(descriptor, carpeta_salida, parametros):
+    """Abre el terreno compartido y los archivos de salida en un proceso trabajador."""
+    _trabajador['terreno'] = abrir_matriz_compartida(descriptor, _memorias_trabajador)
+    _trabajador['horizonte'] = np.load(os.path.join(carpeta_salida, 'horizonte.npy'), mmap_mode='r+')
+    _trabajador['svf'] = np.load(os.path.join(carpeta_salida, 'svf.npy'), mmap_mode='r+')
+    _trabajador['parametros'] = parametros
+
+
+def _bloque_trabajador(bloque):
+    return _procesar_bloque(_trabajador['terreno'], _trabajador['horizonte'], _trabajador['svf'],
+                            _trabajador['parametros'], *bloque)
+
+
+def _salida_valida(carpeta_salida, forma, parametros, bloques):
+    """
+    Comprueba que los archivos de un cálculo anterior existen y tienen la
+    forma y el tipo esperados (un corte al crearlos puede dejarlos a medias).
+    """
+    esperados = {
+        'progreso.npy': (np.uint8, bloques),
+        'horizonte.npy': (np.int16, (parametros['num_sectores'],) + tuple(forma)),
+        'svf.npy': (np.int16, tuple(forma)),
+    }
+    for nombre, (tipo, forma_esperada) in esperados.items():
+        try:
+            arreglo = np.load(os.path.join(carpeta_salida, nombre), mmap_mode='r')
+        except (OSError, ValueError):
+            return False
+        if arreglo.dtype != tipo or arreglo.shape != tuple(forma_esperada):
+            return False
+    return True
+
+
+def _preparar_salida(carpeta_salida, forma, parametros):
+    """
+    Crea los archivos de salida o reutiliza los de un cálculo interrumpido
+    con los mismos parámetros.
+
+    Returns:
+        Mapa de progreso (memmap uint8, 1 = bloque terminado).
+    """
+    os.makedirs(carpeta_salida, exist_ok=True)
+    ruta_metadatos = os.path.join(carpeta_salida, 'metadatos.json')
+    ruta_progreso = os.path.join(carpeta_salida, 'progreso.npy')
+    bloques = (-(-forma[0] // parametros['tam_bloque']), -(-forma[1] // parametros['tam_bloque']))
+
+    metadatos = dict(parametros, forma=list(forma))
+    if os.path.exists(ruta_metadatos):
+        try:
+            with open(ruta_metadatos, 'r', encoding='utf-8') as f:
+                anteriores = json.load(f)
+        except (OSError, ValueError):
+            anteriores = None
+        if anteriores != json.loads(json.dumps(metadatos)):
+            print(f"[AVISO] Los parámetros cambiaron; se reinicia el raster en {carpeta_salida}")
+        elif not _salida_valida(carpeta_salida, forma, parametros, bloques):
+            print(f"[AVISO] Archivos de salida incompletos; se reinicia el raster en {carpeta_salida}")
+        else:
+            return np.load(ruta_progreso, mmap_mode='r+')
+
+    # El progreso se reinicia primero: si se corta aquí no queda un raster a medias marcado como hecho
+    progreso = np.lib.format.open_memmap(ruta_progreso, mode='w+', dtype=np.uint8, shape=bloques)
+    progreso.flush()
+    np.lib.format.open_memmap(os.path.join(carpeta_salida, 'horizonte.npy'), mode='w+',
+                              dtype=np.int16, shape=(parametros['num_sectores'],) + tuple(forma))
+    np.lib.format.open_memmap(os.path.join(carpeta_salida, 'svf.npy'), mode='w+',
+                              dtype=np.int16, shape=tuple(forma))
+    with open(ruta_metadatos, 'w', encoding='utf-8') as f:
+        json.dump(metadatos, f, indent=2)
+    return progreso
+
+
+def calcular_raster_horizonte(simulador, carpeta_salida, num_sectores=16, max_distancia_km=10,
+                              altura_observador=0.0, tam_bloque=512, procesos=None):
+    """
+    Calcula (o continúa) el raster de horizonte y SVF de todo el mosaico.
+
+    Args:
+        simulador: SimuladorHorizonte con el terreno cargado (se carga si no).
+        carpeta_salida: Carpeta de los archivos de salida (ver el encabezado del módulo).
+        num_sectores: Sectores de azimut.
+        max_distancia_km: Distancia máxima de búsqueda del horizonte (y halo).
+        altura_observador: Altura sobre el terreno desde la que se mira (m).
+        tam_bloque: Lado de cada bloque en celdas.
+        procesos: Procesos trabajadores (por defecto, os.cpu_count()).
+
+    Returns:
+        Ruta de la carpeta de salida.
+    """
+    terreno = simulador._terreno_completo()
+
+    paso_metros = (1 / (simulador.resolucion - 1)) * 111000
+    parametros = {
+        'huella': simulador.huella_terreno,
+        'num_sectores': num_sectores,
+        'max_pasos': int(max_distancia_km * 1000 / paso_metros),
+        'paso_metros': paso_metros,
+        'altura_observador': altura_observador,
+        'tam_bloque': tam_bloque,
+    }
+    progreso = _preparar_salida(carpeta_salida, terreno.shape, parametros)
+    pendientes = [tuple(int(x) for x in b) for b in np.argwhere(progreso == 0)]
+    total = progreso.size
+    print(f"Raster de horizonte: {total - len(pendientes)}/{total} bloques ya calculados")
+    if not pendientes:
+        return carpeta_salida
+
+    procesos = procesos or os.cpu_count() or 1
+    hechos = total - len(pendientes)
+    memorias = []
+    pool = None
+    try:
+        if procesos == 1:
+            salida_horizonte = np.load(os.path.join(carpeta_salida, 'horizonte.npy'), mmap_mode='r+')
+            salida_svf = np.load(os.path.join(carpeta_salida, 'svf.npy'), mmap_mode='r+')
+            terminados = (_procesar_bloque(terreno, salida_horizonte, salida_svf, parametros, *b)
+                          for b in pendientes)
+        else:
+            descriptor = compartir_matriz(terreno, memorias)
+            pool = ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_trabajador,
+                                       initargs=(descriptor, carpeta_salida, parametros))
+            terminados = (futuro.result() for futuro in
+                          as_completed([pool.submit(_bloque_trabajador, b) for b in pendientes]))
+
+        for bi, bj in terminados:
+            # El bloque ya está escrito: se marca como terminado
+            progreso[bi, bj] = 1
+            progreso.flush()
+            hechos += 1
+            if hechos % 10 == 0 or hechos == total:
+                print(f"   Bloques: {hechos}/{total}")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        for memoria in memorias:
+            memoria.close()
+            memoria.unlink()
+
+    return carpeta_salida
+
+
+def abrir_raster_horizonte(carpeta):
+    """
+    Abre un raster calculado, de solo lectura.
+
+    Returns:
+        (horizonte, svf, metadatos): memmaps int16 (ver escalas ESCALA_ANGULO y
+        ESCALA_SVF) y el diccionario de parámetros.
+    """
+    with open(os.path.join(carpeta, 'metadatos.json'), 'r', encoding='utf-8') as f:
+        metadatos = json.load(f)
+    horizonte = np.load(os.path.join(carpeta, 'horizonte.npy'), mmap_mode='r')
+    svf = np.load(os.path.join(carpeta, 'svf.npy'), mmap_mode='r')
+    return horizonte, svf, metadatos
@@ -3,16 +3,41 @@ import os
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import math
+import threading
+from mosaico_terreno import (MosaicoTerreno, CacheTeselas, RegionTerreno,
+                             describir_arreglo, huella_archivos, resumen_huella,
+                             escribir_cache_mosaico, abrir_cache_mosaico)
+from visibilidad import visibilidad_region, lineas_de_vista, RADIO_TIERRA
+from cache_horizontes import CacheHorizontes, clave_horizonte
+from catalogo_picos import CatalogoPicos, CUMBRES_CONOCIDAS, construir_catalogo, picos_visibles
+from almacen_chunks import AlmacenChunks, convertir_a_chunks, estadisticas_bloque
+from motor_horizonte import (elevaciones_rayos, elevaciones_rayos_piramide,
+                             elevaciones_rayos_adaptativo, panorama_horizonte, reducir_maximo,
+                             tramos_lejanos, elevaciones_incrementales, refinar_horizonte,
+                             NIVELES_PIRAMIDE, PASOS_CERCANOS_INCREMENTAL)
 
 class SimuladorHorizonte:
-    def __init__(self, carpeta_matrices='Matrices'):
+    def __init__(self, carpeta_matrices='Matrices', usar_cache=True, carpeta_cache=None,
+                 memoria_teselas_bytes=256 * 1024 ** 2, memoria_horizontes_bytes=32 * 1024 ** 2,
+                 horizontes_en_disco=False):
         """
         Simulador de horizonte para Ecuador continental.
         
         Args:
             carpeta_matrices: Ruta a la carpeta con archivos .hgt
+            usar_cache: Si se guarda/abre el mosaico unido en un archivo de caché
+            carpeta_cache: Carpeta del caché (por defecto <carpeta_matrices>/cache)
+            memoria_teselas_bytes: Presupuesto del caché LRU de archivos .hgt
+                usado por leer_region cuando no se ha cargado el mosaico completo
+            memoria_horizontes_bytes: Presupuesto del caché LRU de resultados de
+                calcular_horizonte (0 lo desactiva)
+            horizontes_en_disco: Si los resultados se guardan también en
+                <carpeta_cache>/horizontes para reutilizarlos entre sesiones
         """
         self.carpeta_matrices = carpeta_matrices
+        self.usar_cache = usar_cache
+        self.carpeta_cache = carpeta_cache or os.path.join(carpeta_matrices, 'cache')
+        self.huella_terreno = None  # Identificador de la versión de los datos .hgt
         self.matriz_terreno = None
         self.resolucion = 1201     # Puntos por grado
         
@@ -25,7 +50,58 @@ class SimuladorHorizonte:
         # Para almacenar la configuración real después de cargar
         self.latitudes_disponibles = []
         self.longitudes_disponibles = []
+        self.archivos_disponibles = None
+        self.forma_mosaico = None
         
+        # Lectura por ventanas: solo los archivos .hgt que toca cada consulta
+        self.cache_teselas = CacheTeselas(memoria_teselas_bytes, self.resolucion)
+        self._mosaico_ventanas = None
+        
+        # Pirámide de máximos para calcular_horizonte(metodo='piramide')
+        self.piramide_maxima = None
+        
+        # Resultados de calcular_horizonte ya calculados (ver cache_horizontes.py)
+        self.cache_horizontes = None
+        if memoria_horizontes_bytes:
+            carpeta_horizontes = os.path.join(self.carpeta_cache, 'horizontes') if horizontes_en_disco else None
+            self.cache_horizontes = CacheHorizontes(memoria_horizontes_bytes, carpeta_horizontes)
+        
+        # Cumbres con prominencia e índice espacial (ver cargar_catalogo_picos)
+        self.catalogo_picos = None
+        self._hilo_catalogo = None
+        self._lock_catalogo = threading.Lock()
+        
+        # Serializa las cargas del terreno y de la pirámide (el catálogo se
+        # prepara en otro hilo mientras la GUI sigue consultando). Las
+        # consultas solo lo toman si les falta algo por cargar
+        self._lock_carga = threading.RLock()
+        
+        # Candidatos lejanos del último cálculo completo (calcular_horizonte(incremental=True))
+        self.estado_incremental = None
+        
+        # Reporte de arreglos intermedios grandes (tipo y bytes)
+        self.reportar_memoria = False
+        self.umbral_reporte_bytes = 8 * 1024 ** 2
+        
+    def reportar_intermedio(self, nombre, arreglo, dtype_esperado=None):
+        """
+        Punto de control para arreglos intermedios del pipeline de terreno.
+        
+        Verifica (assert) que el arreglo tenga el tipo esperado y, si
+        reportar_memoria está activo, imprime su tipo y tamaño cuando supera
+        umbral_reporte_bytes.
+        
+        Args:
+            nombre: Nombre del arreglo para el reporte
+            arreglo: Arreglo de NumPy a revisar
+            dtype_esperado: Tipo que debe tener el arreglo (opcional)
+        """
+        if dtype_esperado is not None:
+            assert arreglo.dtype == np.dtype(dtype_esperado), \
+                f"{nombre}: se esperaba {np.dtype(dtype_esperado)}, se obtuvo {arreglo.dtype}"
+        if self.reportar_memoria and arreglo.nbytes >= self.umbral_reporte_bytes:
+            print(f"   [MEM] {describir_arreglo(nombre, arreglo)}")
+    
     def generar_nombre_hgt(self, lat, lon):
         # Se usa math.floor() para encontrar la esquina inferior izquierda
         lat_base = math.floor(lat)
@@ -55,10 +131,11 @@ class SimuladorHorizonte:
         matriz = np.frombuffer(datos, dtype='>i2').reshape((resolucion, resolucion))
         return matriz
     
-    def cargar_terreno_ecuador(self):
-        """Carga y une todos los archivos .hgt para formar el mapa de Ecuador."""
-        print("Cargando datos de elevación de Ecuador...")
-        
+    def escanear_archivos(self):
+        """
+        Busca los archivos .hgt disponibles y fija la geometría del mosaico
+        (latitudes, longitudes, límites y forma) sin leer datos de elevación.
+        """
         # Definir explícitamente el rango de archivos disponibles
         latitudes = [3, 2, 1, 0, -1, -2, -3, -4, -5, -6, -7, -8]
         longitudes = [-82, -81, -80, -79, -78, -77, -76, -75, -74, -73]
@@ -73,135 +150,565 @@ class SimuladorHorizonte:
                     archivos_disponibles[(lat, lon)] = ruta
         
         print(f"Archivos .hgt encontrados: {len(archivos_disponibles)}")
+        if not archivos_disponibles:
+            raise ValueError("No se pudo cargar ningún archivo .hgt válido")
         
         # Determinar límites reales basados en archivos disponibles
         lats_disponibles = [lat for lat, lon in archivos_disponibles.keys()]
         lons_disponibles = [lon for lat, lon in archivos_disponibles.keys()]
         
         # Construir listas ordenadas de coordenadas disponibles
-        self.latitudes_disponibles = sorted(list(set(lats_disponibles)), reverse=True)
-        self.longitudes_disponibles = sorted(list(set(lons_disponibles)))
+        self._fijar_geometria(sorted(set(lats_disponibles), reverse=True),
+                              sorted(set(lons_disponibles)))
+        
+        huella = huella_archivos(archivos_disponibles.values())
+        self._huella_archivos = huella
+        self.huella_terreno = resumen_huella(huella)
+        # Último: _asegurar_metadatos da la geometría por lista cuando lo ve
+        self.archivos_disponibles = archivos_disponibles
+        return archivos_disponibles
+    
+    def _fijar_geometria(self, latitudes=None, longitudes=None):
+        """
+        Límites y forma del mosaico a partir de las latitudes/longitudes disponibles.
+        
+        Las tablas se construyen aparte y se asignan ya terminadas: un hilo que
+        convierte coordenadas mientras otro vuelve a escanear nunca ve una
+        tabla a medio llenar.
+        
+        Args:
+            latitudes, longitudes: Grados de los archivos (por defecto
+                latitudes_disponibles y longitudes_disponibles)
+        """
+        latitudes = list(self.latitudes_disponibles if latitudes is None else latitudes)
+        longitudes = list(self.longitudes_disponibles if longitudes is None else longitudes)
+        
+        # Tablas de búsqueda O(1): grado entero -> posición del archivo en el
+        # mosaico (-1 si no hay archivos en ese grado)
+        lat_norte = max(latitudes)
+        lon_oeste = min(longitudes)
+        tabla_lat = np.full(lat_norte - min(latitudes) + 1, -1, dtype=np.int64)
+        tabla_lon = np.full(max(longitudes) - lon_oeste + 1, -1, dtype=np.int64)
+        for k, lat_disp in enumerate(latitudes):
+            tabla_lat[lat_norte - lat_disp] = k
+        for k, lon_disp in enumerate(longitudes):
+            tabla_lon[lon_disp - lon_oeste] = k
         
         # Establecer límites reales
-        self.lat_min_matriz = max(self.latitudes_disponibles)   # Norte
-        self.lat_max_matriz = min(self.latitudes_disponibles)   # Sur
-        self.lon_min_matriz = min(self.longitudes_disponibles)  # Oeste
-        self.lon_max_matriz = max(self.longitudes_disponibles)  # Este
+        self.lat_min_matriz = lat_norte        # Norte
+        self.lat_max_matriz = min(latitudes)   # Sur
+        self.lon_min_matriz = lon_oeste        # Oeste
+        self.lon_max_matriz = max(longitudes)  # Este
         
         print(f"Rango real de datos: Lat {self.lat_max_matriz}° a {self.lat_min_matriz}°, Lon {self.lon_min_matriz}° a {self.lon_max_matriz}°")
         
-        # Construir matriz con archivos disponibles
-        bloques = []
-        
-        for i, lat in enumerate(self.latitudes_disponibles):
-            fila = []
-            for j, lon in enumerate(self.longitudes_disponibles):
-                if (lat, lon) in archivos_disponibles:
-                    ruta = archivos_disponibles[(lat, lon)]
-                    bloque = self.cargar_hgt(ruta)
-                    if bloque is None:
-                        bloque = np.full((self.resolucion, self.resolucion), -32768)
-                else:
-                    # Crear bloque vacío si no existe el archivo
-                    bloque = np.full((self.resolucion, self.resolucion), -32768)
-                
-                # Recortar bordes compartidos para evitar duplicados
-                if j < len(self.longitudes_disponibles) - 1:
-                    bloque = bloque[:, :-1]
-                if i < len(self.latitudes_disponibles) - 1:
-                    bloque = bloque[:-1, :]
-                
-                fila.append(bloque)
+        self.forma_mosaico = (len(latitudes) * (self.resolucion - 1) + 1,
+                              len(longitudes) * (self.resolucion - 1) + 1)
+        self._lat_norte = lat_norte
+        self._lon_oeste = lon_oeste
+        self._tabla_lat = tabla_lat
+        self._tabla_lon = tabla_lon
+        self._lats_archivo = np.array(latitudes, dtype=np.float64)
+        self._lons_archivo = np.array(longitudes, dtype=np.float64)
+        self.latitudes_disponibles = latitudes
+        self.longitudes_disponibles = longitudes
+    
+    def _asegurar_metadatos(self):
+        """Escanea los archivos .hgt la primera vez que se necesita la geometría."""
+        if self.archivos_disponibles is None:
+            self.escanear_archivos()
+    
+    def _rutas_teselas(self):
+        """Rutas de los archivos en la disposición del mosaico (None si falta)."""
+        return [[self.archivos_disponibles.get((lat, lon)) for lon in self.longitudes_disponibles]
+                for lat in self.latitudes_disponibles]
+    
+    def cargar_terreno_ecuador(self):
+        """
+        Carga y une todos los archivos .hgt para formar el mapa de Ecuador.
+        
+        Returns:
+            La matriz de terreno publicada en matriz_terreno
+        """
+        with self._lock_carga:
+            print("Cargando datos de elevación de Ecuador...")
+            
+            # La geometría ya escaneada se reutiliza: volver a fijarla
+            # mientras otro hilo consulta no aporta nada
+            if not self.archivos_disponibles:
+                self.escanear_archivos()
+            
+            # Mosaico virtual: cada archivo se abre como memmap y solo se leen
+            # las páginas que las consultas tocan (no se unen con hstack/vstack)
+            mosaico = MosaicoTerreno(self._rutas_teselas(), self.resolucion)
             
-            if fila:  # Solo agregar si hay bloques en la fila
-                fila_unida = np.hstack(fila)
-                bloques.append(fila_unida)
+            if self.usar_cache:
+                matriz = self._abrir_o_construir_cache(mosaico, self._huella_archivos)
+            else:
+                matriz = mosaico
+            # La pirámide anterior se retira antes de publicar el terreno nuevo
+            self.piramide_maxima = None
+            self.matriz_terreno = matriz
+            print(f"Matriz de terreno cargada: {matriz.shape}")
+            return matriz
+    
+    def _terreno_completo(self):
+        """
+        Matriz de terreno completa, cargándola si aún no lo está.
         
-        if bloques:
-            self.matriz_terreno = np.vstack(bloques)
-            print(f"Matriz de terreno cargada: {self.matriz_terreno.shape}")
-        else:
-            raise ValueError("No se pudo cargar ningún archivo .hgt válido")
+        Si otro hilo la está cargando se espera a que termine en lugar de
+        cargarla dos veces.
+        """
+        matriz = self.matriz_terreno
+        if matriz is None:
+            with self._lock_carga:
+                matriz = self.matriz_terreno
+                if matriz is None:
+                    matriz = self.cargar_terreno_ecuador()
+        return matriz
+    
+    def leer_region(self, lat, lon, radio_km):
+        """
+        Lee solo la ventana de terreno de ±radio_km alrededor de un punto.
+        
+        Si el mosaico completo no está cargado, se leen únicamente los archivos
+        .hgt que intersecan la ventana, a través de un caché LRU limitado por
+        memoria_teselas_bytes. Las celdas de archivos faltantes valen -32768.
+        
+        Args:
+            lat, lon: Centro de la ventana
+            radio_km: Medio lado de la ventana en km
+            
+        Returns:
+            RegionTerreno(datos, i0, j0): matriz int16 y los índices globales
+            de su esquina superior izquierda
+        """
+        i_centro, j_centro = self.coordenadas_a_indices(lat, lon)
+        paso_metros = (1 / (self.resolucion - 1)) * 111000
+        radio_indices = int((radio_km * 1000) / paso_metros)
+        return self._leer_ventana(i_centro - radio_indices, i_centro + radio_indices + 1,
+                                  j_centro - radio_indices, j_centro + radio_indices + 1)
+    
+    def _mosaico_lru(self):
+        """Mosaico virtual que lee los archivos a través del caché LRU."""
+        self._asegurar_metadatos()
+        if self._mosaico_ventanas is None:
+            self._mosaico_ventanas = MosaicoTerreno(self._rutas_teselas(), self.resolucion,
+                                                    cache=self.cache_teselas)
+        return self._mosaico_ventanas
+    
+    def precargar_region(self, lat, lon, radio_km):
+        """
+        Calienta en segundo plano los datos de la ventana ±radio_km alrededor
+        de un punto, para que la siguiente consulta ya los encuentre en memoria.
+        
+        Con el caché LRU se decodifican en el pool de hilos los archivos .hgt
+        que intersecan la ventana; con el mosaico completo cargado se leen sus
+        páginas en un hilo aparte.
+        
+        Returns:
+            Lista de tareas (Future) lanzadas; puede estar vacía.
+        """
+        i_centro, j_centro = self.coordenadas_a_indices(lat, lon)
+        paso_metros = (1 / (self.resolucion - 1)) * 111000
+        radio_indices = int((radio_km * 1000) / paso_metros)
+        limites = (max(0, i_centro - radio_indices), i_centro + radio_indices + 1,
+                   max(0, j_centro - radio_indices), j_centro + radio_indices + 1)
+        
+        if self.matriz_terreno is not None:
+            threading.Thread(target=self._leer_ventana, args=limites, daemon=True).start()
+            return []
+        
+        mosaico = self._mosaico_lru()
+        return self.cache_teselas.precargar(mosaico.rutas_en_ventana(*limites))
+    
+    def _leer_ventana(self, i_min, i_max, j_min, j_max):
+        """Lee la ventana [i_min, i_max) x [j_min, j_max), recortada al mosaico."""
+        self._asegurar_metadatos()
+        i_min = max(0, i_min)
+        j_min = max(0, j_min)
+        i_max = min(self.forma_mosaico[0], i_max)
+        j_max = min(self.forma_mosaico[1], j_max)
+        
+        fuente = self.matriz_terreno
+        if fuente is None:
+            fuente = self._mosaico_lru()
+        datos = np.asarray(fuente[i_min:i_max, j_min:j_max])
+        self.reportar_intermedio("ventana de terreno", datos, np.int16)
+        return RegionTerreno(datos, i_min, j_min)
+    
+    def convertir_a_almacen_chunks(self, carpeta=None, tam_chunk=256):
+        """
+        Re-empaqueta el terreno en un almacén de chunks comprimidos con
+        estadísticas por chunk (ver almacen_chunks.py).
+        
+        Args:
+            carpeta: Carpeta de salida (por defecto <carpeta_cache>/chunks)
+            tam_chunk: Lado de cada chunk en celdas
+            
+        Returns:
+            Ruta de la carpeta del almacén
+        """
+        self._asegurar_metadatos()
+        carpeta = carpeta or os.path.join(self.carpeta_cache, 'chunks')
+        fuente = self.matriz_terreno
+        if fuente is None:
+            fuente = self._mosaico_lru()
+        metadatos = {
+            'huella': self.huella_terreno,
+            'resolucion': self.resolucion,
+            'latitudes': self.latitudes_disponibles,
+            'longitudes': self.longitudes_disponibles,
+        }
+        print(f"Convirtiendo terreno a chunks de {tam_chunk}x{tam_chunk} en {carpeta}...")
+        convertir_a_chunks(fuente, carpeta, tam_chunk=tam_chunk, metadatos=metadatos)
+        return carpeta
+    
+    def cargar_almacen_chunks(self, carpeta=None):
+        """
+        Usa un almacén por chunks como matriz de terreno (en lugar de los .hgt).
+        La geometría del mosaico se toma de los metadatos del almacén.
+        """
+        carpeta = carpeta or os.path.join(self.carpeta_cache, 'chunks')
+        almacen = AlmacenChunks(carpeta)
+        metadatos = almacen.metadatos
+        forma = tuple((len(metadatos[clave]) * (metadatos['resolucion'] - 1) + 1)
+                      for clave in ('latitudes', 'longitudes'))
+        if forma != almacen.shape:
+            raise ValueError(f"El almacén {carpeta} no coincide con su geometría declarada")
+        
+        with self._lock_carga:
+            self.resolucion = metadatos['resolucion']
+            self._fijar_geometria(metadatos['latitudes'], metadatos['longitudes'])
+            self.archivos_disponibles = {}
+            self.huella_terreno = metadatos.get('huella')
+            self.piramide_maxima = None
+            self.matriz_terreno = almacen
+        print(f"Almacén por chunks cargado: {almacen.shape}, chunks de {almacen.tam_chunk}")
+    
+    def estadisticas_region(self, i_min, i_max, j_min, j_max, datos=None):
+        """
+        Máximo, mínimo, mínimo positivo y celdas sin datos de una ventana.
+        
+        Con un almacén por chunks se usan sus estadísticas precalculadas; en
+        otro caso se calculan sobre `datos` o, si no se indica, leyendo la ventana.
+        
+        Args:
+            i_min, i_max, j_min, j_max: Límites de la ventana
+            datos: La ventana ya leída (evita volver a leerla)
+        
+        Returns:
+            dict con 'maximo', 'minimo', 'minimo_positivo' y 'sin_datos'
+        """
+        matriz = self.matriz_terreno
+        if hasattr(matriz, 'estadisticas'):
+            return matriz.estadisticas(i_min, i_max, j_min, j_max)
+        
+        if datos is None:
+            datos = self._leer_ventana(i_min, i_max, j_min, j_max).datos
+        minimo, maximo, minimo_positivo, sin_datos = estadisticas_bloque(datos)
+        hay_validos = sin_datos < datos.size
+        return {
+            'maximo': int(maximo) if hay_validos else None,
+            'minimo': int(minimo) if hay_validos else None,
+            'minimo_positivo': int(minimo_positivo) if minimo_positivo != np.iinfo(np.int16).max else None,
+            'sin_datos': int(sin_datos),
+        }
+    
+    def ruta_cache_mosaico(self):
+        """Ruta del archivo de caché con el mosaico unido."""
+        return os.path.join(self.carpeta_cache, 'mosaico_ecuador.cache')
+    
+    def _abrir_o_construir_cache(self, mosaico, huella):
+        """
+        Abre el mosaico unido desde el caché; si no existe o los archivos .hgt
+        cambiaron, lo reconstruye una vez. Si no se puede escribir el caché se
+        usa directamente el mosaico virtual.
+        """
+        ruta_cache = self.ruta_cache_mosaico()
+        resultado = abrir_cache_mosaico(ruta_cache, huella)
+        if resultado is not None:
+            print(f"Mosaico abierto desde caché: {ruta_cache}")
+            return resultado[0]
+        
+        print(f"Construyendo caché del mosaico en {ruta_cache}...")
+        metadatos = {
+            'huella': huella,
+            'resolucion': self.resolucion,
+            'latitudes': self.latitudes_disponibles,
+            'longitudes': self.longitudes_disponibles,
+        }
+        try:
+            escribir_cache_mosaico(ruta_cache, mosaico, metadatos)
+        except OSError as e:
+            print(f"[AVISO] No se pudo escribir el caché del mosaico: {e}")
+            return mosaico
+        
+        resultado = abrir_cache_mosaico(ruta_cache, huella)
+        return resultado[0] if resultado is not None else mosaico
+        
+    def cargar_piramide_maxima(self, num_niveles=NIVELES_PIRAMIDE):
+        """
+        Prepara la pirámide de máximos que usa calcular_horizonte(metodo='piramide').
+        
+        El nivel k guarda el máximo de cada bloque de 2**k x 2**k celdas y se
+        obtiene del anterior con máximos 2x2. Con usar_cache cada nivel se
+        guarda junto al caché del mosaico y solo se reconstruye si cambian los
+        archivos .hgt. Carga el mosaico completo si aún no está cargado.
+        
+        Returns:
+            Lista de niveles; el nivel 0 es la matriz de terreno
+        """
+        with self._lock_carga:
+            niveles = [self._terreno_completo()]
+            for nivel in range(1, num_niveles + 1):
+                niveles.append(self._abrir_o_construir_nivel(nivel, niveles[-1]))
+            self.piramide_maxima = niveles
+            return niveles
+    
+    def _niveles_piramide(self, num_niveles=NIVELES_PIRAMIDE):
+        """
+        Pirámide de máximos con al menos num_niveles niveles, cargándola si
+        falta. Si otro hilo la está preparando se espera a que termine.
+        """
+        niveles = self.piramide_maxima
+        if niveles is None or len(niveles) <= num_niveles:
+            with self._lock_carga:
+                niveles = self.piramide_maxima
+                if niveles is None or len(niveles) <= num_niveles:
+                    niveles = self.cargar_piramide_maxima(num_niveles)
+        return niveles
+    
+    def ruta_cache_piramide(self, nivel):
+        """Ruta del archivo de caché de un nivel de la pirámide de máximos."""
+        return os.path.join(self.carpeta_cache, f'piramide_ecuador_{nivel}.cache')
+    
+    def _abrir_o_construir_nivel(self, nivel, anterior):
+        """Abre un nivel de la pirámide desde el caché o lo calcula a partir del anterior."""
+        if not self.usar_cache or self.huella_terreno is None:
+            return reducir_maximo(anterior)
+        
+        ruta_cache = self.ruta_cache_piramide(nivel)
+        resultado = abrir_cache_mosaico(ruta_cache, self.huella_terreno)
+        if resultado is not None:
+            return resultado[0]
+        
+        print(f"Construyendo nivel {nivel} de la pirámide de máximos...")
+        matriz = reducir_maximo(anterior)
+        try:
+            escribir_cache_mosaico(ruta_cache, matriz, {'huella': self.huella_terreno, 'nivel': nivel})
+        except OSError as e:
+            print(f"[AVISO] No se pudo escribir el caché de la pirámide: {e}")
+        return matriz
+        
+    def cargar_catalogo_picos(self, prominencia_minima=150, nivel=4):
+        """
+        Prepara el catálogo de picos que usa picos_visibles.
+        
+        Se extrae una sola vez de la pirámide de máximos (ver
+        catalogo_picos.construir_catalogo) y, con usar_cache, se guarda en
+        <carpeta_cache>/picos_ecuador.npz junto con la huella del terreno.
+        
+        Args:
+            prominencia_minima: Prominencia mínima en metros
+            nivel: Nivel de la pirámide sobre el que se calcula la prominencia
+            
+        Returns:
+            CatalogoPicos
+        """
+        parametros = {'prominencia_minima': prominencia_minima, 'nivel': nivel,
+                      'cumbres': CUMBRES_CONOCIDAS}
+        ruta_cache = os.path.join(self.carpeta_cache, 'picos_ecuador.npz')
+        catalogo = None
+        if self.usar_cache and self.huella_terreno is not None and os.path.exists(ruta_cache):
+            catalogo = CatalogoPicos.abrir(ruta_cache, self.huella_terreno, parametros)
+        
+        if catalogo is None:
+            niveles = self._niveles_piramide(max(nivel, NIVELES_PIRAMIDE))
+            print(f"Construyendo catálogo de picos (prominencia >= {prominencia_minima} m)...")
+            cumbres = []
+            for nombre, lat, lon in CUMBRES_CONOCIDAS:
+                try:
+                    cumbres.append((nombre, *self.coordenadas_a_indices(lat, lon)))
+                except ValueError:
+                    pass
+            catalogo = construir_catalogo(niveles, nivel, prominencia_minima, cumbres, self.resolucion - 1)
+            print(f"Picos en el catálogo: {len(catalogo)}")
+            if self.usar_cache and self.huella_terreno is not None:
+                try:
+                    os.makedirs(self.carpeta_cache, exist_ok=True)
+                    catalogo.guardar(ruta_cache, self.huella_terreno, parametros)
+                except OSError as e:
+                    print(f"[AVISO] No se pudo guardar el catálogo de picos: {e}")
+        
+        self.catalogo_picos = catalogo
+        return catalogo
+    
+    def preparar_catalogo_picos(self, prominencia_minima=150, nivel=4):
+        """
+        Carga o construye el catálogo de picos en un hilo aparte.
+        
+        Construirlo la primera vez lee todo el mosaico y su pirámide (varios
+        segundos): la vista 3D lo pide así y no etiqueta cumbres hasta que
+        catalogo_picos está listo. Solo se lanza un hilo a la vez.
+        
+        Returns:
+            El hilo (threading.Thread) que lo prepara, o None si ya está listo
+        """
+        def preparar():
+            try:
+                self.cargar_catalogo_picos(prominencia_minima, nivel)
+            except (OSError, ValueError) as e:
+                print(f"[AVISO] No se pudo preparar el catálogo de picos: {e}")
+        
+        with self._lock_catalogo:
+            if self.catalogo_picos is not None:
+                return None
+            if self._hilo_catalogo is None or not self._hilo_catalogo.is_alive():
+                self._hilo_catalogo = threading.Thread(target=preparar, daemon=True)
+                self._hilo_catalogo.start()
+            return self._hilo_catalogo
+    
+    def picos_visibles(self, lat_observador, lon_observador, horizonte, altura_observador=1.7,
+                       max_distancia_km=50, tolerancia=0.1):
+        """
+        Picos del catálogo que forman parte de la silueta del horizonte.
         
+        Solo consulta el índice espacial y el perfil ya calculado; del
+        terreno lee únicamente la altura del observador.
+        
+        Args:
+            lat_observador, lon_observador: Posición del observador
+            horizonte: (angulos, elevaciones, distancias) de calcular_horizonte
+                para esa misma posición
+            altura_observador: Altura del observador sobre el terreno en metros
+            max_distancia_km: Radio de búsqueda en km
+            tolerancia: Grados que un pico puede quedar bajo la silueta
+            
+        Returns:
+            Lista de diccionarios (nombre, lat, lon, altura, prominencia,
+            azimut, elevacion, distancia_km), de mayor a menor prominencia
+        """
+        if self.catalogo_picos is None:
+            self.cargar_catalogo_picos()
+        
+        i_obs, j_obs = self.coordenadas_a_indices(lat_observador, lon_observador)
+        altura_terreno = self._leer_ventana(i_obs, i_obs + 1, j_obs, j_obs + 1)[0][0, 0]
+        if altura_terreno == -32768:
+            raise ValueError("No hay datos de elevación en la posición del observador")
+        
+        paso_metros = (1 / (self.resolucion - 1)) * 111000
+        max_pasos = int(max_distancia_km * 1000 / paso_metros)
+        angulos, elevaciones, _ = horizonte
+        picos = picos_visibles(self.catalogo_picos, i_obs, j_obs, altura_terreno + altura_observador,
+                               angulos, elevaciones, max_pasos, paso_metros, tolerancia)
+        for pico in picos:
+            pico['lat'], pico['lon'] = self.indices_a_coordenadas(pico['i'], pico['j'])
+        return picos
+    
+    @staticmethod
+    def _buscar_en_tabla(tabla, desplazamiento):
+        """Posición del archivo para cada desplazamiento en grados (-1 si no hay)."""
+        validos = np.isfinite(desplazamiento) & (desplazamiento >= 0) & (desplazamiento < len(tabla))
+        posiciones = np.full(desplazamiento.shape, -1, dtype=np.int64)
+        posiciones[validos] = tabla[desplazamiento[validos].astype(np.int64)]
+        return posiciones
+    
     def coordenadas_a_indices(self, lat, lon):
-        """Convierte coordenadas geográficas a índices de matriz."""
-        if self.matriz_terreno is None:
-            self.cargar_terreno_ecuador()
-        
-        lat_archivo = None
-        lon_archivo = None
-        
-        # Encontrar la latitud del archivo correspondiente
-        for lat_disp in self.latitudes_disponibles:
-            # El rango de un archivo hgt es [lat_disp, lat_disp+1)
-            if lat_disp <= lat < lat_disp + 1:
-                lat_archivo = lat_disp
-                break
-        
-        # Encontrar la longitud del archivo correspondiente
-        for lon_disp in self.longitudes_disponibles:
-            # El rango de un archivo hgt es [lon_disp, lon_disp+1)
-            if lon_disp <= lon < lon_disp + 1:
-                lon_archivo = lon_disp
-                break
-        
-        if lat_archivo is None or lon_archivo is None:
-            raise ValueError(f"Coordenada ({lat}, {lon}) fuera del rango de datos disponibles")
+        """
+        Convierte coordenadas geográficas a índices de matriz.
+        
+        Acepta escalares o arreglos de NumPy (lat y lon se combinan por
+        broadcasting). El cálculo es aritmético: el archivo de cada punto se
+        obtiene con floor() y una tabla de búsqueda, sin recorrer listas.
+        
+        Returns:
+            (fila, columna) como enteros para entradas escalares, o como
+            arreglos int64 para entradas vectoriales
+        """
+        self._asegurar_metadatos()
+        lat_arr, lon_arr = np.broadcast_arrays(np.asarray(lat, dtype=np.float64),
+                                               np.asarray(lon, dtype=np.float64))
+        
+        # El rango de un archivo hgt es [lat_disp, lat_disp+1)
+        lat_archivo = np.floor(lat_arr)
+        lon_archivo = np.floor(lon_arr)
+        indice_lat_archivo = self._buscar_en_tabla(self._tabla_lat, self._lat_norte - lat_archivo)
+        indice_lon_archivo = self._buscar_en_tabla(self._tabla_lon, lon_archivo - self._lon_oeste)
+        
+        fuera = (indice_lat_archivo < 0) | (indice_lon_archivo < 0)
+        if np.any(fuera):
+            if lat_arr.ndim == 0:
+                raise ValueError(f"Coordenada ({lat}, {lon}) fuera del rango de datos disponibles")
+            k = np.flatnonzero(fuera.ravel())[0]
+            raise ValueError(f"{int(fuera.sum())} coordenadas fuera del rango de datos disponibles "
+                             f"(p. ej. ({lat_arr.ravel()[k]}, {lon_arr.ravel()[k]}))")
 
         # Calcular índices dentro del archivo específico
-        lat_rel = lat - lat_archivo
-        lon_rel = lon - lon_archivo
+        lat_rel = lat_arr - lat_archivo
+        lon_rel = lon_arr - lon_archivo
 
         # Convertir a índices dentro del archivo (1201x1201)
         # La orientación de los archivos .hgt ya está de Norte a Sur,
-        # no se necesita inversión.
-        fila_archivo = int((self.resolucion - 1) - lat_rel * (self.resolucion - 1))
-        col_archivo = int(lon_rel * (self.resolucion - 1))
-
-        # Encontrar la posición del archivo en la matriz global
-        indice_lat_archivo = self.latitudes_disponibles.index(lat_archivo)
-        indice_lon_archivo = self.longitudes_disponibles.index(lon_archivo)
+        # no se necesita inversión. astype() trunca igual que int().
+        fila_archivo = ((self.resolucion - 1) - lat_rel * (self.resolucion - 1)).astype(np.int64)
+        col_archivo = (lon_rel * (self.resolucion - 1)).astype(np.int64)
 
         # Calcular índices globales
         fila_global = indice_lat_archivo * (self.resolucion - 1) + fila_archivo
         col_global = indice_lon_archivo * (self.resolucion - 1) + col_archivo
         
+        if fila_global.ndim == 0:
+            return int(fila_global), int(col_global)
         return fila_global, col_global
 
     
     def indices_a_coordenadas(self, i, j):
-        """Convierte índices de matriz a coordenadas geográficas."""
-        if self.matriz_terreno is None:
-            self.cargar_terreno_ecuador()
+        """
+        Convierte índices de matriz a coordenadas geográficas.
+        
+        Acepta escalares o arreglos de NumPy (por ejemplo, todos los puntos de
+        un rayo) y devuelve (lat, lon) del mismo tipo.
+        """
+        self._asegurar_metadatos()
+        i_arr, j_arr = np.broadcast_arrays(np.asarray(i, dtype=np.int64), np.asarray(j, dtype=np.int64))
         
         # Determinar en qué archivo estamos
-        indice_archivo_lat = i // (self.resolucion - 1)
-        indice_archivo_lon = j // (self.resolucion - 1)
+        indice_archivo_lat = i_arr // (self.resolucion - 1)
+        indice_archivo_lon = j_arr // (self.resolucion - 1)
+        
+        fuera = ((i_arr < 0) | (j_arr < 0) |
+                 (indice_archivo_lat >= len(self.latitudes_disponibles)) |
+                 (indice_archivo_lon >= len(self.longitudes_disponibles)))
+        if np.any(fuera):
+            if i_arr.ndim == 0:
+                raise ValueError(f"Índices ({i}, {j}) fuera del rango de la matriz")
+            raise ValueError(f"{int(fuera.sum())} pares de índices fuera del rango de la matriz")
         
         # Obtener coordenadas del archivo
-        if (indice_archivo_lat < len(self.latitudes_disponibles) and
-            indice_archivo_lon < len(self.longitudes_disponibles)):
-            
-            lat_archivo = self.latitudes_disponibles[indice_archivo_lat]
-            lon_archivo = self.longitudes_disponibles[indice_archivo_lon]
-            
-            # Calcular posición dentro del archivo
-            fila_archivo = i % (self.resolucion - 1)
-            col_archivo = j % (self.resolucion - 1)
-            
-            # Convertir a coordenadas. La inversión ya no es necesaria
-            lat_rel = (self.resolucion - 1 - fila_archivo) / (self.resolucion - 1)
-            lon_rel = col_archivo / (self.resolucion - 1)
-            
-            lat = lat_archivo + lat_rel
-            lon = lon_archivo + lon_rel
-            
-            return lat, lon
-        else:
-            raise ValueError(f"Índices ({i}, {j}) fuera del rango de la matriz")
+        lat_archivo = self._lats_archivo[indice_archivo_lat]
+        lon_archivo = self._lons_archivo[indice_archivo_lon]
+        
+        # Calcular posición dentro del archivo
+        fila_archivo = i_arr % (self.resolucion - 1)
+        col_archivo = j_arr % (self.resolucion - 1)
+        
+        # Convertir a coordenadas. La inversión ya no es necesaria
+        lat_rel = (self.resolucion - 1 - fila_archivo) / (self.resolucion - 1)
+        lon_rel = col_archivo / (self.resolucion - 1)
+        
+        lat = lat_archivo + lat_rel
+        lon = lon_archivo + lon_rel
+        
+        if lat.ndim == 0:
+            return float(lat), float(lon)
+        return lat, lon
     
     def calcular_horizonte(self, lat_observador, lon_observador, azimut, campo_vision=60, 
-                          altura_observador=1.7, max_distancia_km=50, num_rayos=360):
+                          altura_observador=1.7, max_distancia_km=50, num_rayos=360,
+                          metodo='vectorizado', tolerancia_angular=0.25, incremental=False,
+                          max_desplazamiento=2, num_hilos=None, refinar=False,
+                          tolerancia_elevacion=0.2, tolerancia_distancia=0.25, max_profundidad=4):
         """
         Calcula el perfil del horizonte visible desde una posición.
         
@@ -212,38 +719,317 @@ class SimuladorHorizonte:
             altura_observador: Altura del observador sobre el terreno en metros
             max_distancia_km: Distancia máxima a considerar en km
             num_rayos: Número de rayos para calcular el horizonte
+            metodo: 'vectorizado' (todos los rayos con NumPy, ver
+                motor_horizonte.py), 'piramide' (salta los tramos que no pueden
+                superar el horizonte; requiere el mosaico completo, ver
+                cargar_piramide_maxima), 'adaptativo' (muestras más espaciadas
+                con la distancia, leídas de la pirámide; aproximado) o
+                'iterativo' (bucle rayo a rayo de referencia)
+            tolerancia_angular: Error angular admitido en grados con
+                metodo='adaptativo'
+            incremental: Si True (solo con metodo='vectorizado'), al mover el
+                observador pocas celdas respecto al último cálculo completo
+                solo se recalcula el campo cercano (256 pasos por celda de
+                desplazamiento) y el lejano se corrige a partir de los
+                candidatos guardados (ver
+                motor_horizonte.elevaciones_incrementales). Es aproximado:
+                con desplazamientos de 1 a 2 celdas, sobre el mosaico de
+                Ecuador, el error medio es ~0.003°, el percentil 99 ~0.05° y
+                el máximo ~0.25°. No usa el caché de horizontes
+            max_desplazamiento: Celdas que puede alejarse el observador de la
+                posición del último cálculo completo antes de repetirlo. Con
+                más celdas el campo cercano crece hasta costar casi lo mismo
+                que el cálculo completo
+            num_hilos: Hilos entre los que se reparten los bloques de rayos
+                con metodo='vectorizado' (por defecto, según los núcleos
+                disponibles; 1 = en serie). El resultado no cambia.
+            refinar: Si True, num_rayos es la resolución inicial y los
+                intervalos entre rayos vecinos se bisecan mientras difieran
+                en más de tolerancia_elevacion grados o, en distancia, en
+                más de tolerancia_distancia (fracción de la mayor), hasta
+                max_profundidad niveles. Los ángulos devueltos quedan
+                ordenados pero no equiespaciados (ver
+                motor_horizonte.refinar_horizonte)
             
         Returns:
             angulos: Array de ángulos de cada rayo
             elevaciones: Array de ángulos de elevación del horizonte para cada rayo
             distancias: Array de distancias al horizonte para cada rayo
         """
-        if self.matriz_terreno is None:
-            self.cargar_terreno_ecuador()
+        if metodo not in ('vectorizado', 'piramide', 'adaptativo', 'iterativo'):
+            raise ValueError(f"Método de horizonte desconocido: {metodo}")
+        if incremental and metodo != 'vectorizado':
+            raise ValueError("El modo incremental solo está disponible con metodo='vectorizado'")
+        if incremental and refinar:
+            raise ValueError("El modo incremental no admite refinar=True")
         
         # Convertir posición del observador a índices
         i_obs, j_obs = self.coordenadas_a_indices(lat_observador, lon_observador)
+        filas, columnas = self.forma_mosaico
         
         # Verificar que el observador esté dentro de la matriz
-        if (i_obs < 0 or i_obs >= self.matriz_terreno.shape[0] or 
-            j_obs < 0 or j_obs >= self.matriz_terreno.shape[1]):
+        if (i_obs < 0 or i_obs >= filas or 
+            j_obs < 0 or j_obs >= columnas):
             raise ValueError("La posición del observador está fuera del área de datos")
         
-        altura_terreno = self.matriz_terreno[i_obs, j_obs]
+        # Conversión aproximada: 1 grado ≈ 111 km
+        paso_metros = (1 / (self.resolucion - 1)) * 111000  # metros por paso
+        max_pasos = int(max_distancia_km * 1000 / paso_metros)
+        
+        # Generar ángulos de los rayos
+        angulos = np.linspace(azimut - campo_vision/2, azimut + campo_vision/2, num_rayos)
+        
+        # Consulta ya calculada (el método iterativo es la referencia y no se
+        # guarda; con refinar los ángulos dependen del terreno). En modo
+        # incremental el resultado se guarda pero no se busca: un acierto no
+        # trae los candidatos lejanos que necesitan las consultas siguientes
+        clave = None
+        if (self.cache_horizontes is not None and self.huella_terreno and
+                metodo != 'iterativo' and not refinar):
+            clave = clave_horizonte(self.huella_terreno, i_obs, j_obs, azimut, campo_vision,
+                                    altura_observador, max_pasos, num_rayos, metodo,
+                                    tolerancia_angular if metodo == 'adaptativo' else None)
+            guardado = None if incremental else self.cache_horizontes.obtener(clave)
+            if guardado is not None:
+                return np.array(angulos), np.array(guardado[0]), np.array(guardado[1])
+        
+        # Modo incremental: vale el estado si la consulta es la misma y el
+        # observador no se ha alejado demasiado de su posición de referencia.
+        # El campo cercano crece con el desplazamiento (ver
+        # motor_horizonte.elevaciones_incrementales)
+        pasos_cerca = min(max_pasos, PASOS_CERCANOS_INCREMENTAL)
+        parametros_incrementales = (self.huella_terreno, azimut, campo_vision, altura_observador,
+                                    max_pasos, num_rayos)
+        estado = self.estado_incremental
+        usar_estado = False
+        if incremental and estado is not None and estado['parametros'] == parametros_incrementales:
+            desplazamiento = max(abs(i_obs - estado['i_obs']), abs(j_obs - estado['j_obs']))
+            usar_estado = desplazamiento <= max_desplazamiento
+            if usar_estado:
+                pasos_cerca = min(max_pasos, PASOS_CERCANOS_INCREMENTAL * max(1, desplazamiento))
+        
+        if metodo in ('piramide', 'adaptativo'):
+            # Las muestras se leen sueltas del mosaico completo, sin ventana
+            niveles = self._niveles_piramide()
+            altura_terreno = niveles[0][i_obs, j_obs]
+        else:
+            # Solo se lee la ventana que pueden alcanzar los rayos
+            alcance = pasos_cerca if usar_estado else max_pasos
+            region = self._leer_ventana(i_obs - alcance, i_obs + alcance + 1,
+                                        j_obs - alcance, j_obs + alcance + 1)
+            terreno, i0, j0 = region
+            altura_terreno = terreno[i_obs - i0, j_obs - j0]
+        
         if altura_terreno == -32768:
             raise ValueError("No hay datos de elevación en la posición del observador")
         
         altura_total = altura_terreno + altura_observador
         
-        # Generar ángulos de los rayos
-        angulos = np.linspace(azimut - campo_vision/2, azimut + campo_vision/2, num_rayos)
-        elevaciones = []
-        distancias = []
+        if usar_estado:
+            elevaciones, distancias = elevaciones_incrementales(estado['tramos'], terreno, (i0, j0),
+                                                                self.forma_mosaico, i_obs, j_obs,
+                                                                altura_total, angulos, pasos_cerca,
+                                                                max_pasos, paso_metros)
+            # Resultado aproximado: no se guarda en el caché
+            return np.array(angulos), np.array(elevaciones), np.array(distancias)
         
-        # Conversión aproximada: 1 grado ≈ 111 km
-        paso_indices = 1  # Paso en índices de matriz
-        paso_metros = (1 / (self.resolucion - 1)) * 111000  # metros por paso
+        def rayos(angulos_rayos):
+            """Elevación y distancia del horizonte en los azimuts dados."""
+            if metodo == 'piramide':
+                return elevaciones_rayos_piramide(niveles, i_obs, j_obs, altura_total,
+                                                  angulos_rayos, max_pasos, paso_metros)
+            if metodo == 'adaptativo':
+                return elevaciones_rayos_adaptativo(niveles, i_obs, j_obs, altura_total,
+                                                    angulos_rayos, max_pasos, paso_metros,
+                                                    tolerancia_angular)
+            if metodo == 'iterativo':
+                return self._rayos_iterativo(region, i_obs, j_obs, altura_total,
+                                             angulos_rayos, max_pasos, paso_metros)
+            return elevaciones_rayos(terreno, (i0, j0), self.forma_mosaico, i_obs, j_obs,
+                                     altura_total, angulos_rayos, max_pasos, paso_metros,
+                                     num_hilos=num_hilos)
+        
+        if refinar:
+            angulos, elevaciones, distancias = refinar_horizonte(rayos, angulos, tolerancia_elevacion,
+                                                                 tolerancia_distancia, max_profundidad)
+        else:
+            elevaciones, distancias = rayos(angulos)
+            if incremental:
+                tramos = tramos_lejanos(terreno, (i0, j0), self.forma_mosaico, i_obs, j_obs,
+                                        altura_total, angulos, pasos_cerca, max_pasos)
+                self.estado_incremental = {'parametros': parametros_incrementales,
+                                           'i_obs': i_obs, 'j_obs': j_obs, 'tramos': tramos}
+        
+        if clave is not None:
+            self.cache_horizontes.guardar(clave, elevaciones, distancias)
+        return np.array(angulos), np.array(elevaciones), np.array(distancias)
+    
+    def calcular_panorama(self, lat_observador, lon_observador, altura_observador=1.7,
+                          max_distancia_km=50, num_bins=360):
+        """
+        Horizonte de 360° recorriendo cada celda del radio una sola vez.
+        
+        Cada celda se asigna a los sectores de azimut que cubre y el horizonte
+        de cada sector es la mayor elevación entre ellas (ver
+        motor_horizonte.panorama_horizonte). A diferencia de los rayos, no se
+        escapan crestas estrechas entre dos rayos.
+        
+        Args:
+            lat_observador, lon_observador: Posición del observador
+            altura_observador: Altura del observador sobre el terreno en metros
+            max_distancia_km: Distancia máxima a considerar en km
+            num_bins: Número de sectores de azimut
+            
+        Returns:
+            angulos, elevaciones, distancias: Igual que calcular_horizonte,
+            con un ángulo por sector (0, 360/num_bins, ...)
+        """
+        i_obs, j_obs = self.coordenadas_a_indices(lat_observador, lon_observador)
+        filas, columnas = self.forma_mosaico
+        if (i_obs < 0 or i_obs >= filas or 
+            j_obs < 0 or j_obs >= columnas):
+            raise ValueError("La posición del observador está fuera del área de datos")
+        
+        paso_metros = (1 / (self.resolucion - 1)) * 111000
+        max_pasos = int(max_distancia_km * 1000 / paso_metros)
+        terreno, i0, j0 = self._leer_ventana(i_obs - max_pasos, i_obs + max_pasos + 1,
+                                             j_obs - max_pasos, j_obs + max_pasos + 1)
+        
+        altura_terreno = terreno[i_obs - i0, j_obs - j0]
+        if altura_terreno == -32768:
+            raise ValueError("No hay datos de elevación en la posición del observador")
+        
+        altura_total = altura_terreno + altura_observador
+        return panorama_horizonte(terreno, (i0, j0), i_obs, j_obs, altura_total,
+                                  max_pasos, paso_metros, num_bins)
+    
+    def calcular_visibilidad(self, lat_observador, lon_observador, altura_observador=1.7,
+                             max_distancia_km=50, altura_objetivo=0.0, empaquetada=False, hilos=None):
+        """
+        Celdas visibles desde una posición dentro de un radio (viewshed).
+        
+        Args:
+            lat_observador, lon_observador: Posición del observador
+            altura_observador: Altura del observador sobre el terreno en metros
+            max_distancia_km: Radio a considerar en km
+            altura_objetivo: Altura sobre el terreno del punto que se quiere ver (m)
+            empaquetada: Si True, la máscara se devuelve empaquetada en bits
+                por fila (np.packbits, 1 bit por celda)
+            hilos: Hilos para los sectores de azimut (ver visibilidad.py)
+            
+        Returns:
+            RegionTerreno(datos, i0, j0): máscara de celdas visibles (True =
+            visible) de la ventana ±max_distancia_km recortada al mosaico y
+            los índices globales de su esquina superior izquierda
+        """
+        i_obs, j_obs = self.coordenadas_a_indices(lat_observador, lon_observador)
+        filas, columnas = self.forma_mosaico
+        if (i_obs < 0 or i_obs >= filas or 
+            j_obs < 0 or j_obs >= columnas):
+            raise ValueError("La posición del observador está fuera del área de datos")
+        
+        paso_metros = (1 / (self.resolucion - 1)) * 111000
         max_pasos = int(max_distancia_km * 1000 / paso_metros)
+        terreno, i0, j0 = self._leer_ventana(i_obs - max_pasos, i_obs + max_pasos + 1,
+                                             j_obs - max_pasos, j_obs + max_pasos + 1)
+        
+        altura_terreno = terreno[i_obs - i0, j_obs - j0]
+        if altura_terreno == -32768:
+            raise ValueError("No hay datos de elevación en la posición del observador")
+        
+        visible = visibilidad_region(terreno, (i0, j0), i_obs, j_obs,
+                                     altura_terreno + altura_observador, max_pasos, paso_metros,
+                                     altura_objetivo, hilos)
+        if empaquetada:
+            visible = np.packbits(visible, axis=-1)
+        return RegionTerreno(visible, i0, j0)
+    
+    def calcular_lineas_vista(self, lats_a, lons_a, lats_b, lons_b, altura_a=1.7, altura_b=1.7,
+                              curvatura=True, factor_refraccion=4/3):
+        """
+        Línea de vista entre pares de puntos, todos a la vez.
+        
+        Args:
+            lats_a, lons_a: Coordenadas de los extremos A (escalares o arreglos)
+            lats_b, lons_b: Coordenadas de los extremos B
+            altura_a, altura_b: Altura sobre el terreno de cada extremo en metros
+                (escalares o arreglos)
+            curvatura: Si True, descuenta la curvatura terrestre con el radio
+                efectivo factor_refraccion * RADIO_TIERRA
+            factor_refraccion: Factor k de refracción atmosférica (4/3 estándar)
+            
+        Returns:
+            Diccionario de arreglos (uno por par):
+            - 'visible': True si B se ve desde A
+            - 'margen': holgura mínima en metros sobre el terreno (negativa si
+              el perfil está bloqueado; inf sin celdas intermedias; NaN si un
+              extremo no tiene datos)
+            - 'lat_obstruccion', 'lon_obstruccion': punto de holgura mínima
+              (el obstáculo si está bloqueado; NaN si no hay)
+            - 'distancia_obstruccion': distancia desde A a ese punto en metros
+        """
+        ia, ja = self.coordenadas_a_indices(lats_a, lons_a)
+        ib, jb = self.coordenadas_a_indices(lats_b, lons_b)
+        ia, ja, ib, jb = np.broadcast_arrays(ia, ja, ib, jb)
+        
+        matriz = self._terreno_completo()
+        
+        paso_metros = (1 / (self.resolucion - 1)) * 111000
+        radio_efectivo = factor_refraccion * RADIO_TIERRA if curvatura else None
+        visible, margen, i_min, j_min, distancia = lineas_de_vista(
+            matriz, ia, ja, ib, jb, altura_a, altura_b, paso_metros, radio_efectivo)
+        
+        lat_obs = np.full(len(margen), np.nan)
+        lon_obs = np.full(len(margen), np.nan)
+        hay = i_min >= 0
+        if np.any(hay):
+            lat_obs[hay], lon_obs[hay] = self.indices_a_coordenadas(i_min[hay], j_min[hay])
+        
+        forma = ia.shape
+        return {
+            'visible': visible.reshape(forma),
+            'margen': margen.reshape(forma),
+            'lat_obstruccion': lat_obs.reshape(forma),
+            'lon_obstruccion': lon_obs.reshape(forma),
+            'distancia_obstruccion': distancia.reshape(forma),
+        }
+    
+    def matriz_intervisibilidad(self, sitios, altura=1.7, curvatura=True, factor_refraccion=4/3):
+        """
+        Matriz N×N de intervisibilidad entre una lista de sitios.
+        
+        La línea de vista es simétrica, así que solo se calculan los pares
+        i < j y se copian a la otra mitad.
+        
+        Args:
+            sitios: Secuencia de (lat, lon)
+            altura: Altura sobre el terreno en metros (escalar o una por sitio)
+            curvatura, factor_refraccion: Igual que en calcular_lineas_vista
+            
+        Returns:
+            (visible, margen): matriz booleana y matriz de holguras en metros;
+            la diagonal es True / inf
+        """
+        sitios = np.asarray(sitios, dtype=np.float64).reshape(-1, 2)
+        n = len(sitios)
+        altura = np.broadcast_to(np.asarray(altura, dtype=np.float64), (n,))
+        a, b = np.triu_indices(n, k=1)
+        
+        visible = np.ones((n, n), dtype=bool)
+        margen = np.full((n, n), np.inf)
+        if len(a):
+            resultado = self.calcular_lineas_vista(sitios[a, 0], sitios[a, 1], sitios[b, 0], sitios[b, 1],
+                                                   altura[a], altura[b], curvatura, factor_refraccion)
+            visible[a, b] = visible[b, a] = resultado['visible']
+            margen[a, b] = margen[b, a] = resultado['margen']
+        return visible, margen
+    
+    def _rayos_iterativo(self, region, i_obs, j_obs, altura_total, angulos, max_pasos, paso_metros):
+        """Bucle rayo a rayo y paso a paso (implementación de referencia)."""
+        terreno, i0, j0 = region
+        filas, columnas = self.forma_mosaico
+        elevaciones = []
+        distancias = []
         
         for angulo in angulos:
             # Convertir ángulo a componentes de dirección
@@ -261,11 +1047,11 @@ class SimuladorHorizonte:
                 j_actual = int(j_obs + dj * paso)
                 
                 # Verificar límites
-                if (i_actual < 0 or i_actual >= self.matriz_terreno.shape[0] or
-                    j_actual < 0 or j_actual >= self.matriz_terreno.shape[1]):
+                if (i_actual < 0 or i_actual >= filas or
+                    j_actual < 0 or j_actual >= columnas):
                     break
                 
-                altura_punto = self.matriz_terreno[i_actual, j_actual]
+                altura_punto = terreno[i_actual - i0, j_actual - j0]
                 if altura_punto == -32768:
                     continue
                 
@@ -282,4 +1068,4 @@ class SimuladorHorizonte:
             elevaciones.append(max_elevacion)
             distancias.append(distancia_horizonte)
         
-        return np.array(angulos), np.array(elevaciones), np.array(distancias)
+        return elevaciones, distancias
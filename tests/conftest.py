@@ -0,0 +1,90 @@
+"""
+Datos de prueba: un mosaico pequeño de archivos .hgt sintéticos.
+
+Las pruebas se ejecutan desde la raíz del proyecto con `python -m pytest -q`.
+"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+RESOLUCION = 1201
+
+# (lat, lon) de los archivos creados; S01W077 falta a propósito
+TESELAS = [(0, -79), (0, -78), (0, -77), (-1, -79), (-1, -78)]
+
+
+# Centro, junto al borde norte del mosaico y con rayos hacia el archivo que falta
+OBSERVADORES = [(-0.3, -78.4), (0.98, -78.99), (-0.1, -77.3)]
+
+
+def comparar(simulador, lat, lon, **opciones):
+    """Compara calcular_horizonte con el bucle iterativo de referencia (mismos bits)."""
+    referencia = simulador.calcular_horizonte(lat, lon, 30, 300, 1.7, 40, 240, metodo='iterativo')
+    resultado = simulador.calcular_horizonte(lat, lon, 30, 300, 1.7, 40, 240, **opciones)
+    for esperado, obtenido in zip(referencia, resultado):
+        assert np.array_equal(esperado, obtenido)
+
+
+def nombre_hgt(lat, lon):
+    """Nombre SRTM del archivo cuya esquina suroeste es (lat, lon)."""
+    return f"{'N' if lat >= 0 else 'S'}{abs(lat):02d}{'E' if lon >= 0 else 'W'}{abs(lon):03d}.hgt"
+
+
+def terreno_sintetico(semilla, resolucion=RESOLUCION):
+    """Relieve suave con crestas, ruido y un hueco de celdas sin datos (-32768)."""
+    rng = np.random.default_rng(semilla)
+    y, x = np.mgrid[0:resolucion, 0:resolucion] / resolucion
+    relieve = 1500 + 800 * np.sin(2 * np.pi * (3 * x + rng.random())) * np.cos(2 * np.pi * (2 * y + rng.random()))
+    for _ in range(6):
+        ci, cj = rng.random(2)
+        relieve += rng.uniform(500, 2500) * np.exp(-((y - ci) ** 2 + (x - cj) ** 2) / 0.002)
+    relieve += rng.normal(0, 15, relieve.shape)
+    datos = np.rint(relieve).astype(np.int16)
+    i, j = rng.integers(100, resolucion - 200, 2)
+    datos[i:i + 60, j:j + 90] = -32768
+    return datos
+
+
+@pytest.fixture(scope='session')
+def carpeta_hgt(tmp_path_factory):
+    """Carpeta con los archivos de TESELAS (int16 big-endian, como SRTM)."""
+    carpeta = tmp_path_factory.mktemp('matrices')
+    for semilla, (lat, lon) in enumerate(TESELAS):
+        terreno_sintetico(semilla).astype('>i2').tofile(str(carpeta / nombre_hgt(lat, lon)))
+    return str(carpeta)
+
+
+@pytest.fixture(scope='session')
+def mosaico_base(carpeta_hgt):
+    """Mosaico unido con np.hstack/np.vstack, como lo construía la versión original."""
+    latitudes = sorted({lat for lat, _ in TESELAS}, reverse=True)
+    longitudes = sorted({lon for _, lon in TESELAS})
+    filas = []
+    for i, lat in enumerate(latitudes):
+        fila = []
+        for j, lon in enumerate(longitudes):
+            ruta = os.path.join(carpeta_hgt, nombre_hgt(lat, lon))
+            if os.path.exists(ruta):
+                bloque = np.fromfile(ruta, dtype='>i2').reshape(RESOLUCION, RESOLUCION)
+            else:
+                bloque = np.full((RESOLUCION, RESOLUCION), -32768)
+            if j < len(longitudes) - 1:
+                bloque = bloque[:, :-1]
+            if i < len(latitudes) - 1:
+                bloque = bloque[:-1, :]
+            fila.append(bloque)
+        filas.append(np.hstack(fila))
+    return np.vstack(filas).astype(np.int16)
+
+
+@pytest.fixture
+def simulador(carpeta_hgt, tmp_path):
+    """Simulador sobre los archivos sintéticos, con el caché en una carpeta temporal."""
+    from simulador_horizonte_corregido import SimuladorHorizonte
+    return SimuladorHorizonte(carpeta_hgt, carpeta_cache=str(tmp_path / 'cache'))
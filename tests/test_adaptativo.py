@@ -0,0 +1,47 @@
+"""Muestreo adaptativo: error acotado por la tolerancia y sin perder picos aislados."""
+
+import numpy as np
+
+from motor_horizonte import construir_piramide, elevaciones_rayos, elevaciones_rayos_adaptativo
+from conftest import OBSERVADORES
+
+PASO_METROS = 111000 / 1200
+
+
+def test_adaptativo_dentro_de_la_tolerancia(simulador):
+    simulador.cargar_terreno_ecuador()
+    for lat, lon in OBSERVADORES:
+        _, esperado, _ = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 80, 360, metodo='iterativo')
+        _, obtenido, _ = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 80, 360, metodo='adaptativo',
+                                                      tolerancia_angular=0.25)
+        assert np.max(np.abs(obtenido - esperado)) <= 0.25
+
+
+def test_adaptativo_no_pierde_un_pico_aislado():
+    # Una sola celda alta sobre terreno plano: el rayo la cruza entre dos
+    # muestras lejanas, en un bloque que no contiene a ninguna de ellas
+    terreno = np.zeros((2048, 2048), dtype=np.int16)
+    terreno[1355, 213] = 3000
+    angulos = np.array([1.8])
+    max_pasos = int(150000 / PASO_METROS)
+    exacta, _ = elevaciones_rayos(terreno, (0, 0), terreno.shape, 1800, 200, 1.7,
+                                  angulos, max_pasos, PASO_METROS)
+    aproximada, distancia = elevaciones_rayos_adaptativo(construir_piramide(terreno), 1800, 200, 1.7,
+                                                         angulos, max_pasos, PASO_METROS, 0.5)
+    assert exacta[0] > 4
+    assert abs(aproximada[0] - exacta[0]) <= 0.5
+    assert abs(distancia[0] - 41162.5) < 1000
+
+
+def test_adaptativo_con_picos_al_azar():
+    rng = np.random.default_rng(10)
+    terreno = np.zeros((1024, 1024), dtype=np.int16)
+    terreno[rng.integers(0, 1024, 40), rng.integers(0, 1024, 40)] = rng.integers(500, 3000, 40)
+    niveles = construir_piramide(terreno)
+    angulos = np.arange(0, 360, 0.5)
+    exacta, _ = elevaciones_rayos(terreno, (0, 0), terreno.shape, 500, 520, 1.7,
+                                  angulos, 1000, PASO_METROS)
+    for tolerancia in (0.25, 1.0):
+        aproximada, _ = elevaciones_rayos_adaptativo(niveles, 500, 520, 1.7, angulos, 1000,
+                                                     PASO_METROS, tolerancia)
+        assert np.all(aproximada >= exacta - tolerancia)
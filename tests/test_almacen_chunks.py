@@ -0,0 +1,63 @@
+"""Almacén de terreno por chunks comprimidos con zlib."""
+
+import numpy as np
+import pytest
+
+from almacen_chunks import AlmacenChunks, convertir_a_chunks, estadisticas_bloque
+from mosaico_terreno import NODATA
+
+TAM_CHUNK = 32
+
+
+@pytest.fixture(scope='module')
+def matriz():
+    rng = np.random.default_rng(6)
+    matriz = rng.integers(-50, 3000, (100, 130)).astype(np.int16)
+    matriz[:32, :32] = NODATA          # chunk vacío
+    matriz[:32, 32:64] = 1500          # chunk constante
+    matriz[40:45, 70:80] = NODATA      # hueco dentro de un chunk con datos
+    return matriz
+
+
+@pytest.fixture(scope='module')
+def carpeta(matriz, tmp_path_factory):
+    carpeta = str(tmp_path_factory.mktemp('chunks'))
+    convertir_a_chunks(matriz, carpeta, tam_chunk=TAM_CHUNK, metadatos={'lat_max': 1})
+    return carpeta
+
+
+def test_lectura_igual_a_la_matriz(matriz, carpeta):
+    almacen = AlmacenChunks(carpeta)
+    assert almacen.shape == matriz.shape and almacen.metadatos == {'lat_max': 1}
+    assert np.array_equal(almacen[:, :], matriz)
+    assert np.array_equal(almacen[10:90:3, 125:5:-7], matriz[10:90:3, 125:5:-7])
+    assert almacen[-1, -1] == matriz[-1, -1]
+
+    rng = np.random.default_rng(0)
+    i = rng.integers(0, matriz.shape[0], 2000)
+    j = rng.integers(0, matriz.shape[1], 2000)
+    assert np.array_equal(almacen[i, j], matriz[i, j])
+
+
+def test_chunks_constantes_sin_descomprimir(matriz, carpeta):
+    almacen = AlmacenChunks(carpeta)
+    assert np.array_equal(almacen[:32, :64], matriz[:32, :64])
+    assert len(almacen.cache) == 0 and almacen.cache.fallos == 0
+
+
+@pytest.mark.parametrize('ventana', [
+    (0, 100, 0, 130),       # todo el almacén
+    (0, 64, 0, 64),         # solo chunks enteros: se resuelve con el índice
+    (5, 77, 20, 101),       # bordes en medio de los chunks
+    (38, 47, 66, 83),       # alrededor del hueco sin datos
+])
+def test_estadisticas_igual_a_la_fuerza_bruta(matriz, carpeta, ventana):
+    i0, i1, j0, j1 = ventana
+    almacen = AlmacenChunks(carpeta)
+    stats = almacen.estadisticas(i0, i1, j0, j1)
+
+    minimo, maximo, positivo, sin_datos = estadisticas_bloque(matriz[i0:i1, j0:j1])
+    assert stats['maximo'] == maximo and stats['minimo'] == minimo
+    assert stats['minimo_positivo'] == positivo and stats['sin_datos'] == sin_datos
+    if i0 % TAM_CHUNK == 0 and j0 % TAM_CHUNK == 0 and i1 % TAM_CHUNK == 0 and j1 % TAM_CHUNK == 0:
+        assert len(almacen.cache) == 0
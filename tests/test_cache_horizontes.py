@@ -0,0 +1,99 @@
+"""Clave cuantizada, expulsión LRU por bytes y almacén en disco del caché de horizontes."""
+
+import os
+import numpy as np
+import pytest
+
+from cache_horizontes import CacheHorizontes, clave_horizonte
+
+
+def clave(**cambios):
+    consulta = dict(huella='h', i_obs=10, j_obs=20, azimut=45.0, campo_vision=60.0,
+                    altura_observador=1.7, max_pasos=540, num_rayos=360, metodo='vectorizado')
+    consulta.update(cambios)
+    return clave_horizonte(**consulta)
+
+
+def resultado(valor, n=100):
+    return np.full(n, valor, dtype=np.float64), np.arange(n, dtype=np.float64)
+
+
+def test_clave_cuantizada():
+    # Azimut y campo de visión a 0.01°, altura a 1 cm
+    assert clave(azimut=45.001) == clave(azimut=45.004) == clave()
+    assert clave(azimut=45.01) != clave()
+    assert clave(campo_vision=60.004) == clave()
+    assert clave(altura_observador=1.704) == clave()
+    assert clave(altura_observador=1.71) != clave()
+    # La tolerancia solo cuenta si se indica (método adaptativo), a 0.001°
+    assert clave(tolerancia_angular=0.25) == clave(tolerancia_angular=0.2504)
+    assert clave(tolerancia_angular=0.25) != clave()
+    for cambio in (dict(huella='otra'), dict(i_obs=11), dict(j_obs=21), dict(max_pasos=541),
+                   dict(num_rayos=361), dict(metodo='piramide')):
+        assert clave(**cambio) != clave()
+
+
+def test_expulsion_lru_por_bytes():
+    bytes_resultado = sum(a.nbytes for a in resultado(0))
+    cache = CacheHorizontes(max_bytes=2 * bytes_resultado)
+    cache.guardar('a', *resultado(1))
+    cache.guardar('b', *resultado(2))
+    assert cache.obtener('a') is not None      # 'a' pasa a ser la más reciente
+
+    cache.guardar('c', *resultado(3))
+    assert 'b' not in cache and 'a' in cache and 'c' in cache
+    assert cache.bytes_usados == 2 * bytes_resultado
+    assert cache.obtener('b') is None
+
+    estadisticas = cache.estadisticas()
+    assert (estadisticas['aciertos'], estadisticas['fallos'], estadisticas['entradas']) == (1, 1, 2)
+
+
+def test_resultado_de_solo_lectura():
+    cache = CacheHorizontes()
+    elevaciones = np.ones(10)
+    cache.guardar('a', elevaciones, np.ones(10))
+    elevaciones[:] = 5    # el caché guarda su propia copia
+    guardado = cache.obtener('a')
+    assert np.all(guardado[0] == 1)
+    with pytest.raises(ValueError):
+        guardado[0][0] = 2
+
+
+def test_disco_ida_y_vuelta(tmp_path):
+    carpeta = str(tmp_path / 'horizontes')
+    k = clave()
+    CacheHorizontes(carpeta=carpeta).guardar(k, *resultado(7))
+    assert not [n for n in os.listdir(carpeta) if n.endswith('.tmp')]
+
+    # Otra sesión: fallo en memoria, acierto en disco y luego en memoria
+    cache = CacheHorizontes(carpeta=carpeta)
+    elevaciones, distancias = cache.obtener(k)
+    assert np.array_equal(elevaciones, resultado(7)[0]) and np.array_equal(distancias, resultado(7)[1])
+    assert cache.obtener(k) is not None
+    assert (cache.aciertos_disco, cache.aciertos) == (1, 1)
+    assert cache.obtener(clave(i_obs=11)) is None
+
+
+def test_disco_ilegible_o_de_otra_clave(tmp_path):
+    carpeta = str(tmp_path / 'horizontes')
+    cache = CacheHorizontes(carpeta=carpeta)
+    k, otra = clave(), clave(j_obs=99)
+    cache.guardar(k, *resultado(1))
+
+    # Un archivo con el nombre de `otra` pero con otra clave dentro (choque de hash)
+    os.replace(cache._ruta(k), cache._ruta(otra))
+    assert CacheHorizontes(carpeta=carpeta).obtener(otra) is None
+
+    with open(cache._ruta(otra), 'wb') as f:
+        f.write(b'no es un npz')
+    assert CacheHorizontes(carpeta=carpeta).obtener(otra) is None
+
+
+def test_simulador_usa_el_cache(simulador):
+    simulador.cargar_terreno_ecuador()
+    primero = simulador.calcular_horizonte(-0.3, -78.4, 90, 120, 1.7, 30, 120)
+    segundo = simulador.calcular_horizonte(-0.3, -78.4, 90.001, 120, 1.7, 30, 120)
+    assert simulador.cache_horizontes.estadisticas()['aciertos'] == 1
+    for a, b in zip(primero[1:], segundo[1:]):
+        assert np.array_equal(a, b)
@@ -0,0 +1,37 @@
+"""Caché persistente del mosaico unido (memmap)."""
+
+import os
+import numpy as np
+
+from mosaico_terreno import escribir_cache_mosaico, abrir_cache_mosaico
+
+
+def test_cache_mosaico_ida_y_vuelta(tmp_path, mosaico_base):
+    ruta = str(tmp_path / 'mosaico.cache')
+    escribir_cache_mosaico(ruta, mosaico_base, {'huella': 'abc'}, filas_por_bloque=500)
+    assert os.listdir(tmp_path) == ['mosaico.cache']   # sin temporales
+
+    abierto = abrir_cache_mosaico(ruta, 'abc')
+    assert abierto is not None
+    matriz, encabezado = abierto
+    assert isinstance(matriz, np.memmap)
+    assert matriz.dtype == np.int16 and encabezado['huella'] == 'abc'
+    assert np.array_equal(matriz, mosaico_base)
+    del matriz
+
+    # Otra huella (archivos .hgt cambiados) o un archivo truncado invalidan el caché
+    assert abrir_cache_mosaico(ruta, 'otra') is None
+    with open(ruta, 'r+b') as f:
+        f.truncate(os.path.getsize(ruta) - 2)
+    assert abrir_cache_mosaico(ruta, 'abc') is None
+
+
+def test_simulador_reabre_el_cache(simulador, mosaico_base):
+    simulador.cargar_terreno_ecuador()
+    assert np.array_equal(simulador.matriz_terreno, mosaico_base)
+
+    from simulador_horizonte_corregido import SimuladorHorizonte
+    otro = SimuladorHorizonte(simulador.carpeta_matrices, carpeta_cache=simulador.carpeta_cache)
+    otro.cargar_terreno_ecuador()
+    assert isinstance(otro.matriz_terreno, np.memmap)
+    assert np.array_equal(otro.matriz_terreno, mosaico_base)
@@ -0,0 +1,114 @@
+"""Prominencia de las cimas y catálogo de picos preparado en segundo plano."""
+
+import os
+import numpy as np
+import pytest
+
+from catalogo_picos import prominencias, CatalogoPicos, CUMBRES_CONOCIDAS
+from mosaico_terreno import NODATA
+
+
+def prominencias_referencia(alturas):
+    """Recorrido celda a celda de mayor a menor altura con union-find (versión original)."""
+    filas, columnas = alturas.shape
+    plana = alturas.ravel().tolist()
+    orden = [c for c in np.argsort(-alturas.ravel().astype(np.int32), kind='stable').tolist()
+             if plana[c] != NODATA]
+    padre, cima_de, resultado = {}, {}, {}
+
+    def raiz(x):
+        while padre[x] != x:
+            x = padre[x]
+        return x
+
+    for celda in orden:
+        i, j = divmod(celda, columnas)
+        raices = {raiz(vi * columnas + vj)
+                  for vi in range(i - 1, i + 2) for vj in range(j - 1, j + 2)
+                  if 0 <= vi < filas and 0 <= vj < columnas and vi * columnas + vj in padre}
+        padre[celda] = celda
+        if not raices:
+            cima_de[celda] = celda
+            continue
+        principal = max(raices, key=lambda r: plana[cima_de[r]])
+        for r in raices - {principal}:
+            cima = cima_de.pop(r)
+            resultado[cima] = plana[cima] - plana[celda]
+            padre[r] = principal
+        padre[celda] = principal
+    for cima in cima_de.values():
+        resultado[cima] = plana[cima]
+    return resultado
+
+
+def test_dos_cimas_y_un_collado():
+    alturas = np.array([[0, 5, 2, 8, 0]], dtype=np.int16)
+    cimas, prominencia = prominencias(alturas)
+    assert dict(zip(cimas.tolist(), prominencia.tolist())) == {3: 8, 1: 3}
+
+
+def test_sin_datos_no_conecta():
+    alturas = np.array([[5, NODATA, 8]], dtype=np.int16)
+    cimas, prominencia = prominencias(alturas)
+    assert dict(zip(cimas.tolist(), prominencia.tolist())) == {0: 5, 2: 8}
+
+
+@pytest.mark.parametrize('semilla', range(4))
+def test_igual_al_recorrido_celda_a_celda(semilla):
+    rng = np.random.default_rng(semilla)
+    alturas = rng.normal(0, 5, (60, 80)).cumsum(0).cumsum(1).astype(np.int16)
+    alturas[rng.random(alturas.shape) < 0.05] = NODATA
+    esperado = prominencias_referencia(alturas)
+    cimas, prominencia = prominencias(alturas)
+    # Las mismas cimas; entre cimas de igual altura la que queda dominada
+    # puede ser otra, así que se comparan los pares (altura, prominencia)
+    assert sorted(cimas.tolist()) == sorted(esperado)
+    plana = alturas.ravel()
+    assert (sorted(zip(plana[cimas].tolist(), prominencia.tolist())) ==
+            sorted((int(plana[c]), p) for c, p in esperado.items()))
+
+
+def test_catalogo_en_segundo_plano(simulador):
+    hilo = simulador.preparar_catalogo_picos(prominencia_minima=100)
+    assert hilo is not None
+    hilo.join()
+    assert isinstance(simulador.catalogo_picos, CatalogoPicos) and len(simulador.catalogo_picos)
+    assert simulador.preparar_catalogo_picos() is None
+
+    ruta = os.path.join(simulador.carpeta_cache, 'picos_ecuador.npz')
+    assert os.listdir(simulador.carpeta_cache).count('picos_ecuador.npz') == 1
+    parametros = {'prominencia_minima': 100, 'nivel': 4, 'cumbres': CUMBRES_CONOCIDAS}
+    assert CatalogoPicos.abrir(ruta, simulador.huella_terreno, parametros) is not None
+
+    horizonte = simulador.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 50, 360)
+    picos = simulador.picos_visibles(-0.3, -78.4, horizonte, 1.7, 50)
+    assert all(p['prominencia'] >= 100 for p in picos)
+
+
+def test_consultas_mientras_se_prepara_el_catalogo(simulador, carpeta_hgt, tmp_path):
+    from simulador_horizonte_corregido import SimuladorHorizonte
+    referencia = SimuladorHorizonte(carpeta_hgt, carpeta_cache=str(tmp_path / 'referencia'),
+                                    memoria_horizontes_bytes=0)
+    lats = np.linspace(-0.99, 0.99, 50)
+    lons = np.linspace(-78.99, -76.01, 50)
+    indices = referencia.coordenadas_a_indices(lats, lons)
+    esperados = {metodo: referencia.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 20, 90, metodo=metodo)
+                 for metodo in ('vectorizado', 'piramide')}
+
+    escaneos = []
+    escanear = simulador.escanear_archivos
+    simulador.escanear_archivos = lambda: escaneos.append(1) or escanear()
+    simulador.cache_horizontes = None
+    simulador.coordenadas_a_indices(0.0, -78.0)
+    hilo = simulador.preparar_catalogo_picos()
+    # Mientras el hilo carga el terreno y la pirámide, la geometría no cambia
+    # y las consultas que necesitan la pirámide esperan a la carga en curso
+    while hilo.is_alive():
+        obtenidos = simulador.coordenadas_a_indices(lats, lons)
+        assert all(np.array_equal(a, b) for a, b in zip(indices, obtenidos))
+        for metodo, esperado in esperados.items():
+            obtenido = simulador.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 20, 90, metodo=metodo)
+            assert all(np.array_equal(a, b) for a, b in zip(esperado, obtenido))
+    hilo.join()
+    assert simulador.catalogo_picos is not None
+    assert len(escaneos) == 1
@@ -0,0 +1,43 @@
+"""Escala de color de la vista 3D (malla_terreno.normalizar_elevacion)."""
+
+import numpy as np
+import pytest
+
+from malla_terreno import normalizar_elevacion, tabla_color_elevacion
+
+
+def normalizar_referencia(elevaciones, max_total):
+    """Bucle punto a punto con los tramos de la versión original."""
+    resultado = np.zeros(len(elevaciones))
+    for i, elev in enumerate(elevaciones):
+        if elev <= 0:
+            resultado[i] = 0.0
+        elif elev <= 10:
+            resultado[i] = (elev / 10) * 0.15
+        elif elev <= 20:
+            resultado[i] = 0.15 + ((elev - 10) / 10) * 0.15
+        elif max_total > 20:
+            resultado[i] = 0.3 + ((elev - 20) / (max_total - 20)) * 0.7
+        else:
+            resultado[i] = 0.3
+    return resultado
+
+
+@pytest.mark.parametrize('max_total', [6310, 20, 15])
+def test_igual_al_bucle_por_tramos(max_total):
+    rng = np.random.default_rng(22)
+    terreno = rng.integers(-500, max_total + 1, (70, 90)).astype(np.int16)
+    terreno[0, :6] = [-32768, 0, 10, 20, 21, max_total]
+    esperado = normalizar_referencia(terreno.ravel().tolist(), max_total)
+    obtenido = normalizar_elevacion(terreno, max_total)
+    assert obtenido.dtype == np.float32 and obtenido.shape == (terreno.size,)
+    assert np.allclose(obtenido, esperado, atol=1e-6)
+
+
+def test_maximo_por_defecto_y_orden_fortran():
+    terreno = np.array([[0, 10], [20, 1020]], dtype=np.int16)
+    assert normalizar_elevacion(terreno).tolist() == pytest.approx([0.0, 0.15, 0.3, 1.0])
+    assert normalizar_elevacion(terreno, orden='F').tolist() == pytest.approx([0.0, 0.3, 0.15, 1.0])
+    # Cada elevación int16 tiene su entrada: la posición de e es e + 32768
+    tabla = tabla_color_elevacion(1020)
+    assert len(tabla) == 65536 and tabla[32768 + 1020] == 1.0 and tabla[0] == 0.0
@@ -0,0 +1,49 @@
+"""Conversión coordenadas ↔ índices, escalar y vectorizada."""
+
+import numpy as np
+import pytest
+
+
+def indices_referencia(sim, lat, lon):
+    """Versión anterior: recorre las listas de latitudes/longitudes disponibles."""
+    lat_archivo = next(l for l in sim.latitudes_disponibles if l <= lat < l + 1)
+    lon_archivo = next(l for l in sim.longitudes_disponibles if l <= lon < l + 1)
+    fila = int((sim.resolucion - 1) - (lat - lat_archivo) * (sim.resolucion - 1))
+    columna = int((lon - lon_archivo) * (sim.resolucion - 1))
+    return (sim.latitudes_disponibles.index(lat_archivo) * (sim.resolucion - 1) + fila,
+            sim.longitudes_disponibles.index(lon_archivo) * (sim.resolucion - 1) + columna)
+
+
+def test_escalar_igual_a_la_referencia(simulador):
+    simulador.escanear_archivos()
+    rng = np.random.default_rng(7)
+    for lat, lon in zip(rng.uniform(-0.999, 0.999, 300), rng.uniform(-79, -76.001, 300)):
+        indices = simulador.coordenadas_a_indices(float(lat), float(lon))
+        assert indices == indices_referencia(simulador, lat, lon)
+        assert all(type(k) is int for k in indices)
+
+
+def test_vectorizado_igual_al_escalar(simulador):
+    rng = np.random.default_rng(8)
+    lat = rng.uniform(-0.999, 0.999, 500)
+    lon = rng.uniform(-79, -76.001, 500)
+    filas, columnas = simulador.coordenadas_a_indices(lat, lon)
+    assert filas.dtype == np.int64 and filas.shape == lat.shape
+    assert list(zip(filas.tolist(), columnas.tolist())) == [
+        simulador.coordenadas_a_indices(float(a), float(b)) for a, b in zip(lat, lon)]
+
+    lats, lons = simulador.indices_a_coordenadas(filas, columnas)
+    for k in range(0, 500, 50):
+        assert (lats[k], lons[k]) == simulador.indices_a_coordenadas(int(filas[k]), int(columnas[k]))
+    # Ida y vuelta: int() trunca, así que el redondeo puede mover una celda
+    filas_vuelta, columnas_vuelta = simulador.coordenadas_a_indices(lats, lons)
+    assert np.abs(filas_vuelta - filas).max() <= 1 and np.abs(columnas_vuelta - columnas).max() <= 1
+
+
+def test_fuera_de_rango(simulador):
+    with pytest.raises(ValueError):
+        simulador.coordenadas_a_indices(5.5, -78.2)
+    with pytest.raises(ValueError):
+        simulador.coordenadas_a_indices(np.array([-0.5, -0.5]), np.array([-78.2, -90.0]))
+    with pytest.raises(ValueError):
+        simulador.indices_a_coordenadas(np.array([10, 99999]), np.array([10, 10]))
@@ -0,0 +1,32 @@
+"""El reparto de los bloques de rayos en hilos no cambia el resultado."""
+
+import numpy as np
+import pytest
+
+import motor_horizonte
+from simulador_horizonte_corregido import SimuladorHorizonte
+from conftest import OBSERVADORES, comparar
+
+
+@pytest.mark.parametrize('lat, lon', OBSERVADORES)
+def test_vectorizado_en_hilos_igual_al_iterativo(simulador, monkeypatch, lat, lon):
+    # Bloques pequeños y sin mínimo para repartir: varios bloques por hilo
+    monkeypatch.setattr(motor_horizonte, 'MIN_ELEMENTOS_HILOS', 0)
+    monkeypatch.setattr(motor_horizonte, 'MAX_ELEMENTOS_BLOQUE', 2 ** 12)
+    simulador.cargar_terreno_ecuador()
+    comparar(simulador, lat, lon, metodo='vectorizado', num_hilos=3)
+
+
+@pytest.mark.parametrize('lat, lon', OBSERVADORES)
+def test_hilos_igual_a_serie(carpeta_hgt, tmp_path, lat, lon):
+    # 3600 rayos a 40 km superan MIN_ELEMENTOS_HILOS y se parten en bloques
+    simulador = SimuladorHorizonte(carpeta_hgt, carpeta_cache=str(tmp_path), memoria_horizontes_bytes=0)
+    simulador.cargar_terreno_ecuador()
+    assert 3600 * int(40000 / (111000 / 1200)) > max(motor_horizonte.MIN_ELEMENTOS_HILOS,
+                                                     motor_horizonte.MAX_ELEMENTOS_BLOQUE)
+    serie = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 40, 3600, num_hilos=1)
+    for _ in range(2):
+        # La segunda vez reutiliza el pool de hilos del proceso
+        en_hilos = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 40, 3600, num_hilos=4)
+        for esperado, obtenido in zip(serie, en_hilos):
+            assert np.array_equal(esperado, obtenido)
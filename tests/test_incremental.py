@@ -0,0 +1,51 @@
+"""Modo incremental: reutiliza el campo lejano al mover poco al observador."""
+
+import numpy as np
+import pytest
+
+
+def test_incremental_tras_acierto_del_cache(simulador):
+    simulador.cargar_terreno_ecuador()
+    simulador.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 60, 360)
+    # La misma consulta ya está en el caché, pero el modo incremental
+    # necesita guardar los candidatos lejanos
+    simulador.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 60, 360, incremental=True)
+    assert simulador.estado_incremental is not None
+
+
+@pytest.mark.parametrize('celdas', [1, 2])
+def test_incremental_cerca_del_exacto(simulador, celdas):
+    simulador.cargar_terreno_ecuador()
+    simulador.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 100, 360, incremental=True)
+    lat, lon = -0.3 + celdas / 1200, -78.4 + celdas / 1200
+    _, aproximado, _ = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 100, 360, incremental=True)
+    _, exacto, _ = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 100, 360)
+    assert np.max(np.abs(aproximado - exacto)) < 0.3
+    assert np.mean(np.abs(aproximado - exacto)) < 0.01
+
+
+def test_lejos_de_la_referencia_recalcula(simulador):
+    simulador.cargar_terreno_ecuador()
+    simulador.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 60, 180, incremental=True)
+    # 5 celdas > max_desplazamiento: cálculo completo y nueva referencia
+    lat, lon = -0.3 + 5 / 1200, -78.4
+    _, movido, _ = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 60, 180, incremental=True)
+    _, exacto, _ = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 60, 180, metodo='iterativo')
+    assert np.array_equal(movido, exacto)
+    assert (simulador.estado_incremental['i_obs'], simulador.estado_incremental['j_obs']) == \
+        simulador.coordenadas_a_indices(lat, lon)
+
+
+def test_radio_corto_es_exacto(simulador):
+    # Con menos pasos que el campo cercano no hay campo lejano que aproximar
+    simulador.cargar_terreno_ecuador()
+    simulador.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 20, 180, incremental=True)
+    lat, lon = -0.3 + 1 / 1200, -78.4 - 1 / 1200
+    _, aproximado, _ = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 20, 180, incremental=True)
+    _, exacto, _ = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 20, 180, metodo='iterativo')
+    assert np.array_equal(aproximado, exacto)
+
+
+def test_incremental_solo_con_vectorizado(simulador):
+    with pytest.raises(ValueError):
+        simulador.calcular_horizonte(-0.3, -78.4, 0, 360, incremental=True, metodo='piramide')
@@ -0,0 +1,45 @@
+"""Lectura por ventanas (leer_region) y caché LRU de archivos decodificados."""
+
+import numpy as np
+import pytest
+
+from mosaico_terreno import MosaicoTerreno, CacheTeselas
+
+
+@pytest.mark.parametrize('ventana', [
+    (0, 50, 0, 50),              # esquina
+    (1150, 1250, 1150, 1250),    # cruza los bordes compartidos de cuatro archivos
+    (1300, 2401, 2300, 3601),    # incluye el archivo que falta
+    (2400, 2401, 0, 3601),       # última fila
+])
+def test_ventana_igual_al_apilado(simulador, mosaico_base, ventana):
+    i0, i1, j0, j1 = ventana
+    simulador.escanear_archivos()
+    virtual = MosaicoTerreno(simulador._rutas_teselas(), simulador.resolucion)
+    con_cache = MosaicoTerreno(simulador._rutas_teselas(), simulador.resolucion,
+                               cache=CacheTeselas(8 * 1024 ** 2))
+    esperado = mosaico_base[i0:i1, j0:j1]
+    assert np.array_equal(virtual[i0:i1, j0:j1], esperado)
+    assert np.array_equal(con_cache[i0:i1, j0:j1], esperado)
+
+
+def test_leer_region_igual_al_apilado(simulador, mosaico_base):
+    region = simulador.leer_region(-0.2, -78.5, 20)
+    filas, columnas = region.datos.shape
+    assert np.array_equal(region.datos, mosaico_base[region.i0:region.i0 + filas,
+                                                     region.j0:region.j0 + columnas])
+
+
+def test_cache_teselas_limita_los_bytes(simulador):
+    simulador.escanear_archivos()
+    rutas = [r for fila in simulador._rutas_teselas() for r in fila if r]
+    bytes_tesela = simulador.resolucion ** 2 * 2
+    cache = CacheTeselas(2 * bytes_tesela, resolucion=simulador.resolucion)
+
+    cache.obtener(rutas[0])
+    cache.obtener(rutas[1])
+    cache.obtener(rutas[0])            # rutas[1] pasa a ser la menos reciente
+    cache.obtener(rutas[2])
+    assert rutas[0] in cache and rutas[2] in cache and rutas[1] not in cache
+    assert cache.bytes_usados == 2 * bytes_tesela
+    assert (cache.aciertos, cache.fallos) == (1, 3)
@@ -0,0 +1,67 @@
+"""Línea de vista entre pares de puntos frente a perfiles calculados a mano."""
+
+import math
+import numpy as np
+import pytest
+
+import visibilidad
+from visibilidad import lineas_de_vista
+from mosaico_terreno import NODATA
+
+PASO_METROS = 100.0
+
+
+@pytest.fixture
+def terreno():
+    terreno = np.full((20, 20), 100, dtype=np.int16)
+    terreno[0, 4] = 103          # obstáculo en la fila 0
+    terreno[5, 1:9] = NODATA     # perfil de la fila 5 sin datos
+    return terreno
+
+
+def test_perfil_a_mano(terreno):
+    # A (0, 0) y B (0, 10), ojos a 102 m: las muestras j = 1..9 tienen
+    # holgura 2 salvo el obstáculo (j = 4), con holgura 102 - 103 = -1
+    visible, margen, i, j, distancia = lineas_de_vista(terreno, [0], [0], [0], [10], 2.0, 2.0, PASO_METROS)
+    assert not visible[0]
+    assert margen[0] == pytest.approx(-1.0)
+    assert (i[0], j[0]) == (0, 4) and distancia[0] == pytest.approx(400.0)
+
+    # Con curvatura la muestra j resta d1 * (L - d1) / (2 R)
+    radio = 50000.0
+    _, margen, _, j, _ = lineas_de_vista(terreno, [0], [0], [0], [10], 2.0, 2.0, PASO_METROS, radio)
+    caidas = [k * 100.0 * (1000.0 - k * 100.0) / (2 * radio) for k in range(1, 10)]
+    holguras = [2.0 - c for c in caidas]
+    holguras[3] = -1.0 - caidas[3]
+    assert margen[0] == pytest.approx(min(holguras)) and j[0] == 4
+
+
+def test_diagonal_y_alturas_distintas(terreno):
+    # A (10, 0) a 1 m y B (16, 6) a 31 m: la recta sube 5 m por muestra
+    visible, margen, i, j, distancia = lineas_de_vista(terreno, [10], [0], [16], [6], 1.0, 31.0, PASO_METROS)
+    assert visible[0]
+    assert margen[0] == pytest.approx(101.0 + 30.0 / 6 - 100.0)
+    assert (i[0], j[0]) == (11, 1)
+    assert distancia[0] == pytest.approx(math.hypot(6, 6) * PASO_METROS / 6)
+
+
+def test_extremos_y_perfiles_sin_datos(terreno):
+    visible, margen, i, j, distancia = lineas_de_vista(
+        terreno, [5, 5, 2], [0, 1, 2], [5, 5, 2], [9, 5, 3], 2.0, 2.0, PASO_METROS)
+    # Todas las muestras sin datos: no obstruyen y no hay celda de holgura
+    assert visible[0] and margen[0] == np.inf and (i[0], j[0]) == (-1, -1) and np.isnan(distancia[0])
+    # Extremo sin datos
+    assert not visible[1] and np.isnan(margen[1])
+    # Vecinos: sin muestras intermedias
+    assert visible[2] and margen[2] == np.inf
+
+
+def test_lotes_pequenos_igual_resultado(monkeypatch):
+    rng = np.random.default_rng(15)
+    terreno = rng.integers(0, 500, (60, 60)).astype(np.int16)
+    ia, ja, ib, jb = rng.integers(0, 60, (4, 300))
+    esperado = lineas_de_vista(terreno, ia, ja, ib, jb, 10.0, 5.0, PASO_METROS, 8.5e6)
+    monkeypatch.setattr(visibilidad, 'MAX_MUESTRAS_LOTE', 50)
+    obtenido = lineas_de_vista(terreno, ia, ja, ib, jb, 10.0, 5.0, PASO_METROS, 8.5e6)
+    for a, b in zip(esperado, obtenido):
+        assert np.array_equal(a, b, equal_nan=a.dtype.kind == 'f')
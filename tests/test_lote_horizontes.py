@@ -0,0 +1,35 @@
+"""Horizontes en lote: los procesos dan lo mismo que el cálculo en este proceso."""
+
+import numpy as np
+
+from simulador_horizonte_corregido import SimuladorHorizonte
+from lote_horizontes import calcular_horizontes_lote
+
+OBSERVADORES = [(-0.3, -78.4), (0.5, -78.7), (-0.8, -76.5), (5.0, -78.0), (-0.1, -77.3)]
+
+
+def test_lote_en_procesos_igual_al_serie(simulador):
+    simulador.cargar_terreno_ecuador()
+    serie = calcular_horizontes_lote(simulador, OBSERVADORES, max_distancia_km=30, procesos=1)
+    paralelo = calcular_horizontes_lote(simulador, OBSERVADORES, max_distancia_km=30, procesos=2,
+                                        chunksize=1)
+    # (5.0, -78.0) está fuera del mosaico; (-0.8, -76.5), en el archivo que falta
+    assert serie[3] is None and paralelo[3] is None
+    assert serie[2] is None and paralelo[2] is None
+    for a, b in zip(serie, paralelo):
+        if a is not None:
+            for x, y in zip(a, b):
+                assert np.array_equal(x, y)
+
+
+def test_lote_sin_cache_con_piramide(carpeta_hgt, tmp_path):
+    # Sin caché del mosaico los procesos abren el mosaico virtual por rutas;
+    # la pirámide se construye en memoria y se comparte por memoria compartida
+    simulador = SimuladorHorizonte(carpeta_hgt, usar_cache=False, carpeta_cache=str(tmp_path),
+                                   memoria_horizontes_bytes=0)
+    lote = calcular_horizontes_lote(simulador, OBSERVADORES[:2], max_distancia_km=30, num_rayos=90,
+                                    metodo='piramide', procesos=2, chunksize=1)
+    for (lat, lon), obtenido in zip(OBSERVADORES[:2], lote):
+        esperado = simulador.calcular_horizonte(lat, lon, 0, 360, 1.7, 30, 90, metodo='iterativo')
+        for x, y in zip(esperado, obtenido):
+            assert np.array_equal(x, y)
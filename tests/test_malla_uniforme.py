@@ -0,0 +1,39 @@
+"""Malla del terreno en rejilla uniforme frente a np.meshgrid + StructuredGrid."""
+
+import numpy as np
+import pytest
+
+pv = pytest.importorskip('pyvista')
+
+from malla_terreno import superficie_terreno, normalizar_elevacion
+
+
+def ordenar(puntos):
+    return puntos[np.lexsort((puntos[:, 2], puntos[:, 1], puntos[:, 0]))]
+
+
+def test_mismos_puntos_que_meshgrid():
+    rng = np.random.default_rng(23)
+    terreno = rng.integers(0, 6000, (40, 55)).astype(np.int16)
+    espaciado, i_obs, j_obs = 0.0925, 17, 31
+
+    # Construcción original: X/Y completos y Y invertida respecto a la fila
+    x = (np.arange(55) - j_obs) * espaciado
+    y = -(np.arange(40) - i_obs) * espaciado
+    X, Y = np.meshgrid(x, y)
+    original = pv.StructuredGrid(X, Y, terreno / 1000)
+
+    superficie = superficie_terreno(terreno, espaciado, (-j_obs * espaciado, -(39 - i_obs) * espaciado))
+    # Un solo búfer float32 de 3 valores por punto
+    assert superficie.points.dtype == np.float32 and superficie.points.nbytes == terreno.size * 12
+    assert superficie.n_points == original.n_points and superficie.n_cells == original.n_cells
+    assert np.allclose(ordenar(np.asarray(superficie.points)), ordenar(np.asarray(original.points)), atol=1e-5)
+
+    # Orden de los puntos: terreno[::-1] en orden C (de sur a norte)
+    puntos = np.asarray(superficie.points).reshape(40, 55, 3)
+    assert np.allclose(puntos[..., 2], terreno[::-1] / 1000)
+    assert np.allclose(puntos[0, 0, :2], (-j_obs * espaciado, -(39 - i_obs) * espaciado), atol=1e-6)
+    assert np.allclose(puntos[-1, -1, :2], ((54 - j_obs) * espaciado, i_obs * espaciado), atol=1e-5)
+    # Los colores se calculan sobre la ventana en el mismo orden
+    colores = normalizar_elevacion(terreno[::-1])
+    assert np.array_equal(colores, normalizar_elevacion(np.rint(puntos[..., 2] * 1000).astype(np.int16)))
@@ -0,0 +1,29 @@
+"""Mosaico virtual de archivos .hgt."""
+
+import numpy as np
+
+from mosaico_terreno import MosaicoTerreno
+
+
+def test_mosaico_virtual_igual_al_apilado(simulador, mosaico_base):
+    simulador.escanear_archivos()
+    mosaico = MosaicoTerreno(simulador._rutas_teselas(), simulador.resolucion)
+    assert mosaico.shape == mosaico_base.shape
+    assert np.array_equal(mosaico[:, :], mosaico_base)
+
+
+def test_indexado_por_arreglos(simulador, mosaico_base):
+    simulador.escanear_archivos()
+    mosaico = MosaicoTerreno(simulador._rutas_teselas(), simulador.resolucion)
+    rng = np.random.default_rng(0)
+    i = rng.integers(0, mosaico_base.shape[0], 5000)
+    j = rng.integers(0, mosaico_base.shape[1], 5000)
+    assert np.array_equal(mosaico[i, j], mosaico_base[i, j])
+    assert mosaico[1200, 1200] == mosaico_base[1200, 1200]
+
+
+def test_solo_abre_los_archivos_consultados(simulador, mosaico_base):
+    simulador.escanear_archivos()
+    mosaico = MosaicoTerreno(simulador._rutas_teselas(), simulador.resolucion)
+    assert np.array_equal(mosaico[10:20, 1300:1310], mosaico_base[10:20, 1300:1310])
+    assert list(mosaico._teselas) == [(0, 1)]
@@ -0,0 +1,40 @@
+"""El motor vectorizado debe coincidir con el bucle de referencia, también en los empates."""
+
+import types
+import numpy as np
+import pytest
+
+from motor_horizonte import elevaciones_rayos, elevaciones_rayos_piramide, construir_piramide
+from simulador_horizonte_corregido import SimuladorHorizonte
+from conftest import OBSERVADORES, comparar
+
+
+@pytest.mark.parametrize('usar_cache', [True, False])
+@pytest.mark.parametrize('lat, lon', OBSERVADORES)
+def test_vectorizado_igual_al_iterativo(carpeta_hgt, tmp_path, usar_cache, lat, lon):
+    # Con caché la ventana es una rebanada del memmap (lectura plana); sin él,
+    # una copia desde el mosaico virtual
+    simulador = SimuladorHorizonte(carpeta_hgt, usar_cache=usar_cache, carpeta_cache=str(tmp_path),
+                                   memoria_horizontes_bytes=0)
+    simulador.cargar_terreno_ecuador()
+    comparar(simulador, lat, lon, metodo='vectorizado')
+
+
+@pytest.mark.parametrize('paso_lejano, altura_lejana', [(41, 137), (141, 467)])
+def test_empate_de_angulos_como_el_bucle(paso_lejano, altura_lejana):
+    # Con 92.5 m por paso y el ojo a 1.7 m, la pendiente de la muestra lejana
+    # supera a la del paso 1 en el último bit, pero su ángulo redondeado es
+    # el mismo: el bucle se queda con la primera
+    fila = np.zeros(200, dtype=np.int16)
+    fila[1], fila[paso_lejano] = 5, altura_lejana
+    terreno = np.tile(fila, (3, 1))
+    angulos = np.array([90.0])
+    argumentos = (1, 0, 1.7, angulos, 190, 92.5)
+
+    bucle = types.SimpleNamespace(forma_mosaico=terreno.shape)
+    esperado = SimuladorHorizonte._rayos_iterativo(bucle, (terreno, 0, 0), *argumentos)
+    assert esperado[1] == [92.5]
+    vectorizado = elevaciones_rayos(terreno, (0, 0), terreno.shape, *argumentos)
+    piramide = elevaciones_rayos_piramide(construir_piramide(terreno), *argumentos)
+    for obtenido in (vectorizado, piramide):
+        assert obtenido[0].tolist() == esperado[0] and obtenido[1].tolist() == esperado[1]
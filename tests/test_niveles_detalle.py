@@ -0,0 +1,64 @@
+"""Anillos de detalle de la malla 3D: presupuesto, detalle cercano y costuras."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyvista')
+
+from malla_terreno import (planificar_niveles, contar_triangulos, malla_niveles_detalle,
+                           FRACCION_TRANSICION, MAX_TRIANGULOS_TERRENO)
+
+ESPACIADO = 0.0925
+
+
+def alturas_por_posicion(superficie):
+    """{(columna, fila hacia el norte): [alturas en m]} de los puntos de la malla."""
+    puntos = np.asarray(superficie.points, dtype=np.float64)
+    celdas = np.rint(puntos[:, :2] / ESPACIADO).astype(int)
+    alturas = {}
+    for (x, y), z in zip(celdas.tolist(), (puntos[:, 2] * 1000).tolist()):
+        alturas.setdefault((x, y), []).append(z)
+    return alturas
+
+
+def test_planificacion_dentro_del_presupuesto():
+    # Si la rejilla completa cabe hay un solo nivel
+    assert planificar_niveles(300, 10 ** 7) == [(1, 300)]
+    # 150 km de radio con el presupuesto por defecto
+    niveles = planificar_niveles(1667)
+    assert len(niveles) > 1 and contar_triangulos(niveles) <= MAX_TRIANGULOS_TERRENO
+    assert [p for p, _ in niveles] == [2 ** k for k in range(len(niveles))]
+    assert niveles[-1][1] >= 1667 and niveles[-1][1] % niveles[-1][0] == 0
+
+
+def test_malla_sin_grietas_y_detalle_cercano():
+    radio, presupuesto = 200, 60000
+    rng = np.random.default_rng(24)
+    terreno = (rng.normal(0, 30, (2 * radio + 1,) * 2).cumsum(0).cumsum(1) / 50 + 2000).astype(np.int16)
+    niveles = planificar_niveles(radio, presupuesto)
+    assert len(niveles) >= 3
+
+    superficie, alturas = malla_niveles_detalle(terreno, (radio, radio), radio, ESPACIADO, presupuesto)
+    assert superficie.n_cells <= presupuesto and len(alturas) == superficie.n_points
+    por_posicion = alturas_por_posicion(superficie)
+
+    # Cerca del observador la malla es la rejilla completa con sus alturas
+    s0 = niveles[0][1]
+    cerca = int(s0 * (1 - FRACCION_TRANSICION))
+    for dy in range(-cerca, cerca + 1):
+        for dx in range(-cerca, cerca + 1):
+            assert por_posicion[(dx, dy)] == pytest.approx([terreno[radio - dy, radio + dx]], abs=1e-3)
+
+    # Los vértices repetidos en la costura entre anillos tienen la misma altura
+    for valores in por_posicion.values():
+        assert max(valores) - min(valores) < 1e-3
+
+    # En el borde exterior de cada nivel los vértices intermedios caen sobre
+    # la arista del anillo grueso: su altura es la media de los vecinos
+    for paso, semilado in niveles[:-1]:
+        for t in range(-semilado + paso, semilado, 2 * paso):
+            for (x, y), (ax, ay) in [((t, semilado), (1, 0)), ((t, -semilado), (1, 0)),
+                                     ((semilado, t), (0, 1)), ((-semilado, t), (0, 1))]:
+                antes = por_posicion[(x - ax * paso, y - ay * paso)][0]
+                despues = por_posicion[(x + ax * paso, y + ay * paso)][0]
+                assert por_posicion[(x, y)][0] == pytest.approx((antes + despues) / 2, abs=1e-2)
@@ -0,0 +1,59 @@
+"""Horas de sol astronómicas y efectivas (obstruccion_solar)."""
+
+import csv
+import numpy as np
+import pytest
+
+from obstruccion_solar import (dias_periodo, efemerides, obstruccion_sitio, calcular_obstruccion_solar,
+                               COLUMNAS_CSV)
+
+AZIMUTS = np.arange(0, 360, 1.0)
+SIN_HORIZONTE = np.full(360, -90.0)
+
+
+def minutos(hora):
+    horas, mins = hora.split(':')
+    return int(horas) * 60 + int(mins)
+
+
+def test_equinoccio_en_quito():
+    dias = dias_periodo('2024-03-20', '2024-03-20')
+    sol = obstruccion_sitio(-0.22, -78.51, AZIMUTS, SIN_HORIZONTE, efemerides(dias))
+    amanecer, ocaso = minutos(sol['amanecer_astronomico'][0]), minutos(sol['ocaso_astronomico'][0])
+    # Mediodía solar: 12:00 + 4 min por grado al oeste de 75° O + 7.5 min
+    # de la ecuación del tiempo a fines de marzo
+    assert abs((amanecer + ocaso) / 2 - (720 + 4 * 3.51 + 7.5)) <= 2
+    # En el ecuador el día dura 12 h más unos 7 min de refracción y semidiámetro
+    assert sol['horas_sol_astronomicas'][0] == pytest.approx(12.1, abs=0.05)
+    assert sol['amanecer_efectivo'] == sol['amanecer_astronomico']
+    assert sol['horas_obstruidas'][0] == 0 and sol['horas_pico_obstruidas'][0] == 0
+
+
+def test_montana_al_este_retrasa_el_amanecer():
+    dias = dias_periodo('2024-03-20', '2024-03-22')
+    montana = np.where(np.abs(AZIMUTS - 90) <= 30, 10.0, -90.0)
+    libre = obstruccion_sitio(-0.22, -78.51, AZIMUTS, SIN_HORIZONTE, efemerides(dias))
+    tapado = obstruccion_sitio(-0.22, -78.51, AZIMUTS, montana, efemerides(dias))
+    # En el equinoccio el sol sube casi vertical a 15°/h: tarda ~43 min en
+    # pasar de -0.833° a 10°; el ocaso no cambia
+    retraso = minutos(tapado['amanecer_efectivo'][0]) - minutos(libre['amanecer_efectivo'][0])
+    assert 40 <= retraso <= 46
+    assert tapado['ocaso_efectivo'] == libre['ocaso_efectivo']
+    assert np.allclose(tapado['horas_obstruidas'], retraso / 60, atol=0.05)
+    assert np.allclose(tapado['horas_sol_efectivas'] + tapado['horas_obstruidas'],
+                       tapado['horas_sol_astronomicas'])
+    # Sol bajo: la irradiancia perdida es mucho menor que las horas tapadas
+    assert np.all(tapado['horas_pico_obstruidas'] < 0.1 * tapado['horas_obstruidas'])
+
+
+def test_csv_por_sitio_y_dia(simulador, tmp_path):
+    ruta = str(tmp_path / 'sol.csv')
+    escritos = calcular_obstruccion_solar(simulador, [(-0.3, -78.4), (5.0, -78.0)], '2024-06-20',
+                                          '2024-06-22', ruta, max_distancia_km=10, num_rayos=90,
+                                          nombres=['valle', 'fuera'], procesos=1)
+    assert escritos == 1
+    with open(ruta, newline='', encoding='utf-8') as f:
+        filas = list(csv.reader(f))
+    assert filas[0] == COLUMNAS_CSV
+    assert [fila[0] for fila in filas[1:]] == ['valle'] * 3
+    assert [fila[3] for fila in filas[1:]] == ['2024-06-20', '2024-06-21', '2024-06-22']
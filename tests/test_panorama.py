@@ -0,0 +1,52 @@
+"""Panorama de 360° por celdas (calcular_panorama)."""
+
+import math
+import numpy as np
+import pytest
+
+import motor_horizonte
+from motor_horizonte import panorama_horizonte
+
+PASO_METROS = 111000 / 1200
+
+
+def test_pico_aislado_en_su_sector():
+    terreno = np.zeros((201, 201), dtype=np.int16)
+    terreno[100 - 60, 100 + 60] = 900          # al noreste, a 60*sqrt(2) celdas
+    angulos, elevaciones, distancias = panorama_horizonte(terreno, (0, 0), 100, 100, 1.7,
+                                                          100, PASO_METROS, num_bins=360)
+    distancia = 60 * math.sqrt(2) * PASO_METROS
+    assert angulos[45] == 45.0
+    assert elevaciones[45] == pytest.approx(math.degrees(math.atan((900 - 1.7) / distancia)))
+    assert distancias[45] == pytest.approx(distancia)
+    # Los demás sectores solo ven el terreno plano, más alto en el borde del radio
+    assert -0.011 < elevaciones[225] < 0 and distancias[225] > 99 * PASO_METROS
+
+
+def test_franjas_igual_a_la_geometria_guardada(monkeypatch):
+    rng = np.random.default_rng(11)
+    terreno = rng.integers(0, 3000, (181, 171)).astype(np.int16)
+    terreno[20:40, 100:130] = -32768
+    # Observador cerca del borde: la ventana está recortada al mosaico
+    argumentos = (terreno, (1000, 2000), 1090, 2080, 1500.0, 90, PASO_METROS, 720)
+    guardada = panorama_horizonte(*argumentos)
+    monkeypatch.setattr(motor_horizonte, 'MAX_CELDAS_GEOMETRIA', 0)
+    por_franjas = panorama_horizonte(*argumentos, filas_por_bloque=7)
+    for esperado, obtenido in zip(guardada, por_franjas):
+        assert np.array_equal(esperado, obtenido)
+
+
+def test_calcular_panorama(simulador):
+    simulador.cargar_terreno_ecuador()
+    angulos, elevaciones, distancias = simulador.calcular_panorama(-0.3, -78.4, max_distancia_km=20,
+                                                                  num_bins=180)
+    assert len(angulos) == 180 and np.all(elevaciones > -90)
+    assert np.all((distancias > 0) & (distancias <= 20000))
+    # El rayo del centro de cada sector no supera al sector, salvo porque
+    # muestrea por pasos (celdas truncadas y distancia a lo largo del rayo):
+    # se comparan los horizontes lejanos, donde esa diferencia es pequeña
+    azimuts, rayos, distancias_rayos = simulador.calcular_horizonte(-0.3, -78.4, 0, 360, 1.7, 20, 181)
+    sector = np.rint(np.mod(azimuts, 360) / 2).astype(int) % 180
+    lejanos = distancias_rayos >= 60 * PASO_METROS
+    assert lejanos.sum() > 100
+    assert np.all(rayos[lejanos] <= elevaciones[sector[lejanos]] + 0.1)
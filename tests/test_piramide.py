@@ -0,0 +1,42 @@
+"""Pirámide de máximos y método 'piramide' de calcular_horizonte."""
+
+import numpy as np
+import pytest
+
+from motor_horizonte import reducir_maximo, NIVELES_PIRAMIDE
+from mosaico_terreno import NODATA
+from conftest import OBSERVADORES, comparar
+
+
+def test_niveles_son_maximos_por_bloque():
+    rng = np.random.default_rng(9)
+    terreno = rng.integers(-100, 4000, (37, 50)).astype(np.int16)
+    terreno[:4, :4] = NODATA
+    terreno[8:10, 8] = NODATA
+    # Franjas pequeñas: el resultado no depende del recorrido por franjas
+    nivel = reducir_maximo(terreno, filas_por_bloque=6)
+    assert nivel.shape == (19, 25)
+    for bi in range(19):
+        for bj in range(25):
+            assert nivel[bi, bj] == terreno[2 * bi:2 * bi + 2, 2 * bj:2 * bj + 2].max()
+    assert (nivel[:2, :2] == NODATA).all()
+
+
+def test_piramide_en_cache(simulador, mosaico_base):
+    niveles = simulador.cargar_piramide_maxima()
+    assert len(niveles) == NIVELES_PIRAMIDE + 1
+    bloque = 2 ** NIVELES_PIRAMIDE
+    assert niveles[-1][3, 5] == mosaico_base[3 * bloque:4 * bloque, 5 * bloque:6 * bloque].max()
+
+    # Otro simulador con la misma carpeta abre los niveles guardados
+    from simulador_horizonte_corregido import SimuladorHorizonte
+    otro = SimuladorHorizonte(simulador.carpeta_matrices, carpeta_cache=simulador.carpeta_cache)
+    reabiertos = otro.cargar_piramide_maxima()
+    assert all(isinstance(nivel, np.memmap) for nivel in reabiertos[1:])
+    assert all(np.array_equal(a, b) for a, b in zip(niveles[1:], reabiertos[1:]))
+
+
+@pytest.mark.parametrize('lat, lon', OBSERVADORES)
+def test_piramide_igual_al_iterativo(simulador, lat, lon):
+    simulador.cargar_terreno_ecuador()
+    comparar(simulador, lat, lon, metodo='piramide')
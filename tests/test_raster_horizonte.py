@@ -0,0 +1,57 @@
+"""Raster de horizonte por bloques: reanudación y archivos de salida dañados."""
+
+import os
+import numpy as np
+
+from mosaico_terreno import MosaicoTerreno, compartir_matriz, abrir_matriz_compartida
+from raster_horizonte import calcular_raster_horizonte, abrir_raster_horizonte
+
+PARAMETROS = dict(num_sectores=4, max_distancia_km=0.5, tam_bloque=1200, procesos=1)
+
+
+def calcular(simulador, carpeta):
+    calcular_raster_horizonte(simulador, carpeta, **PARAMETROS)
+    horizonte, svf, _ = abrir_raster_horizonte(carpeta)
+    return np.array(horizonte), np.array(svf)
+
+
+def test_reanuda_solo_los_bloques_pendientes(simulador, tmp_path):
+    carpeta = str(tmp_path / 'raster')
+    horizonte, svf = calcular(simulador, carpeta)
+    assert horizonte.shape == (4,) + simulador.matriz_terreno.shape
+    assert (svf[simulador.matriz_terreno[:, :] == -32768] == -32768).all()
+
+    # Bloque (0, 0) marcado como pendiente y (0, 1) como terminado, ambos alterados
+    progreso = np.load(os.path.join(carpeta, 'progreso.npy'), mmap_mode='r+')
+    progreso[0, 0] = 0
+    progreso.flush()
+    del progreso
+    svf_disco = np.load(os.path.join(carpeta, 'svf.npy'), mmap_mode='r+')
+    svf_disco[:1200, :2400] = 7
+    svf_disco.flush()
+    del svf_disco
+
+    _, svf_reanudado = calcular(simulador, carpeta)
+    assert np.array_equal(svf_reanudado[:1200, :1200], svf[:1200, :1200])
+    assert (svf_reanudado[:1200, 1200:2400] == 7).all()
+
+
+def test_salida_truncada_se_reinicia(simulador, tmp_path):
+    carpeta = str(tmp_path / 'raster')
+    horizonte, svf = calcular(simulador, carpeta)
+    ruta = os.path.join(carpeta, 'horizonte.npy')
+    with open(ruta, 'r+b') as f:
+        f.truncate(os.path.getsize(ruta) // 2)
+    os.remove(os.path.join(carpeta, 'svf.npy'))
+
+    horizonte_nuevo, svf_nuevo = calcular(simulador, carpeta)
+    assert np.array_equal(horizonte_nuevo, horizonte) and np.array_equal(svf_nuevo, svf)
+
+
+def test_compartir_mosaico_sin_copia(simulador, mosaico_base):
+    simulador.escanear_archivos()
+    mosaico = MosaicoTerreno(simulador._rutas_teselas(), simulador.resolucion)
+    memorias = []
+    descriptor = compartir_matriz(mosaico, memorias)
+    assert descriptor[0] == 'mosaico' and memorias == []
+    assert np.array_equal(abrir_matriz_compartida(descriptor, [])[:, :], mosaico_base)
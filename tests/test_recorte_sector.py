@@ -0,0 +1,64 @@
+"""Recorte de la malla 3D al sector de azimut que ve la cámara."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyvista')
+
+from malla_terreno import en_sector, malla_niveles_detalle
+
+ESPACIADO = 0.0925
+RADIO = 300
+PRESUPUESTO = 100000
+
+
+@pytest.fixture(scope='module')
+def terreno():
+    rng = np.random.default_rng(25)
+    return rng.integers(1000, 3000, (2 * RADIO + 1,) * 2).astype(np.int16)
+
+
+def malla(terreno, sector):
+    return malla_niveles_detalle(terreno, (RADIO, RADIO), RADIO, ESPACIADO, PRESUPUESTO, sector)[0]
+
+
+def test_sector_con_vuelta_por_el_norte():
+    # x al este, y al norte; azimut 0 = norte, 90 = este
+    x = np.array([0.1, -0.1, 1.0, -1.0, 0.0])
+    y = np.array([1.0, 1.0, 0.0, 0.0, -1.0])
+    assert en_sector(x, y, (-20, 20)).tolist() == [True, True, False, False, False]
+    assert en_sector(x, y, (340, 380)).tolist() == [True, True, False, False, False]
+    assert en_sector(x, y, (45, 135)).tolist() == [False, False, True, False, False]
+    assert en_sector(x, y, (10, 370)).all()
+
+
+def test_sectores_contiguos_cubren_el_circulo(terreno):
+    completa = malla(terreno, (0, 360))
+    assert completa.n_cells == malla(terreno, None).n_cells
+    # La vista inicial y las dos extensiones al girar, como en extender_terreno
+    piezas = [malla(terreno, s) for s in [(40, 130), (-50, 40), (130, 310)]]
+    assert sum(p.n_cells for p in piezas) == completa.n_cells
+
+    # Sin triángulos repetidos entre piezas: los centroides son los del círculo
+    def centroides(superficie):
+        return set(map(tuple, np.rint(np.asarray(superficie.cell_centers().points)[:, :2] * 3000)
+                       .astype(np.int64).tolist()))
+    juntas = set()
+    for pieza in piezas:
+        propios = centroides(pieza)
+        assert not propios & juntas
+        juntas |= propios
+    assert juntas == centroides(completa)
+
+
+def test_campo_de_vision_reduce_la_malla(terreno):
+    completa = malla(terreno, (0, 360))
+    # 60° de campo más 15° de margen a cada lado: un cuarto del círculo
+    sector = (45, 135)
+    pieza = malla(terreno, sector)
+    assert pieza.n_cells < 0.3 * completa.n_cells
+    centros = np.asarray(pieza.cell_centers().points)
+    lejos = np.hypot(centros[:, 0], centros[:, 1]) > 20 * ESPACIADO
+    # Los centroides de los triángulos quedan dentro del sector (con el
+    # margen de media celda de los anillos gruesos)
+    assert en_sector(centros[lejos, 0], centros[lejos, 1], (40, 140)).all()
@@ -0,0 +1,54 @@
+"""Bisección adaptativa de los perfiles de horizonte (refinar_horizonte)."""
+
+import numpy as np
+
+from motor_horizonte import refinar_horizonte
+
+
+def escalon(angulos):
+    """Horizonte con un salto en 37.3°: 1° y 2 km antes, 5° y 9 km después."""
+    angulos = np.asarray(angulos)
+    return np.where(angulos < 37.3, 1.0, 5.0), np.where(angulos < 37.3, 2000.0, 9000.0)
+
+
+def test_biseca_solo_el_intervalo_del_salto():
+    llamadas = []
+
+    def evaluar(angulos):
+        llamadas.append(len(angulos))
+        return escalon(angulos)
+
+    angulos, elevaciones, distancias = refinar_horizonte(evaluar, np.arange(0, 91, 10.0), 0.2, 0.25, 5)
+    # Un rayo nuevo por nivel, siempre en el intervalo que contiene el salto
+    assert llamadas == [10, 1, 1, 1, 1, 1]
+    assert np.all(np.diff(angulos) > 0)
+    salto = np.flatnonzero(np.diff(elevaciones))[0]
+    assert angulos[salto] < 37.3 <= angulos[salto + 1]
+    assert angulos[salto + 1] - angulos[salto] == 10 / 2 ** 5
+    assert np.array_equal((elevaciones, distancias), escalon(angulos))
+
+
+def test_salto_de_distancia_y_limite_de_rayos():
+    # Misma elevación pero otra cresta: también se biseca por la distancia
+    def evaluar(angulos):
+        return np.full(len(angulos), 2.0), np.where(np.asarray(angulos) < 12.5, 3000.0, 30000.0)
+
+    angulos, _, _ = refinar_horizonte(evaluar, np.linspace(0, 40, 5), 0.2, 0.25, 3)
+    assert len(angulos) == 5 + 3
+    assert len(angulos) <= (5 - 1) * 2 ** 3 + 1
+
+
+def test_refinar_en_calcular_horizonte(simulador):
+    simulador.cargar_terreno_ecuador()
+    # Con tolerancias enormes no se añade ningún rayo
+    base = simulador.calcular_horizonte(-0.3, -78.4, 90, 20, 1.7, 10, 41)
+    refinado = simulador.calcular_horizonte(-0.3, -78.4, 90, 20, 1.7, 10, 41, refinar=True,
+                                            tolerancia_elevacion=90, tolerancia_distancia=10)
+    for esperado, obtenido in zip(base, refinado):
+        assert np.array_equal(esperado, obtenido)
+
+    refinado = simulador.calcular_horizonte(-0.3, -78.4, 90, 20, 1.7, 10, 41, refinar=True)
+    assert len(refinado[0]) > 41 and np.all(np.diff(refinado[0]) > 0)
+    # Los rayos iniciales conservan su resultado
+    iniciales = np.isin(refinado[0], base[0])
+    assert np.array_equal(refinado[1][iniciales], base[1])
@@ -0,0 +1,84 @@
+"""Visibilidad (viewshed R2) frente a la línea de vista celda a celda."""
+
+import numpy as np
+
+import visibilidad
+from visibilidad import visibilidad_region
+from mosaico_terreno import NODATA
+
+PASO_METROS = 111000 / 1200
+
+
+def visible_fuerza_bruta(terreno, radio, altura_total, altura_objetivo=0.0):
+    """
+    Referencia R3: para cada celda del radio, la recta desde el ojo hasta la
+    celda se muestrea una vez por celda del eje mayor con interpolación lineal
+    en el eje menor; la celda es visible si ninguna muestra sube más.
+    """
+    lado = terreno.shape[0]
+    visible = np.zeros(terreno.shape, dtype=bool)
+    for i in range(lado):
+        for j in range(lado):
+            di, dj = i - radio, j - radio
+            if di * di + dj * dj > radio * radio or terreno[i, j] == NODATA:
+                continue
+            pasos = max(abs(di), abs(dj))
+            if pasos == 0:
+                visible[i, j] = True
+                continue
+            objetivo = (terreno[i, j] + altura_objetivo - altura_total) / np.hypot(di, dj)
+            bloqueada = False
+            for k in range(1, pasos):
+                pi, pj = radio + di * k / pasos, radio + dj * k / pasos
+                fi, fj = int(np.floor(pi)), int(np.floor(pj))
+                wi, wj = pi - fi, pj - fj
+                ci, cj = min(fi + 1, lado - 1), min(fj + 1, lado - 1)
+                altura = ((1 - wi) * (1 - wj) * terreno[fi, fj] + (1 - wi) * wj * terreno[fi, cj] +
+                          wi * (1 - wj) * terreno[ci, fj] + wi * wj * terreno[ci, cj])
+                if (altura - altura_total) / (np.hypot(di, dj) * k / pasos) > objetivo:
+                    bloqueada = True
+                    break
+            visible[i, j] = not bloqueada
+    return visible
+
+
+def terreno_prueba(radio):
+    y, x = np.mgrid[0:2 * radio + 1, 0:2 * radio + 1]
+    return (1500 + 300 * np.sin(x / 5.0) * np.cos(y / 7.0) + 10 * x).astype(np.int16)
+
+
+def test_plano_todo_visible_y_muro_que_tapa():
+    radio = 20
+    terreno = np.zeros((2 * radio + 1, 2 * radio + 1), dtype=np.int16)
+    visible = visibilidad_region(terreno, (0, 0), radio, radio, 1.7, radio, PASO_METROS)
+    di, dj = np.mgrid[-radio:radio + 1, -radio:radio + 1]
+    dentro = di ** 2 + dj ** 2 <= radio ** 2
+    assert np.array_equal(visible, dentro)
+
+    # Un muro al este tapa el terreno de detrás, pero no el que está al oeste
+    terreno[:, radio + 5] = 500
+    visible = visibilidad_region(terreno, (0, 0), radio, radio, 1.7, radio, PASO_METROS)
+    assert visible[radio, radio + 5] and not visible[radio, radio + 6:].any()
+    assert visible[radio, :radio].all()
+
+
+def test_coincide_con_la_fuerza_bruta():
+    radio = 30
+    terreno = terreno_prueba(radio)
+    altura_total = float(terreno[radio, radio]) + 1.7
+    esperado = visible_fuerza_bruta(terreno, radio, altura_total, 2.0)
+    obtenido = visibilidad_region(terreno, (0, 0), radio, radio, altura_total, radio, PASO_METROS, 2.0)
+    # R2 reutiliza los rayos hacia el perímetro: solo difiere en celdas
+    # sueltas junto al borde de las sombras
+    assert esperado.sum() > 0.15 * esperado.size and (~esperado).sum() > 0.1 * esperado.size
+    assert np.mean(obtenido == esperado) > 0.97
+
+
+def test_sectores_pequenos_igual_resultado(monkeypatch):
+    radio = 60
+    terreno = terreno_prueba(radio)
+    terreno[10:30, 70:90] = NODATA
+    argumentos = (terreno[5:, :100], (5, 0), radio, radio, 1700.0, radio, PASO_METROS)
+    esperado = visibilidad_region(*argumentos, hilos=1)
+    monkeypatch.setattr(visibilidad, 'MAX_MUESTRAS_SECTOR', 500)
+    assert np.array_equal(visibilidad_region(*argumentos, hilos=3), esperado)
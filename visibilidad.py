@@ -0,0 +1,231 @@
+"""
+VISIBILIDAD (VIEWSHED) - ECUADOR
+Celdas visibles desde un observador dentro de un radio.
+
+💡 CARACTERÍSTICAS:
+- Barrido tipo R2: un rayo hacia cada celda del perímetro del cuadrado de
+  radio R, con un paso por celda del eje mayor
+- Cada rayo interpola la elevación en el eje menor y acumula su horizonte con
+  np.maximum.accumulate; una celda es visible si su pendiente alcanza el
+  horizonte acumulado antes de ella
+- Los rayos se reparten en sectores de azimut que se calculan en hilos; el
+  tamaño de cada sector está acotado (MAX_MUESTRAS_SECTOR), así que la
+  memoria no crece con el radio, y sus arreglos de trabajo son float32
+- Línea de vista entre pares de puntos (lineas_de_vista): todos los perfiles
+  se leen en una sola indexación, con corrección opcional de curvatura
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from mosaico_terreno import NODATA
+
+# Muestras (rayos x radio) de cada sector del barrido: acota la memoria de
+# los arreglos de trabajo de cada hilo, sea cual sea el radio
+MAX_MUESTRAS_SECTOR = 2 ** 18
+
+
+def rayos_perimetro(radio):
+    """
+    Destinos (ti, tj) de los rayos R2: todas las celdas del perímetro del
+    cuadrado de lado 2*radio+1, ordenadas por azimut.
+    """
+    lado = np.arange(-radio, radio)
+    ti = np.concatenate([np.full(len(lado), -radio), lado + 1, np.full(len(lado), radio), -lado - 1])
+    tj = np.concatenate([lado + 1, np.full(len(lado), radio), -lado - 1, np.full(len(lado), -radio)])
+    orden = np.argsort(np.arctan2(tj, -ti), kind='stable')
+    return ti[orden], tj[orden]
+
+
+def _visibilidad_sector(completa, visible, radio, altura_total, altura_objetivo, paso_metros, ti, tj):
+    """Marca en `visible` las celdas que ven los rayos hacia los destinos (ti, tj)."""
+    lado = completa.shape[1]
+    fraccion = np.arange(1, radio + 1) / radio
+    pi = np.multiply.outer(ti, fraccion) + radio
+    pj = np.multiply.outer(tj, fraccion) + radio
+
+    # Elevación interpolada sobre el rayo (en el eje mayor la posición es
+    # entera, así que es una interpolación lineal en el eje menor). Alturas,
+    # pesos y pendientes en float32: sobra precisión para metros enteros
+    fi, fj = np.floor(pi).astype(np.intp), np.floor(pj).astype(np.intp)
+    wi, wj = (pi - fi).astype(np.float32), (pj - fj).astype(np.float32)
+    ci, cj = np.minimum(fi + 1, lado - 1), np.minimum(fj + 1, lado - 1)
+    plana = completa.reshape(-1)
+    altura_rayo = np.zeros(pi.shape, dtype=np.float32)
+    sin_datos = np.zeros(pi.shape, dtype=bool)
+    for i, j, peso_i, peso_j in ((fi, fj, 1 - wi, 1 - wj), (fi, cj, 1 - wi, wj),
+                                 (ci, fj, wi, 1 - wj), (ci, cj, wi, wj)):
+        peso = peso_i * peso_j
+        valores = np.take(plana, i * lado + j)
+        altura_rayo += peso * valores
+        # Un vecino sin datos con peso no nulo anula la muestra (no bloquea)
+        sin_datos |= (valores == NODATA) & (peso > 0)
+    del fi, fj, ci, cj, wi, wj
+
+    distancia_rayo = (fraccion * paso_metros).astype(np.float32) * np.hypot(ti, tj).astype(np.float32)[:, None]
+    pendiente_rayo = altura_rayo
+    pendiente_rayo -= np.float32(altura_total)
+    pendiente_rayo /= distancia_rayo
+    pendiente_rayo[sin_datos] = -np.inf
+    del distancia_rayo, sin_datos
+
+    # Horizonte acumulado antes de cada muestra
+    horizonte = np.empty(pendiente_rayo.shape, dtype=np.float32)
+    horizonte[:, 0] = -np.inf
+    np.maximum.accumulate(pendiente_rayo[:, :-1], axis=1, out=horizonte[:, 1:])
+    del pendiente_rayo
+
+    # Celda más cercana a cada muestra y su pendiente hasta el centro
+    celda_i, celda_j = np.rint(pi).astype(np.intp), np.rint(pj).astype(np.intp)
+    del pi, pj
+    radio_celda = np.hypot(celda_i - radio, celda_j - radio).astype(np.float32)
+    indice = celda_i * lado + celda_j
+    del celda_i, celda_j
+    altura_celda = np.take(plana, indice)
+    pendiente_celda = np.add(altura_celda, np.float32(altura_objetivo - altura_total), dtype=np.float32)
+    pendiente_celda /= radio_celda * np.float32(paso_metros)
+
+    ve = (pendiente_celda >= horizonte) & (altura_celda != NODATA) & (radio_celda <= radio)
+    visible.reshape(-1)[indice[ve]] = True
+
+
+def visibilidad_region(terreno, origen, i_obs, j_obs, altura_total, radio, paso_metros,
+                       altura_objetivo=0.0, hilos=None):
+    """
+    Raster booleano de celdas visibles desde el observador (viewshed).
+
+    Args:
+        terreno: Ventana int16 que contiene el cuadrado de radio `radio`
+            alrededor del observador (recortada al mosaico).
+        origen: (i0, j0) índices globales de la esquina de la ventana.
+        i_obs, j_obs: Índices globales del observador.
+        altura_total: Altura del ojo del observador (m).
+        radio: Radio en celdas.
+        paso_metros: Metros por celda.
+        altura_objetivo: Altura sobre el terreno del punto que se quiere ver (m).
+        hilos: Hilos para los sectores de azimut (por defecto, hasta 8).
+
+    Returns:
+        Matriz booleana con la forma de `terreno` (True = visible).
+    """
+    i0, j0 = origen
+    lado = 2 * radio + 1
+    completa = np.full((lado, lado), NODATA, dtype=np.int16)
+    fi, fj = i0 - (i_obs - radio), j0 - (j_obs - radio)
+    completa[fi:fi + terreno.shape[0], fj:fj + terreno.shape[1]] = terreno
+
+    visible = np.zeros((lado, lado), dtype=bool)
+    visible[radio, radio] = True
+    if radio > 0:
+        ti, tj = rayos_perimetro(radio)
+        hilos = hilos or min(8, os.cpu_count() or 1)
+        # Varios sectores por hilo para repartir mejor la carga, y con
+        # radios grandes los necesarios para no pasar de MAX_MUESTRAS_SECTOR
+        num_sectores = max(4 * hilos, -(-len(ti) * radio // MAX_MUESTRAS_SECTOR))
+        sectores = np.array_split(np.arange(len(ti)), min(num_sectores, len(ti)))
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            list(pool.map(lambda s: _visibilidad_sector(completa, visible, radio, altura_total,
+                                                        altura_objetivo, paso_metros, ti[s], tj[s]),
+                          sectores))
+
+    return visible[fi:fi + terreno.shape[0], fj:fj + terreno.shape[1]]
+
+
+# --- Línea de vista entre pares de puntos ---
+
+# Radio medio de la Tierra (m)
+RADIO_TIERRA = 6371000.0
+
+# Muestras (suma de todos los perfiles) procesadas a la vez
+MAX_MUESTRAS_LOTE = 2 ** 22
+
+
+def lineas_de_vista(terreno, ia, ja, ib, jb, altura_a, altura_b, paso_metros, radio_efectivo=None):
+    """
+    Línea de vista entre pares de celdas, con todos los perfiles en una lectura.
+
+    Cada perfil se muestrea una vez por celda del eje mayor (sin los
+    extremos). La holgura de una muestra es la altura de la recta entre los
+    ojos menos el terreno y, si se indica radio_efectivo, menos la caída por
+    curvatura d1 * d2 / (2 * radio_efectivo). Las celdas sin datos no
+    obstruyen.
+
+    Args:
+        terreno: Matriz (o memmap) con índices globales.
+        ia, ja, ib, jb: Arreglos de índices de los extremos A y B.
+        altura_a, altura_b: Altura de los ojos sobre el terreno (m); escalares o arreglos.
+        paso_metros: Metros por celda.
+        radio_efectivo: Radio terrestre efectivo (m) o None para no corregir curvatura.
+
+    Returns:
+        visible: True si ninguna muestra queda por encima de la recta.
+        margen: Holgura mínima (m); +inf si no hay muestras intermedias y
+            NaN si un extremo no tiene datos.
+        i_obs, j_obs: Celda de la holgura mínima (-1 si no hay).
+        distancia: Distancia (m) desde A a esa celda (NaN si no hay).
+    """
+    ia, ja, ib, jb = (np.asarray(x, dtype=np.intp).ravel() for x in (ia, ja, ib, jb))
+    pares = len(ia)
+    altura_a = np.broadcast_to(np.asarray(altura_a, dtype=np.float64), (pares,))
+    altura_b = np.broadcast_to(np.asarray(altura_b, dtype=np.float64), (pares,))
+
+    suelo_a = np.asarray(terreno[ia, ja]).astype(np.float64)
+    suelo_b = np.asarray(terreno[ib, jb]).astype(np.float64)
+    ojo_a = suelo_a + altura_a
+    ojo_b = suelo_b + altura_b
+    longitud = np.hypot(ib - ia, jb - ja) * paso_metros
+    intermedias = np.maximum(np.abs(ib - ia), np.abs(jb - ja)) - 1
+
+    margen = np.full(pares, np.inf)
+    i_min = np.full(pares, -1, dtype=np.intp)
+    j_min = np.full(pares, -1, dtype=np.intp)
+    distancia = np.full(pares, np.nan)
+
+    # Lotes de pares cuyo total de muestras cabe en MAX_MUESTRAS_LOTE
+    acumuladas = np.cumsum(np.maximum(intermedias, 0))
+    inicio = 0
+    while inicio < pares:
+        limite = (acumuladas[inicio - 1] if inicio else 0) + MAX_MUESTRAS_LOTE
+        fin = max(inicio + 1, int(np.searchsorted(acumuladas, limite, side='right')))
+        lote = np.arange(inicio, fin)
+        lote = lote[intermedias[lote] > 0]
+        inicio = fin
+        if len(lote) == 0:
+            continue
+
+        n = intermedias[lote]
+        par = np.repeat(np.arange(len(lote)), n)
+        comienzo = np.cumsum(n) - n
+        t = (np.arange(len(par)) - comienzo[par] + 1) / (n[par] + 1)
+
+        global_par = lote[par]
+        i = np.rint(ia[global_par] + t * (ib[global_par] - ia[global_par])).astype(np.intp)
+        j = np.rint(ja[global_par] + t * (jb[global_par] - ja[global_par])).astype(np.intp)
+        suelo = np.asarray(terreno[i, j])
+
+        holgura = ojo_a[global_par] + t * (ojo_b[global_par] - ojo_a[global_par]) - suelo
+        if radio_efectivo:
+            d1 = t * longitud[global_par]
+            holgura -= d1 * (longitud[global_par] - d1) / (2 * radio_efectivo)
+        valida = suelo != NODATA
+        holgura[~valida] = np.inf
+
+        # Mínimo por perfil y primera muestra válida que lo alcanza: si todas
+        # son -32768 el par se queda sin celda (-1) ni distancia (NaN)
+        minimo = np.minimum.reduceat(holgura, comienzo)
+        es_minimo = (holgura == minimo[par]) & valida
+        primera = np.full(len(lote), len(par))
+        np.minimum.at(primera, par[es_minimo], np.flatnonzero(es_minimo))
+        con_muestra = primera < len(par)
+
+        margen[lote] = minimo
+        elegidos = lote[con_muestra]
+        muestra = primera[con_muestra]
+        i_min[elegidos] = i[muestra]
+        j_min[elegidos] = j[muestra]
+        distancia[elegidos] = t[muestra] * longitud[elegidos]
+
+    sin_datos = (suelo_a == NODATA) | (suelo_b == NODATA)
+    margen[sin_datos] = np.nan
+    visible = margen >= 0
+    return visible, margen, i_min, j_min, distancia